@@ -0,0 +1,177 @@
+"""Benchmarks of the plugin's own hot paths.
+
+Run them like the tests, for the backend selected with ``KIVY_EVENTLOOP``::
+
+    python -m pytest benchmarks --bench-save=baseline.json
+
+and compare a later run against the saved baseline with::
+
+    python -m pytest benchmarks --bench-compare=baseline.json
+
+Each benchmark measures a block of code with the ``bench`` fixture, over
+multiple rounds. The results are keyed by the async backend and the
+benchmark name, and saved as JSON with the median, mean, min, max, and
+standard deviation of each. Saving to an existing file updates the results it
+already contains, so the results of both backends can be saved to the same
+baseline. When comparing, benchmarks whose median is slower
+than the baseline by more than ``--bench-tolerance`` are listed, and fail the
+run.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+import pytest
+
+_async_lib = os.environ.get('KIVY_EVENTLOOP', 'asyncio')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("kivy benchmarks")
+    group.addoption(
+        "--bench-save",
+        default=None,
+        metavar="PATH",
+        help='Saves the benchmark results as JSON to PATH.',
+    )
+    group.addoption(
+        "--bench-compare",
+        default=None,
+        metavar="PATH",
+        help='Compares the benchmark results to the JSON baseline at PATH, '
+             'failing the run if any regressed.',
+    )
+    group.addoption(
+        "--bench-tolerance",
+        type=float,
+        default=0.25,
+        help='The fraction by which the median of a benchmark may be slower '
+             'than the baseline, before it is considered a regression. '
+             'Defaults to 0.25.',
+    )
+
+
+class BenchmarkResults:
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, duration):
+        self.samples.setdefault(f'{_async_lib}::{name}', []).append(duration)
+
+    def get_stats(self):
+        stats = {}
+        for name, samples in self.samples.items():
+            stats[name] = {
+                'rounds': len(samples),
+                'median': statistics.median(samples),
+                'mean': statistics.mean(samples),
+                'min': min(samples),
+                'max': max(samples),
+                'stdev': statistics.stdev(samples) if len(samples) > 1
+                else 0.,
+            }
+        return stats
+
+    def compare(self, baseline, tolerance):
+        regressions = []
+        for name, stats in self.get_stats().items():
+            base = baseline.get(name, None)
+            if base is None or not base['median']:
+                continue
+            ratio = stats['median'] / base['median']
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    (name, base['median'], stats['median'], ratio))
+        return regressions
+
+
+_results = BenchmarkResults()
+
+
+class Bench:
+    """Measures blocks of code for the benchmark of a test.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    @contextmanager
+    def time(self, name=None):
+        """Times the block as one round of the benchmark. ``name``, if
+        given, is appended to the test name to distinguish multiple
+        benchmarks in a test.
+        """
+        key = self.name if name is None else f'{self.name}::{name}'
+        ts = time.perf_counter()
+        yield
+        _results.add(key, time.perf_counter() - ts)
+
+
+@pytest.fixture
+def bench(request):
+    return Bench(request.node.nodeid.split('::', 1)[-1])
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    stats = _results.get_stats()
+    if not stats:
+        return
+
+    terminalreporter.write_sep('=', 'benchmarks (median, min, rounds)')
+    for name, item in sorted(stats.items()):
+        terminalreporter.write_line(
+            f'{item["median"] * 1e3:10.3f}ms {item["min"] * 1e3:10.3f}ms '
+            f'{item["rounds"]:5d}  {name}')
+
+    filename = config.getoption("bench_compare")
+    if filename is None:
+        return
+
+    with open(filename) as fh:
+        baseline = json.load(fh)['benchmarks']
+    regressions = _results.compare(
+        baseline, config.getoption("bench_tolerance"))
+
+    terminalreporter.write_sep(
+        '=', f'benchmark regressions compared to {filename}')
+    for name, base, current, ratio in regressions:
+        terminalreporter.write_line(
+            f'{base * 1e3:.3f}ms -> {current * 1e3:.3f}ms ({ratio:.2f}x) '
+            f'{name}', red=True)
+    if not regressions:
+        terminalreporter.write_line('none', green=True)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    stats = _results.get_stats()
+    filename = config.getoption("bench_save")
+    if filename is not None and stats:
+        # keep the results of the other backend, if it was saved to the file
+        benchmarks = {}
+        if os.path.exists(filename):
+            with open(filename) as fh:
+                benchmarks = json.load(fh)['benchmarks']
+        benchmarks.update(stats)
+
+        with open(filename, 'w') as fh:
+            json.dump({
+                'machine': {
+                    'python': sys.version,
+                    'platform': platform.platform(),
+                    'processor': platform.processor(),
+                },
+                'benchmarks': benchmarks,
+            }, fh, indent=2, sort_keys=True)
+
+    filename = config.getoption("bench_compare")
+    if filename is not None and stats:
+        with open(filename) as fh:
+            baseline = json.load(fh)['benchmarks']
+        if _results.compare(baseline, config.getoption("bench_tolerance")):
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
@@ -0,0 +1,60 @@
+import pytest
+
+from pytest_kivy.app import AsyncUnitApp
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+rounds = 5
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.label import Label
+
+    class TestApp(App):
+        def build(self):
+            return Label(text='Hello')
+
+    return TestApp()
+
+
+@pytest.mark.parametrize('reuse_window', [None, 'session'])
+async def test_enter_exit(bench, _nursery, _event_loop, reuse_window):
+    # the setup and teardown of the kivy app fixtures, without an app
+    for _ in range(rounds):
+        with bench.time():
+            async with AsyncUnitApp(
+                    nursery=_nursery, event_loop=_event_loop,
+                    reuse_window=reuse_window):
+                pass
+
+
+@pytest.mark.parametrize('reuse_window', [None, 'session'])
+async def test_app_start_stop(bench, _nursery, _event_loop, reuse_window):
+    for _ in range(rounds):
+        with bench.time('enter'):
+            app = AsyncUnitApp(
+                nursery=_nursery, event_loop=_event_loop,
+                reuse_window=reuse_window)
+            await app.__aenter__()
+
+        try:
+            with bench.time('start'):
+                await app(create_app)
+            app.raise_startup_exception()
+
+            with bench.time('stop'):
+                await app.wait_stop_app()
+        finally:
+            with bench.time('exit'):
+                await app.__aexit__(None, None, None)
+
+
+@pytest.mark.parametrize('n', [1, 10])
+async def test_wait_clock_frames(bench, async_kivy_app, n):
+    await async_kivy_app(create_app)
+
+    for _ in range(20):
+        with bench.time():
+            await async_kivy_app.wait_clock_frames(n)
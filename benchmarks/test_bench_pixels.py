@@ -0,0 +1,44 @@
+import pytest
+from functools import partial
+
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+rounds = 10
+
+n_positions = 1000
+
+
+def create_app(size):
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+    from kivy.graphics import Color, Rectangle
+
+    class TestApp(App):
+        def build(self):
+            widget = Widget(size_hint=(None, None), size=(size, size))
+            with widget.canvas:
+                Color(1, 0, 0, 1)
+                Rectangle(size=(size / 2, size))
+            return widget
+
+    return TestApp()
+
+
+@pytest.mark.parametrize('size', [64, 256, 1024])
+@pytest.mark.parametrize('as_array', [False, True])
+async def test_get_widget_pos_pixel(bench, async_kivy_app, size, as_array):
+    if as_array:
+        pytest.importorskip('numpy')
+    await async_kivy_app(partial(create_app, size))
+    widget = async_kivy_app.app.root
+
+    positions = [
+        ((i * 7) % size, (i * 13) % size) for i in range(n_positions)]
+    for _ in range(rounds):
+        with bench.time():
+            pixels = async_kivy_app.get_widget_pos_pixel(
+                widget, positions, as_array=as_array)
+    assert len(pixels) == n_positions
+    assert tuple(pixels[0]) == (255, 0, 0, 255)
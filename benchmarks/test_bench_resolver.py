@@ -0,0 +1,109 @@
+import pytest
+
+from pytest_kivy.resolver import WidgetResolver, WidgetIndex
+
+rounds = 5
+
+branching = 10
+
+
+@pytest.fixture(scope='module')
+def trees():
+    # the trees are shared by the benchmarks because they are slow to create
+    cache = {}
+    yield cache
+    cache.clear()
+
+
+def get_node_cls():
+    from kivy.event import EventDispatcher
+    from kivy.properties import ListProperty, ObjectProperty, StringProperty
+
+    class Node(EventDispatcher):
+        """A light-weight stand-in for a widget, with only what the resolver
+        uses. Widgets register a global dpi callback that is only released
+        when the interpreter exits, which makes exiting after creating 10 ** 5
+        of them take minutes.
+        """
+
+        children = ListProperty()
+
+        parent = ObjectProperty(None, allownone=True)
+
+        name = StringProperty('')
+
+        def add_widget(self, widget):
+            widget.parent = self
+            self.children.insert(0, widget)
+
+    return Node
+
+
+def get_tree(trees, size):
+    """Returns the root of a tree of ``size`` widgets, in which each widget
+    has ``branching`` children, and its deepest and last widget.
+    """
+    if size in trees:
+        return trees[size]
+
+    node_cls = get_node_cls()
+    root = node_cls(name='root')
+    parents = [root]
+    count = 1
+    while count < size:
+        children = []
+        for parent in parents:
+            for _ in range(branching):
+                if count == size:
+                    break
+                widget = node_cls(name=f'widget{count}')
+                parent.add_widget(widget)
+                children.append(widget)
+                count += 1
+        parents = children
+
+    # the last widget is the last one found going down
+    last = children[-1]
+    last.name = 'target'
+    trees[size] = root, last
+    return root, last
+
+
+@pytest.mark.parametrize('size', [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5])
+@pytest.mark.parametrize('use_index', [False, True])
+def test_down(bench, trees, size, use_index):
+    root, last = get_tree(trees, size)
+    index = WidgetIndex(root, keys=('name', )) if use_index else None
+
+    try:
+        for _ in range(rounds):
+            with bench.time():
+                widget = WidgetResolver(
+                    base_widget=root, index=index).down(name='target')()
+            assert widget is last
+    finally:
+        if index is not None:
+            index.close()
+
+
+@pytest.mark.parametrize('size', [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5])
+@pytest.mark.parametrize('use_index', [False, True])
+def test_family_up(bench, trees, size, use_index):
+    root, last = get_tree(trees, size)
+    index = WidgetIndex(root, keys=('name', )) if use_index else None
+    # the first sibling of the deepest widget's ancestor below the root
+    base = last
+    while base.parent is not root:
+        base = base.parent
+    base = base.parent.children[-1]
+
+    try:
+        for _ in range(rounds):
+            with bench.time():
+                widget = WidgetResolver(
+                    base_widget=base, index=index).family_up(
+                    name='target')()
+            assert widget is last
+    finally:
+        if index is not None:
+            index.close()
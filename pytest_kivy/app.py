@@ -10,11 +10,66 @@ import sys
 import time
 import math
 import os
+from itertools import chain
+from functools import wraps
+from contextlib import contextmanager
 
-from pytest_kivy.resolver import WidgetResolver
+from pytest_kivy.resolver import WidgetResolver, WidgetIndex
 
 __all__ = ('AsyncUnitApp', )
 
+_known_modifiers = frozenset({'shift', 'alt', 'ctrl', 'meta'})
+
+_special_keys = {
+    27: 'escape',
+    9: 'tab',
+    8: 'backspace',
+    13: 'enter',
+    127: 'del',
+    271: 'enter',
+    273: 'up',
+    274: 'down',
+    275: 'right',
+    276: 'left',
+    278: 'home',
+    279: 'end',
+    280: 'pgup',
+    281: 'pgdown',
+    300: 'numlock',
+    301: 'capslock',
+    145: 'screenlock',
+}
+
+# the key names to use when typing these characters
+_char_keys = {' ': 'spacebar', '\n': 'enter', '\t': 'tab'}
+
+# the symbols typed with shift, on a US keyboard
+_shifted_chars = frozenset('~!@#$%^&*()_+{}|:"<>?')
+
+_key_code_text_cache = {}
+"""Maps key names to their key code and text, as computed by
+:meth:`AsyncUnitApp._get_key_code_text`.
+"""
+
+
+def _timed_phase(name):
+    """Decorator that adds the time spent in the decorated async method to
+    the ``name`` phase of :attr:`AsyncUnitApp.phase_times`.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if not self.record_phase_times:
+                return await func(self, *args, **kwargs)
+
+            entry = self._enter_phase(name)
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                self._exit_phase(entry)
+        return wrapper
+    return decorator
+
 
 class AsyncUnitApp:
     """Wrapper app that provides methods to test parts of a Kivy App
@@ -43,15 +98,180 @@ class AsyncUnitApp:
 
     async_lib = os.environ.get('KIVY_EVENTLOOP', 'asyncio')
 
+    virtual_time = False
+    """Whether the Kivy Clock is driven by a
+    :class:`~pytest_kivy.clock.VirtualClock`, rather than real time.
+
+    When enabled, every clock frame advances the time by
+    :attr:`virtual_time_step` and :meth:`async_sleep` (and consequently all the
+    ``do_xxx`` methods) returns as soon as the virtual time advanced by the
+    requested delay, without actually sleeping.
+    """
+
+    virtual_time_step = 1 / 60.
+    """The amount of time each clock frame advances the time, when
+    :attr:`virtual_time` is enabled.
+    """
+
+    _virtual_clock = None
+
+    _frame_notifier = None
+
+    reuse_window = None
+    """If not None, a key identifying a group of tests that share the same
+    Kivy window.
+
+    Normally, the window is re-created for each test in :meth:`__aenter__`.
+    When a test is entered with the same :attr:`reuse_window` key as the
+    previous test, the window creation is skipped and only its state is reset
+    (its canvas, size, and the Clock). After each such test,
+    :meth:`verify_window_state` checks that the test did not leak any state
+    into the window that would affect the next test.
+    """
+
+    _reused_window_key = None
+
+    _reused_window_state = None
+
+    start_timeout = 120.
+    """The maximum number of seconds :meth:`__call__` waits for the app to
+    start before raising a :class:`TimeoutError`. If None, it waits forever.
+    """
+
+    start_settle_frames = 5
+    """What :meth:`__call__` waits for after the app started, before
+    returning.
+
+    If it's an int, it's the number of clock frames to wait (it can be zero).
+    If it's ``"layout"``, it waits until the widget tree is laid out (see
+    :meth:`wait_layout`).
+    """
+
+    _started_event = None
+
+    stop_timeout = 60.
+    """The maximum number of seconds :meth:`wait_stop_app` waits for the app
+    to stop before raising a :class:`TimeoutError`. If None, it waits forever.
+    """
+
+    fast_teardown = False
+    """If True, :meth:`wait_stop_app` doesn't wait for the app to stop in an
+    orderly manner. Instead, it stops the Kivy event loop and cancels the
+    task running the app, so the app's ``on_stop`` is not dispatched.
+
+    This is useful when the context is about to be dropped anyway, and the
+    test does not depend on the app stopping cleanly.
+    """
+
+    _stopped_event = None
+
+    snapshot_dir = None
+    """The directory where the baseline images used by
+    :meth:`assert_snapshot` are stored. The pytest plugin defaults it to a
+    ``snapshots`` directory next to the test file.
+    """
+
+    snapshot_update = False
+    """If True, :meth:`assert_snapshot` (re)writes the baseline images rather
+    than comparing against them.
+    """
+
+    snapshot_diff_dir = None
+    """The directory where :meth:`assert_snapshot` writes the actual and diff
+    images of mismatching snapshots. If None, it's a ``failures`` directory
+    in :attr:`snapshot_dir`.
+    """
+
+    _cancel_scope = None
+
+    _app_cancelled = False
+
+    _widget_indices = None
+
+    phase_times = None
+    """Maps the name of each phase of the test to the total number of seconds
+    (of real time) spent in it, excluding the time spent in phases nested
+    within it. It's only filled in if :attr:`record_phase_times` is True.
+
+    The phases are ``"enter"`` (:meth:`__aenter__`, creating the context and
+    window), ``"start"`` (:meth:`__call__`, starting the app), ``"sleep"``
+    (:meth:`async_sleep`, e.g. in the gesture helpers), ``"frames"``
+    (:meth:`wait_clock_frames`), ``"stop"`` (:meth:`wait_stop_app`), and
+    ``"exit"`` (:meth:`__aexit__`).
+    """
+
+    record_phase_times = False
+    """Whether the time spent in each phase of the test is recorded in
+    :attr:`phase_times`. The pytest plugin enables it when ``--kivy-timings``
+    or ``--kivy-timings-summary`` is given.
+    """
+
+    _phase_stack = None
+
+    _startup_frame_recorders = None
+
+    _app_callbacks = None
+
     def __init__(
             self, nursery=None, event_loop=None, width=320, height=240,
-            async_lib=os.environ.get('KIVY_EVENTLOOP', 'asyncio')):
+            async_lib=os.environ.get('KIVY_EVENTLOOP', 'asyncio'),
+            virtual_time=False, virtual_time_step=1 / 60., reuse_window=None,
+            start_timeout=120., start_settle_frames=5, stop_timeout=60.,
+            fast_teardown=False, snapshot_dir=None, snapshot_update=False,
+            snapshot_diff_dir=None, record_phase_times=False):
         super().__init__()
         self._nursery = nursery
         self._event_loop = event_loop
         self.width = width
         self.height = height
         self.async_lib = async_lib
+        self.virtual_time = virtual_time
+        self.virtual_time_step = virtual_time_step
+        self.reuse_window = reuse_window
+        self.start_timeout = start_timeout
+        self.start_settle_frames = start_settle_frames
+        self.stop_timeout = stop_timeout
+        self.fast_teardown = fast_teardown
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_update = snapshot_update
+        self.snapshot_diff_dir = snapshot_diff_dir
+        self.record_phase_times = record_phase_times
+        self._widget_indices = {}
+        self._fbo_pool = {}
+        self.phase_times = {}
+        self._phase_stack = []
+        self._startup_frame_recorders = []
+        self._app_callbacks = []
+
+    def _enter_phase(self, name):
+        ts = time.perf_counter()
+        stack = self._phase_stack
+        if stack and stack[-1][1] is not None:
+            # pause the parent phase
+            parent, parent_ts = stack[-1]
+            self.phase_times[parent] = \
+                self.phase_times.get(parent, 0) + ts - parent_ts
+            stack[-1][1] = None
+        entry = [name, ts]
+        stack.append(entry)
+        return entry
+
+    def _exit_phase(self, entry):
+        ts = time.perf_counter()
+        stack = self._phase_stack
+        name, start_ts = entry
+        if start_ts is not None:
+            self.phase_times[name] = \
+                self.phase_times.get(name, 0) + ts - start_ts
+
+        if stack[-1] is entry:
+            stack.pop()
+            if stack:
+                # resume the parent phase
+                stack[-1][1] = ts
+        else:
+            # phases of concurrent tasks may exit out of order
+            stack.remove(entry)
 
     def set_kivy_config(self):
         from kivy.config import Config
@@ -60,12 +280,15 @@ class AsyncUnitApp:
         for items in Config.items('input'):
             Config.remove_option('input', items[0])
 
+    @_timed_phase('enter')
     async def __aenter__(self):
         self.set_kivy_config()
 
         from kivy.core.window import Window
         from kivy.context import Context
         from kivy.clock import ClockBase
+        from pytest_kivy.clock import VirtualClock, FrameNotifier, \
+            create_async_event
         from kivy.factory import FactoryBase, Factory
         from kivy.lang.builder import BuilderBase, Builder
 
@@ -90,7 +313,10 @@ class AsyncUnitApp:
             raise TypeError(f'unknown event loop {kivy_eventloop}')
 
         self._context = context = Context(init=False)
-        context['Clock'] = ClockBase(async_lib=async_lib)
+        context['Clock'] = clock = ClockBase(async_lib=async_lib)
+        self._frame_notifier = FrameNotifier(clock, async_lib)
+        self._started_event = create_async_event(async_lib)
+        self._stopped_event = create_async_event(async_lib)
         # have to make sure all global kv files are loaded before this because
         # globally read kv files (e.g. on module import) will not be loaded
         # again in the new builder, except if manually loaded, which we don't
@@ -98,27 +324,48 @@ class AsyncUnitApp:
         # context['Builder'] = BuilderBase.create_from(Builder)
         context.push()
 
-        Window.create_window()
-        Window.register()
-        Window.initialized = True
+        reuse_key = self.reuse_window
+        reused = reuse_key is not None and \
+            AsyncUnitApp._reused_window_key == reuse_key
+        if not reused:
+            Window.create_window()
+            Window.register()
+            Window.initialized = True
         Window.canvas.clear()
         Window.size = self.width, self.height
 
         from kivy.clock import Clock
         Clock._max_fps = 0
         Clock.init_async_lib(async_lib)
+
+        AsyncUnitApp._reused_window_key = reuse_key
+        if reuse_key is not None and not reused:
+            AsyncUnitApp._reused_window_state = self.get_window_state()
+
+        # last, because it patches Kivy globals that only __aexit__ restores
+        if self.virtual_time:
+            self._virtual_clock = VirtualClock(step=self.virtual_time_step)
+            self._virtual_clock.install(clock)
         return self
 
+    @_timed_phase('start')
     async def __call__(self, app_cls):
+        from pytest_kivy.clock import wait_async_event
         self.app = app = app_cls()
+        started_event = self._started_event
+        stopped_event = self._stopped_event
 
         def started_app(*largs):
             self.app_has_started = True
+            started_event.set()
         app.fbind('on_start', started_app)
 
         def stopped_app(*largs):
             self.app_has_stopped = True
+            stopped_event.set()
         app.fbind('on_stop', stopped_app)
+        self._app_callbacks = [
+            ('on_start', started_app), ('on_stop', stopped_app)]
 
         if self.async_lib == 'asyncio':
             # task must be canceled if exception is raised before started
@@ -128,39 +375,147 @@ class AsyncUnitApp:
             self._nursery.start_soon(self._run_app)
 
         try:
-            # if _run_app raises, trio seems to get stuck, so don't wait forever
-            ts = time.perf_counter()
-            while not self.app_has_started and self._start_exception is None:
-                await self.async_sleep(.1)
-                if time.perf_counter() - ts >= 120:
-                    raise TimeoutError()
-
-            from kivy.clock import Clock
-            frames_end = Clock.frames + 5
-            while Clock.frames < frames_end and self._start_exception is None:
-                await self.async_sleep(1 / 60.)
+            # if _run_app raises, trio seems to get stuck, so don't wait
+            # forever. _run_app sets the event if it raises
+            await wait_async_event(
+                started_event, self.async_lib, self.start_timeout)
+
+            if self._start_exception is None:
+                settle = self.start_settle_frames
+                if settle == 'layout':
+                    await self.wait_layout()
+                else:
+                    await self.wait_clock_frames(settle)
+
+            for recorder in self._startup_frame_recorders:
+                recorder.clear()
+            self._startup_frame_recorders = []
 
             return app
         finally:
             self.raise_startup_exception()
 
+    def record_frames(self, target_fps=60., include_startup=True):
+        """Returns a :class:`~pytest_kivy.clock.FrameRecorder` that records
+        the duration of the frames of the app's clock, while it's used as a
+        context manager (or between its ``start`` and ``stop``). E.g.::
+
+            with app.record_frames() as recorder:
+                async for _ in app.do_touch_drag(...):
+                    pass
+            print(recorder.get_stats())
+
+        If not ``include_startup`` and the app has not started yet, the frames
+        recorded until the app started (see :meth:`__call__`) are discarded.
+        """
+        from pytest_kivy.clock import FrameRecorder
+        recorder = FrameRecorder(self._context['Clock'], target_fps)
+        if not include_startup and self.app is None:
+            self._startup_frame_recorders.append(recorder)
+        return recorder
+
+    def assert_frame_budget(
+            self, recorder, p95_ms=None, max_ms=None, mean_ms=None,
+            max_dropped=None):
+        """Asserts that the frames recorded by the
+        :class:`~pytest_kivy.clock.FrameRecorder` are within the given
+        budgets (see :func:`~pytest_kivy.clock.check_frame_budget`).
+        """
+        from pytest_kivy.clock import check_frame_budget
+        error = check_frame_budget(
+            recorder.get_stats(), p95_ms=p95_ms, max_ms=max_ms,
+            mean_ms=mean_ms, max_dropped=max_dropped)
+        assert error is None, error
+
+    @contextmanager
+    def frame_budget(
+            self, p95_ms=None, max_ms=None, mean_ms=None, max_dropped=None,
+            target_fps=60.):
+        """Context manager that records the frames executed within it and
+        asserts on exit that they are within the budgets. It yields the
+        :class:`~pytest_kivy.clock.FrameRecorder`. E.g.::
+
+            with app.frame_budget(p95_ms=20, max_ms=50):
+                async for _ in app.do_touch_drag(...):
+                    pass
+
+        See :func:`~pytest_kivy.clock.check_frame_budget` for the budgets,
+        in milliseconds.
+        """
+        with self.record_frames(target_fps) as recorder:
+            yield recorder
+        self.assert_frame_budget(
+            recorder, p95_ms=p95_ms, max_ms=max_ms, mean_ms=mean_ms,
+            max_dropped=max_dropped)
+
+    async def wait_layout(self, max_frames=120):
+        """Waits until the widget tree of the window is laid out, i.e. until
+        the position and size of all the widgets in the tree did not change
+        between two clock frames.
+
+        If it is still changing after ``max_frames`` frames, it returns
+        anyway.
+        """
+        from kivy.core.window import Window
+
+        def get_geometry():
+            geometry = [tuple(Window.size)]
+            widgets = list(Window.children)
+            while widgets:
+                widget = widgets.pop()
+                geometry.append(
+                    (id(widget), widget.x, widget.y,
+                     widget.width, widget.height))
+                widgets.extend(widget.children)
+            return geometry
+
+        last = get_geometry()
+        for _ in range(max_frames):
+            await self.wait_clock_frames(1)
+            if self._start_exception is not None:
+                return
+
+            current = get_geometry()
+            if current == last:
+                return
+            last = current
+
+    @_timed_phase('stop')
     async def wait_stop_app(self):
         if self.app is None:
             return
 
         from kivy.base import stopTouchApp, EventLoop
+        from pytest_kivy.clock import wait_async_event
         stopTouchApp()
+        if self.fast_teardown:
+            self._cancel_app()
+            return
+
         await self.async_sleep(0)
         if EventLoop.status == 'idle':
             # it never started so don't wait to start
             return
 
-        ts = time.perf_counter()
-        while not self.app_has_stopped:
-            await self.async_sleep(.1)
-            if time.perf_counter() - ts >= 60:
-                raise TimeoutError()
+        await wait_async_event(
+            self._stopped_event, self.async_lib, self.stop_timeout)
+
+    def _cancel_app(self):
+        from kivy.app import App
+        self._app_cancelled = True
 
+        if self._async_start_task is not None:
+            self._async_start_task.cancel()
+            self._async_start_task = None
+        if self._cancel_scope is not None:
+            self._cancel_scope.cancel()
+            self._cancel_scope = None
+
+        # normally cleared by the app when it stops
+        if App._running_app is self.app:
+            App._running_app = None
+
+    @_timed_phase('exit')
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         from kivy.core.window import Window
         from kivy.animation import Animation
@@ -168,6 +523,17 @@ class AsyncUnitApp:
         from kivy.logger import LoggerHistory
 
         stopTouchApp()
+        # the Kivy app may outlive the test (e.g. as the running app), so it
+        # must not keep us alive through its callbacks
+        for name, callback in self._app_callbacks:
+            self.app.funbind(name, callback)
+        self._app_callbacks = []
+
+        for index in self._widget_indices.values():
+            index.close()
+        self._widget_indices = {}
+        self._fbo_pool = {}
+
         for anim in list(Animation._instances):
             anim._unregister()
         for child in Window.children[:]:
@@ -175,14 +541,91 @@ class AsyncUnitApp:
 
         self._context.pop()
         self._context = None
+        if self._virtual_clock is not None:
+            self._virtual_clock.uninstall()
+        self._virtual_clock = None
+        self._frame_notifier = None
         LoggerHistory.clear_history()
 
+        if self.reuse_window is not None:
+            if exc_type is not None:
+                # don't verify, but make sure the next test gets a new window
+                AsyncUnitApp._reused_window_key = None
+            else:
+                self.verify_window_state()
+
+    def get_window_state(self) -> dict:
+        """Returns a dict describing the state of the Kivy window that must
+        be identical between tests sharing a window (see
+        :attr:`reuse_window`).
+
+        It includes the number of the window's children and canvas
+        instructions, the number of observers bound to each of the window's
+        properties and events, and the number of the event loop's event
+        listeners.
+        """
+        from kivy.core.window import Window
+        from kivy.base import EventLoop
+
+        canvas = Window.canvas
+        state = {
+            'children': len(Window.children),
+            'canvas': len(canvas.children),
+            'canvas.before':
+                len(canvas.before.children) if canvas.has_before else 0,
+            'canvas.after':
+                len(canvas.after.children) if canvas.has_after else 0,
+            'event_listeners': len(EventLoop.event_listeners),
+        }
+        for name in list(Window.properties()) + list(Window.events()):
+            # weakly bound observers don't keep anything alive, and are
+            # removed once dead, so only count strongly bound observers
+            state[f'observers.{name}'] = sum(
+                1 for _, _, _, is_ref, _ in
+                Window.get_property_observers(name, args=True) if not is_ref)
+        return state
+
+    def verify_window_state(self):
+        """Verifies that the window state, as returned by
+        :meth:`get_window_state`, did not grow since the window was created
+        for the current :attr:`reuse_window` key.
+
+        If not, the next test will create a new window and an
+        :class:`AssertionError` is raised listing the state that leaked.
+        """
+        original = AsyncUnitApp._reused_window_state or {}
+        current = self.get_window_state()
+        leaked = {
+            key: (original.get(key, 0), value)
+            for key, value in current.items() if value > original.get(key, 0)
+        }
+
+        if leaked:
+            AsyncUnitApp._reused_window_key = None
+        assert not leaked, \
+            'Kivy window state leaked into the next test ' \
+            '(name: (expected, actual)): {}'.format(leaked)
+
     async def _run_app(self):
         try:
-            await self.app.async_run()
+            if self.async_lib == 'trio':
+                import trio
+                with trio.CancelScope() as self._cancel_scope:
+                    await self.app.async_run()
+            else:
+                await self.app.async_run()
         except BaseException:
-            self._start_exception = sys.exc_info()
+            if not self._app_cancelled:
+                self._start_exception = sys.exc_info()
+            # wake up __call__, in case it is waiting for the app to start
+            self._started_event.set()
             raise
+        finally:
+            # the app is not running anymore, even if on_stop didn't fire
+            self._stopped_event.set()
+            # no more frames will be executed, don't wait for them forever
+            if self._frame_notifier is not None:
+                self._frame_notifier.release_all()
 
     def raise_startup_exception(self):
         """(internal) Trio seems to get stuck if app startup fails. So we
@@ -196,56 +639,372 @@ class AsyncUnitApp:
                 self._async_start_task = None
             raise value.with_traceback(tb)
 
+    @_timed_phase('sleep')
     async def async_sleep(self, delay):
+        if self._virtual_clock is not None:
+            await self._virtual_clock.sleep(delay)
+            return
+
         from kivy.clock import Clock
         await Clock._async_lib.sleep(delay)
 
-    def resolve_widget(self, base_widget=None):
+    def get_time(self):
+        """Returns the current time, in seconds, as used by the ``do_xxx``
+        methods to time their gestures.
+
+        When :attr:`virtual_time` is enabled, it's the virtual clock time,
+        otherwise it's :func:`time.perf_counter`.
+        """
+        if self._virtual_clock is not None:
+            return self._virtual_clock.time()
+        return time.perf_counter()
+
+    def get_wall_time(self):
+        """Returns the current wall-clock time, as used by Kivy to time
+        touches (e.g. ``time_start`` and ``time_update``).
+
+        When :attr:`virtual_time` is enabled, it's the virtual wall-clock time
+        (see :meth:`~pytest_kivy.clock.VirtualClock.wall_time`), otherwise
+        it's :func:`time.time`.
+        """
+        if self._virtual_clock is not None:
+            return self._virtual_clock.wall_time()
+        return time.time()
+
+    def resolve_widget(self, base_widget=None, use_index=False):
+        """Returns a :class:`~pytest_kivy.resolver.WidgetResolver` starting
+        at ``base_widget``, or the ``Window`` if None.
+
+        If ``use_index`` is True, the resolver uses the
+        :class:`~pytest_kivy.resolver.WidgetIndex` of the ``Window`` returned
+        by :meth:`get_widget_index` to speed up the lookups.
+        """
+        from kivy.core.window import Window
         if base_widget is None:
-            from kivy.core.window import Window
             base_widget = Window
-        return WidgetResolver(base_widget=base_widget)
 
+        index = None
+        if use_index:
+            index = self.get_widget_index()
+        return WidgetResolver(base_widget=base_widget, index=index)
+
+    def get_widget_index(self, root=None, keys=None) -> WidgetIndex:
+        """Returns a :class:`~pytest_kivy.resolver.WidgetIndex` for the
+        widget tree rooted at ``root``, or the ``Window`` if None.
+
+        The index is built the first time it's requested for a root and is
+        then reused until the end of the test. If ``keys`` is not None and
+        differs from the keys of the existing index, the index is rebuilt
+        with the new keys.
+        """
+        if root is None:
+            from kivy.core.window import Window
+            root = Window
+
+        index = self._widget_indices.get(id(root), None)
+        if index is not None:
+            if keys is None or tuple(keys) == index.keys:
+                return index
+            index.close()
+
+        if keys is None:
+            index = WidgetIndex(root)
+        else:
+            index = WidgetIndex(root, keys=keys)
+        self._widget_indices[id(root)] = index
+        return index
+
+    @_timed_phase('frames')
     async def wait_clock_frames(
             self, n: int, sleep_time: float = 1 / 60.) -> int:
+        """Waits until the Kivy Clock executed ``n`` more frames and returns
+        the clock's frame count.
+
+        It returns as soon as the frame is reached, because it's woken up
+        directly from the clock. ``sleep_time`` is only used if called outside
+        the ``async with`` block, when we fall back to polling the clock.
+        """
+        if self._frame_notifier is not None:
+            return await self._frame_notifier.wait_frames(n)
+
         from kivy.clock import Clock
         frames_start = Clock.frames
         while Clock.frames < frames_start + n:
             await self.async_sleep(sleep_time)
         return Clock.frames
 
-    def get_widget_pos_pixel(self, widget, positions):
-        from kivy.graphics import Fbo, ClearColor, ClearBuffers
+    def _get_fbo(self, size):
+        from kivy.graphics import Fbo, ClearColor, ClearBuffers, \
+            PushMatrix, PopMatrix, Translate
+
+        item = self._fbo_pool.get(size, None)
+        if item is None:
+            fbo = Fbo(size=size, with_stencilbuffer=True)
+            with fbo:
+                ClearColor(0, 0, 0, 0)
+                ClearBuffers()
+                PushMatrix()
+                translate = Translate()
+                pop_matrix = PopMatrix()
+            item = self._fbo_pool[size] = fbo, translate, pop_matrix
+        return item
+
+    def _render_widget(self, widget, region=None):
+        # Window is its own parent and its canvas is in the render context
+        if widget.parent is widget:
+            canvas_parent = widget.render_context
+        elif widget.parent is not None:
+            canvas_parent = widget.parent.canvas
+        else:
+            canvas_parent = None
 
-        canvas_parent_index = -2
-        if widget.parent is not None:
-            canvas_parent_index = widget.parent.canvas.indexof(widget.canvas)
+        canvas_parent_index = -1
+        if canvas_parent is not None:
+            canvas_parent_index = canvas_parent.indexof(widget.canvas)
             if canvas_parent_index > -1:
-                widget.parent.canvas.remove(widget.canvas)
-
-        w, h = int(widget.width), int(widget.height)
-        fbo = Fbo(size=(w, h), with_stencilbuffer=True)
+                canvas_parent.remove(widget.canvas)
 
-        with fbo:
-            ClearColor(0, 0, 0, 0)
-            ClearBuffers()
+        if region is None:
+            x, y, w, h = 0, 0, int(widget.width), int(widget.height)
+        else:
+            x, y, w, h = region
+        fbo, translate, pop_matrix = self._get_fbo((w, h))
+        # only the region is rendered into the fbo
+        translate.xy = -x, -y
 
-        fbo.add(widget.canvas)
+        fbo.insert(fbo.indexof(pop_matrix), widget.canvas)
         fbo.draw()
         pixels = fbo.pixels
         fbo.remove(widget.canvas)
 
-        if widget.parent is not None and canvas_parent_index > -1:
-            widget.parent.canvas.insert(canvas_parent_index, widget.canvas)
+        if canvas_parent_index > -1:
+            canvas_parent.insert(canvas_parent_index, widget.canvas)
+
+        return pixels, w, h
+
+    def _gather_pixels(self, pixels, w, positions, x0=0, y0=0,
+                       as_array=False):
+        try:
+            import numpy as np
+        except ImportError:
+            if as_array:
+                raise
+            np = None
+
+        h = len(pixels) // (w * 4) if w else 0
+        if np is None:
+            values = []
+            for pos in positions:
+                x = int(pos[0]) - x0
+                y = int(pos[1]) - y0
+                if not (0 <= x < w and 0 <= y < h):
+                    raise ValueError(
+                        f'Position {tuple(pos)} is outside the rendered '
+                        f'{w}x{h} pixels at ({x0}, {y0})')
+                i = y * w * 4 + x * 4
+                values.append(tuple(pixels[i:i + 4]))
+            return values
+
+        data = np.frombuffer(pixels, dtype=np.uint8).reshape((-1, 4))
+        positions = np.asarray(positions, dtype=np.float64).reshape((-1, 2))
+        xs = positions[:, 0].astype(np.intp) - x0
+        ys = positions[:, 1].astype(np.intp) - y0
+        outside = (xs < 0) | (xs >= w) | (ys < 0) | (ys >= h)
+        if outside.any():
+            pos = tuple(positions[int(np.argmax(outside))].tolist())
+            raise ValueError(
+                f'Position {pos} is outside the rendered {w}x{h} pixels at '
+                f'({x0}, {y0})')
+        values = data[ys * w + xs]
+        if as_array:
+            return values
+        return list(map(tuple, values.tolist()))
+
+    def get_widget_pixels(self, widget, as_array=False):
+        """Renders the widget (or the ``Window``) into a FBO and returns its
+        RGBA pixels, with the rows starting from the bottom of the widget.
+
+        FBOs are pooled by size, so rendering widgets of the same size
+        repeatedly doesn't allocate new FBOs. The pool belongs to this app and
+        is released in :meth:`__aexit__`, so FBOs are not reused across
+        tests, even when the window is reused.
+
+        If ``as_array`` is False, it returns a read-only ``memoryview`` of
+        shape ``(height, width, 4)``. Otherwise, it returns a read-only
+        NumPy ``uint8`` array of the same shape. Neither copies the pixels.
+        """
+        pixels, w, h = self._render_widget(widget)
+        if as_array:
+            import numpy as np
+            return np.frombuffer(pixels, dtype=np.uint8).reshape((h, w, 4))
+        return memoryview(pixels).cast('B', (h, w, 4))
+
+    def get_widget_pos_pixel(self, widget, positions, as_array=False):
+        """Renders the widget into a FBO and returns the RGBA values of the
+        pixels at the given ``(x, y)`` ``positions``, relative to the widget.
+
+        If ``as_array`` is False, it returns a list of 4-tuples. Otherwise, it
+        returns a NumPy ``uint8`` array of shape ``(len(positions), 4)``. When
+        NumPy is installed, the pixels are gathered in a single vectorized
+        operation.
+
+        A :class:`ValueError` is raised if any position is outside the
+        widget.
+        """
+        pixels, w, h = self._render_widget(widget)
+        return self._gather_pixels(pixels, w, positions, as_array=as_array)
+
+    async def wait_for_pixels(
+            self, widget, positions, predicate, max_frames=120):
+        """Waits until the RGBA values of the pixels of the rendered widget at
+        the given ``(x, y)`` ``positions`` satisfy ``predicate``, and returns
+        the values.
+
+        ``predicate`` is called once per clock frame with the values, as
+        returned by :meth:`get_widget_pos_pixel`, and must return whether
+        they are as expected. Only the bounding box of ``positions`` is
+        rendered and read back, into a FBO that is reused between frames. So
+        the cost doesn't depend on the size of the widget.
+
+        If the predicate is still not satisfied after ``max_frames`` frames,
+        a :class:`TimeoutError` is raised.
+        """
+        positions = [(int(x), int(y)) for x, y in positions]
+        assert positions, 'No positions were given'
+        x0 = min(x for x, _ in positions)
+        y0 = min(y for _, y in positions)
+        w = max(x for x, _ in positions) - x0 + 1
+        h = max(y for _, y in positions) - y0 + 1
+
+        for i in range(max_frames + 1):
+            if i:
+                await self.wait_clock_frames(1)
+
+            pixels, _, _ = self._render_widget(widget, (x0, y0, w, h))
+            values = self._gather_pixels(pixels, w, positions, x0, y0)
+            if predicate(values):
+                return values
+
+        raise TimeoutError(
+            f'The pixels at {positions} did not satisfy the predicate after '
+            f'{max_frames} frames. Last values are {values}')
+
+    def get_region_pixels(
+            self, widget, region=None, window_coords=False):
+        """Renders the widget (or the ``Window``) and returns the pixels
+        within ``region`` as a read-only NumPy array of shape ``(height,
+        width, 4)``, with the rows starting from the bottom.
+
+        ``region`` is a ``(x, y, width, height)`` rectangle, clipped to the
+        rendered widget. If None, it's the whole widget. If ``window_coords``,
+        ``x`` and ``y`` are in window coordinates, otherwise they are in the
+        same coordinates as :meth:`get_widget_pos_pixel`. With
+        ``window_coords``, the region is clipped to the widget's ``pos`` and
+        ``size`` in the window. Only the region is read back.
+        """
+        import numpy as np
+        if region is None:
+            return self.get_widget_pixels(widget, as_array=True)
+
+        # the bounds of the widget in the coordinates it's drawn in
+        left, bottom = 0, 0
+        right, top = int(widget.width), int(widget.height)
+        x, y, width, height = region
+        if window_coords:
+            parent = widget.parent
+            # Window is its own parent oO
+            if parent is not None and parent is not widget:
+                x, y = parent.to_widget(x, y)
+                # the widget is drawn at its pos in its parent's coordinates
+                left, bottom = int(widget.x), int(widget.y)
+                right, top = left + right, bottom + top
+
+        x0 = min(max(int(x), left), right)
+        y0 = min(max(int(y), bottom), top)
+        x1 = min(max(int(x + width), left), right)
+        y1 = min(max(int(y + height), bottom), top)
+        if x1 <= x0 or y1 <= y0:
+            return np.zeros((max(y1 - y0, 0), max(x1 - x0, 0), 4), np.uint8)
+
+        pixels, w, h = self._render_widget(widget, (x0, y0, x1 - x0, y1 - y0))
+        return np.frombuffer(pixels, dtype=np.uint8).reshape((h, w, 4))
+
+    def get_region_stats(self, widget, region=None, window_coords=False):
+        """Returns a dict with the ``"mean"``, ``"min"``, and ``"max"`` RGBA
+        values of the pixels in the region of the rendered widget, as 4-tuples.
+
+        See :meth:`get_region_pixels` for the parameters.
+        """
+        pixels = self.get_region_pixels(widget, region, window_coords)
+        assert pixels.size, 'The region is empty'
+        pixels = pixels.reshape((-1, 4))
+        return {
+            'mean': tuple(pixels.mean(axis=0).tolist()),
+            'min': tuple(pixels.min(axis=0).tolist()),
+            'max': tuple(pixels.max(axis=0).tolist()),
+        }
+
+    def get_region_histogram(
+            self, widget, region=None, bins=16, window_coords=False):
+        """Returns the histogram of each RGBA channel of the pixels in the
+        region of the rendered widget, as a NumPy array of shape ``(4,
+        bins)``. Bin ``i`` counts the values in
+        ``[i * 256 / bins, (i + 1) * 256 / bins)``.
 
-        values = []
-        for x, y in positions:
-            x = int(x)
-            y = int(y)
-            i = y * w * 4 + x * 4
-            values.append(tuple(pixels[i:i + 4]))
+        See :meth:`get_region_pixels` for the other parameters.
+        """
+        import numpy as np
+        pixels = self.get_region_pixels(widget, region, window_coords)
+        indices = pixels.reshape((-1, 4)).astype(np.intp) * bins // 256
+        indices += np.arange(4) * bins
+        return np.bincount(
+            indices.ravel(), minlength=4 * bins).reshape((4, bins))
+
+    def get_region_match_fraction(
+            self, widget, color, region=None, tolerance=0,
+            window_coords=False) -> float:
+        """Returns the fraction of the pixels in the region of the rendered
+        widget, whose RGBA values are all within ``tolerance`` of ``color``.
+
+        ``color`` is a RGBA 4-tuple of values in the ``[0, 255]`` range, like
+        the pixels. ``tolerance`` is either a single value or a 4-tuple with
+        a value for each channel. See :meth:`get_region_pixels` for the
+        other parameters.
+        """
+        import numpy as np
+        pixels = self.get_region_pixels(widget, region, window_coords)
+        assert pixels.size, 'The region is empty'
+        diff = np.abs(
+            pixels.astype(np.int16) - np.asarray(color, dtype=np.int16))
+        matched = (diff <= np.asarray(tolerance, dtype=np.int16)).all(axis=2)
+        return float(matched.mean())
+
+    def assert_snapshot(
+            self, name, widget=None, tolerance=0, masks=(), max_mismatch=0):
+        """Renders the widget (or the ``Window`` if None) and asserts that it
+        matches the baseline image ``<name>.png`` in :attr:`snapshot_dir`.
+
+        ``tolerance`` is the maximum absolute difference of each channel
+        (either a single value or a RGBA 4-tuple), ``masks`` is a list of
+        ``(x, y, width, height)`` rectangles relative to the widget that are
+        ignored, and ``max_mismatch`` is the number of pixels allowed to
+        mismatch. See :func:`~pytest_kivy.snapshot.check_snapshot`.
+
+        NumPy must be installed.
+        """
+        from kivy.core.window import Window
+        from pytest_kivy.snapshot import check_snapshot
+
+        assert self.snapshot_dir is not None, 'snapshot_dir is not set'
+        if widget is None:
+            widget = Window
 
-        return values
+        image = self.get_widget_pixels(widget, as_array=True)
+        error = check_snapshot(
+            image, os.path.join(self.snapshot_dir, f'{name}.png'),
+            update=self.snapshot_update, tolerance=tolerance, masks=masks,
+            max_mismatch=max_mismatch, diff_dir=self.snapshot_diff_dir)
+        assert error is None, error
 
     async def do_touch_down_up(
             self, pos=None, widget=None, duration=.2, pos_jitter=None,
@@ -260,7 +1019,7 @@ class AsyncUnitApp:
                 x, y = widget.to_window(*pos, initial=False)
         touch = AsyncUnitTestTouch(x, y)
 
-        ts = time.perf_counter()
+        ts = self.get_time()
         touch.touch_down()
         await self.wait_clock_frames(1)
         yield 'down', touch.pos
@@ -280,7 +1039,7 @@ class AsyncUnitApp:
             dx = widget.width / 2.
             dy = widget.height / 2.
 
-        while time.perf_counter() - ts < duration:
+        while self.get_time() - ts < duration:
             moved = True
             await self.async_sleep(jitter_dt)
 
@@ -305,10 +1064,13 @@ class AsyncUnitApp:
             widget_loc=('center_x', 'center_y'), dx=0, dy=0,
             target_pos=None, target_widget=None, target_widget_offset=(0, 0),
             target_widget_loc=('center_x', 'center_y'), long_press=0,
-            duration=.2, drag_n=5):
+            duration=.2, drag_n=5, moves_per_frame=1):
         """Initiates a touch down, followed by some dragging to a target
         location, ending with a touch up.
 
+        The drag is made of ``drag_n`` moves, spread over ``duration``
+        seconds. See :meth:`do_touch_drag_path` for ``moves_per_frame``.
+
         `origin`: These parameters specify where the drag starts.
 
         - If ``widget`` is None, it starts at ``pos`` (in window coordinates).
@@ -381,13 +1143,9 @@ class AsyncUnitApp:
         dx = (tx - x) / drag_n
         dy = (ty - y) / drag_n
 
-        ts0 = time.perf_counter()
-        for i in range(drag_n):
-            await self.async_sleep(
-                max(0., duration - (time.perf_counter() - ts0)) / (drag_n - i))
-
-            touch.touch_move(x + (i + 1) * dx, y + (i + 1) * dy)
-            await self.wait_clock_frames(1)
+        path = [(x + (i + 1) * dx, y + (i + 1) * dy) for i in range(drag_n)]
+        async for _ in self._do_touch_moves(
+                [touch], [path], duration, moves_per_frame):
             yield 'move', touch.pos
 
         if touch.pos != target_pos:
@@ -465,7 +1223,7 @@ class AsyncUnitApp:
             await self.async_sleep(long_press)
         yield 'down', touch.pos
 
-        ts0 = time.perf_counter()
+        ts0 = self.get_time()
         tx, ty = get_target()
         i = 0
         while not (math.isclose(touch.x, tx, abs_tol=abs_tol) and
@@ -476,7 +1234,7 @@ class AsyncUnitApp:
                     'but {} != {}'.format(touch.pos, (tx, ty)))
 
             rem_i = max(1, drag_n - i)
-            rem_t = max(0., duration - (time.perf_counter() - ts0)) / rem_i
+            rem_t = max(0., duration - (self.get_time() - ts0)) / rem_i
             i += 1
             await self.async_sleep(rem_t)
 
@@ -490,8 +1248,63 @@ class AsyncUnitApp:
         await self.wait_clock_frames(1)
         yield 'up', touch.pos
 
+    async def _do_touch_moves(
+            self, touches, paths, duration, moves_per_frame):
+        # moves all the touches in lockstep along their paths, waiting a
+        # frame after each step (or burst of steps when moves_per_frame > 1)
+        from pytest_kivy.clock import kivy_effects_time
+        n = len(paths[0])
+        assert all(len(path) == n for path in paths), \
+            'All the paths must have the same length'
+        if not n:
+            return
+        if moves_per_frame is None:
+            moves_per_frame = n
+        assert moves_per_frame >= 1
+
+        ts0 = self.get_time()
+        if moves_per_frame == 1:
+            for i in range(n):
+                await self.async_sleep(
+                    max(0., duration - (self.get_time() - ts0)) / (n - i))
+
+                for touch, path in zip(touches, paths):
+                    touch.touch_move(*path[i])
+                await self.wait_clock_frames(1)
+                yield
+            return
+
+        n_bursts = int(math.ceil(n / moves_per_frame))
+        for i in range(n_bursts):
+            await self.async_sleep(
+                max(0., duration - (self.get_time() - ts0)) / (n_bursts - i))
+
+            s = slice(i * moves_per_frame, (i + 1) * moves_per_frame)
+            # spread the moves evenly since the last move, like the
+            # motion event's time, we use the (virtual) wall clock
+            t = self.get_wall_time()
+            bursts = [
+                (touch, path[s], touch.time_update,
+                 (t - touch.time_update) / len(path[s]))
+                for touch, path in zip(touches, paths)]
+
+            # effects (e.g. scrolling) time the moves with the wall clock, so
+            # they must see the interpolated time or the velocity explodes
+            move_time = [t]
+            with kivy_effects_time(lambda: move_time[0]):
+                for j in range(len(bursts[0][1])):
+                    for touch, burst, t_last, t_dt in bursts:
+                        move_time[0] = t_last + (j + 1) * t_dt
+                        touch.touch_move(
+                            *burst[j], time_update=move_time[0],
+                            dispatch_now=True)
+
+            await self.wait_clock_frames(1)
+            yield
+
     async def do_touch_drag_path(
-            self, path, axis_widget=None, long_press=0, duration=.2):
+            self, path, axis_widget=None, long_press=0, duration=.2,
+            moves_per_frame=1):
         """Drags the touch along the specified path.
 
         :parameters:
@@ -505,6 +1318,14 @@ class AsyncUnitApp:
                 to window coordinates using
                 :meth:`~kivy.uix.widget.Widget.to_window` of the specified
                 widget.
+            `moves_per_frame`: int or None
+                The number of moves dispatched in each clock frame. By
+                default, each move gets its own frame. If larger than 1, the
+                moves are dispatched in bursts, one burst and one ``"move"``
+                yielded per frame, and their ``time_update`` is interpolated
+                between the bursts so their velocity is as if each got its
+                own frame. If None, the entire path is dispatched in one
+                frame.
         """
         from pytest_kivy.input import AsyncUnitTestTouch
         if axis_widget is not None:
@@ -520,53 +1341,259 @@ class AsyncUnitApp:
             await self.async_sleep(long_press)
         yield 'down', touch.pos
 
-        ts0 = time.perf_counter()
-        n = len(path)
-        for i, (x2, y2) in enumerate(path):
-            await self.async_sleep(
-                max(0., duration - (time.perf_counter() - ts0)) / (n - i))
-
-            touch.touch_move(x2, y2)
-            await self.wait_clock_frames(1)
+        async for _ in self._do_touch_moves(
+                [touch], [path], duration, moves_per_frame):
             yield 'move', touch.pos
 
         touch.touch_up()
         await self.wait_clock_frames(1)
         yield 'up', touch.pos
 
-    async def do_keyboard_key(
-            self, key, modifiers=(), duration=.05, num_press=1):
+    async def do_multi_touch_path(
+            self, paths, axis_widget=None, long_press=0, duration=.2,
+            moves_per_frame=1):
+        """Drags multiple touches concurrently, each along its path, like
+        :meth:`do_touch_drag_path` does for a single touch.
+
+        ``paths`` is a list with a path for each touch, all of the same
+        length. The touches are moved in lockstep, so step ``i`` of all the
+        paths is dispatched in the same clock frame. Consequently, it takes
+        as many frames as dragging a single touch along one of the paths.
+
+        It yields ``"down"``, ``"move"``, and ``"up"`` with the list of the
+        positions of all the touches.
+        """
+        from pytest_kivy.input import AsyncUnitTestTouch
+        if axis_widget is not None:
+            paths = [
+                [axis_widget.to_window(*p, initial=False) for p in path]
+                for path in paths]
+
+        touches = [AsyncUnitTestTouch(*path[0]) for path in paths]
+        paths = [path[1:] for path in paths]
+
+        for touch in touches:
+            touch.touch_down()
+        await self.wait_clock_frames(1)
+        if long_press:
+            await self.async_sleep(long_press)
+        yield 'down', [touch.pos for touch in touches]
+
+        async for _ in self._do_touch_moves(
+                touches, paths, duration, moves_per_frame):
+            yield 'move', [touch.pos for touch in touches]
+
+        for touch in touches:
+            touch.touch_up()
+        await self.wait_clock_frames(1)
+        yield 'up', [touch.pos for touch in touches]
+
+    async def do_pinch(
+            self, pos=None, widget=None, distance=100, end_distance=200,
+            angle=0, end_angle=None, drag_n=10, duration=.2,
+            moves_per_frame=1):
+        """Does a two finger pinch (zoom) and/or rotate gesture around a
+        center point, using :meth:`do_multi_touch_path`.
+
+        The center is ``pos`` in window coordinates if ``widget`` is None,
+        the center of ``widget`` if ``pos`` is None, or ``pos`` in the
+        ``widget``'s coordinate system otherwise.
+
+        The two touches start ``distance`` pixels apart, on a line at
+        ``angle`` degrees (counter-clockwise from the x-axis) through the
+        center, and move over ``drag_n`` steps until they are
+        ``end_distance`` pixels apart at ``end_angle`` degrees (defaulting to
+        ``angle``).
+        """
+        if widget is None:
+            x, y = pos
+        elif pos is None:
+            x, y = widget.to_window(*widget.center)
+        else:
+            x, y = widget.to_window(*pos, initial=False)
+        if end_angle is None:
+            end_angle = angle
+
+        path1 = []
+        path2 = []
+        for i in range(drag_n + 1):
+            f = i / drag_n
+            r = (distance + (end_distance - distance) * f) / 2
+            theta = math.radians(angle + (end_angle - angle) * f)
+            dx, dy = r * math.cos(theta), r * math.sin(theta)
+            path1.append((x + dx, y + dy))
+            path2.append((x - dx, y - dy))
+
+        async for item in self.do_multi_touch_path(
+                [path1, path2], duration=duration,
+                moves_per_frame=moves_per_frame):
+            yield item
+
+    async def do_rotate(
+            self, pos=None, widget=None, distance=100, angle=0, end_angle=90,
+            drag_n=10, duration=.2, moves_per_frame=1):
+        """Does a two finger rotate gesture, without zooming, from ``angle``
+        to ``end_angle`` degrees. See :meth:`do_pinch`.
+        """
+        async for item in self.do_pinch(
+                pos=pos, widget=widget, distance=distance,
+                end_distance=distance, angle=angle, end_angle=end_angle,
+                drag_n=drag_n, duration=duration,
+                moves_per_frame=moves_per_frame):
+            yield item
+
+    async def do_multi_swipe(
+            self, pos=None, widget=None, dx=0, dy=0, n_fingers=2,
+            spacing=20, drag_n=5, duration=.2, moves_per_frame=1):
+        """Does a ``n_fingers`` finger swipe, with all the touches moving by
+        ``dx``, ``dy`` over ``drag_n`` steps, using
+        :meth:`do_multi_touch_path`.
+
+        The touches are placed ``spacing`` pixels apart on a horizontal line
+        centered on the start position, which is determined by ``pos`` and
+        ``widget`` like in :meth:`do_pinch`.
+        """
+        if widget is None:
+            x, y = pos
+        elif pos is None:
+            x, y = widget.to_window(*widget.center)
+        else:
+            x, y = widget.to_window(*pos, initial=False)
+
+        x0 = x - spacing * (n_fingers - 1) / 2
+        paths = [
+            [(x0 + k * spacing + dx * i / drag_n, y + dy * i / drag_n)
+             for i in range(drag_n + 1)]
+            for k in range(n_fingers)]
+
+        async for item in self.do_multi_touch_path(
+                paths, duration=duration, moves_per_frame=moves_per_frame):
+            yield item
+
+    def _dispatch_recorded_events(self, events, touches, wall_ts, speed):
+        from kivy.core.window import Window
+        from kivy.base import EventLoop
+        from pytest_kivy.input import AsyncUnitTestTouch
+        x_scale, y_scale = Window.width - 1, Window.height - 1
+
+        for event in events:
+            kind = event['e']
+            if kind == 'touch':
+                x, y = event['sx'] * x_scale, event['sy'] * y_scale
+                # like the motion event's time, we use the wall clock
+                if speed is None:
+                    # the events of the frame happen when it's replayed
+                    ts = wall_ts
+                else:
+                    ts = wall_ts + event['t'] / speed
+                etype = event['etype']
+
+                if etype == 'begin':
+                    touch = touches[event['id']] = AsyncUnitTestTouch(x, y)
+                    touch.time_start = touch.time_update = ts
+                    touch.touch_down()
+                else:
+                    # the recording may have started after the touch began
+                    touch = touches.get(event['id'], None)
+                    if touch is None:
+                        continue
+
+                    if etype == 'update':
+                        touch.touch_move(x, y, time_update=ts)
+                    else:
+                        del touches[event['id']]
+                        touch.time_update = ts
+                        touch.touch_up()
+
+                # dispatch it now, in order with the other events of the
+                # frame, but through the post-processing (e.g. double tap)
+                EventLoop.dispatch_input()
+            elif kind == 'key_down':
+                Window.dispatch(
+                    'on_key_down', event['key'], event['scancode'],
+                    event['codepoint'], event['modifiers'])
+            elif kind == 'key_up':
+                Window.dispatch('on_key_up', event['key'], event['scancode'])
+            elif kind == 'textinput':
+                Window.dispatch('on_textinput', event['text'])
+            else:
+                raise ValueError(f'Unknown recorded event "{kind}"')
+
+    async def do_replay_input(self, source, speed=1., frame_dt=1 / 60.):
+        """Replays the input events recorded by
+        :class:`~pytest_kivy.recorder.InputRecorder`, streaming them from
+        ``source`` (a filename or an iterable of lines).
+
+        Events recorded within ``frame_dt`` seconds of each other are
+        dispatched together, in the same clock frame, and it yields
+        ``"events"`` with the list of events after each such frame.
+
+        ``speed`` is the replay speed multiplier, e.g. ``4`` replays four
+        times faster than recorded. If None, it replays as fast as frames
+        allow, without waiting between the frames. Touch positions are scaled
+        to the current window size and touch times are scaled by ``speed``
+        so widgets see the same velocities as during the recording, if
+        ``speed`` is 1. If None, the touches of each frame are timed when the
+        frame is replayed, so they don't run ahead of the clock, but their
+        velocities don't match the recording.
+
+        Touches still down when the recording ends, or when the generator is
+        closed early, are ended so they don't remain grabbed.
+        """
+        from pytest_kivy.recorder import iter_recording
+
+        events = iter_recording(source)
+        header = next(events, None)
+        if header is None:
+            return
+
+        touches = {}
+        ts0 = self.get_time()
+        wall_ts0 = self.get_wall_time()
+
+        group = []
+        try:
+            for event in chain(events, [None]):
+                if event is not None and (
+                        not group or event['t'] < group[0]['t'] + frame_dt):
+                    group.append(event)
+                    continue
+                if not group:
+                    break
+
+                if speed is not None:
+                    await self.async_sleep(max(
+                        0., group[0]['t'] / speed - (self.get_time() - ts0)))
+                    wall_ts = wall_ts0
+                else:
+                    wall_ts = self.get_wall_time()
+
+                self._dispatch_recorded_events(group, touches, wall_ts, speed)
+                await self.wait_clock_frames(1)
+                yield 'events', group
+
+                group = [event]
+        finally:
+            # the recording ended, or we were closed, with touches still down
+            self._end_recorded_touches(touches)
+
+    def _end_recorded_touches(self, touches):
+        from kivy.base import EventLoop
+        for touch in touches.values():
+            touch.time_update = self.get_wall_time()
+            touch.touch_up()
+        touches.clear()
+        EventLoop.dispatch_input()
+
+    def _get_key_code_text(self, key):
+        item = _key_code_text_cache.get(key, None)
+        if item is not None:
+            return item
+
         from kivy.core.window import Window
-        if key == ' ':
-            key = 'spacebar'
         key_lower = key.lower()
         key_code = Window._system_keyboard.string_to_keycode(key_lower)
 
-        known_modifiers = {'shift', 'alt', 'ctrl', 'meta'}
-        if set(modifiers) - known_modifiers:
-            raise ValueError('Unknown modifiers "{}"'.
-                             format(set(modifiers) - known_modifiers))
-
-        special_keys = {
-            27: 'escape',
-            9: 'tab',
-            8: 'backspace',
-            13: 'enter',
-            127: 'del',
-            271: 'enter',
-            273: 'up',
-            274: 'down',
-            275: 'right',
-            276: 'left',
-            278: 'home',
-            279: 'end',
-            280: 'pgup',
-            281: 'pgdown',
-            300: 'numlock',
-            301: 'capslock',
-            145: 'screenlock',
-        }
-
         text = None
         try:
             text = chr(key_code)
@@ -575,14 +1602,28 @@ class AsyncUnitApp:
         except ValueError:
             pass
 
+        item = _key_code_text_cache[key] = key_code, text
+        return item
+
+    async def do_keyboard_key(
+            self, key, modifiers=(), duration=.05, num_press=1):
+        from kivy.core.window import Window
+        if key == ' ':
+            key = 'spacebar'
+        key_code, text = self._get_key_code_text(key)
+
+        if set(modifiers) - _known_modifiers:
+            raise ValueError('Unknown modifiers "{}"'.
+                             format(set(modifiers) - _known_modifiers))
+
         dt = duration / num_press
         for i in range(num_press):
             await self.async_sleep(dt)
 
             Window.dispatch('on_key_down', key_code, 0, text, modifiers)
-            if (key not in known_modifiers and
-                    key_code not in special_keys and
-                    not (known_modifiers & set(modifiers))):
+            if (key not in _known_modifiers and
+                    key_code not in _special_keys and
+                    not (_known_modifiers & set(modifiers))):
                 Window.dispatch('on_textinput', text)
 
             await self.wait_clock_frames(1)
@@ -591,3 +1632,54 @@ class AsyncUnitApp:
         Window.dispatch('on_key_up', key_code, 0)
         await self.wait_clock_frames(1)
         yield 'up', (key, key_code, 0, text, modifiers)
+
+    async def type_text(self, text, chars_per_frame=1, duration=0):
+        """Types the text by dispatching a ``on_key_down``, ``on_textinput``,
+        and ``on_key_up`` for each of its characters, like
+        :meth:`do_keyboard_key` would for each of them.
+
+        ``chars_per_frame`` characters are typed in each clock frame, yielding
+        ``"text"`` with the typed characters after each frame. If None, the
+        whole text is typed in a single frame. ``duration`` is the total time
+        in seconds over which the text is typed. Newlines and tabs are typed
+        as the ``enter`` and ``tab`` keys, and uppercase letters and the
+        symbols typed with shift on a US keyboard (e.g. ``"!"``) with the
+        ``shift`` modifier.
+        """
+        from kivy.core.window import Window
+        if not text:
+            return
+        if chars_per_frame is None:
+            chars_per_frame = len(text)
+        assert chars_per_frame >= 1
+
+        events = []
+        for char in text:
+            key = _char_keys.get(char, char)
+            key_code, char_text = self._get_key_code_text(key)
+            if key_code == -1:
+                # not in the keyboard layout, type it as its code point
+                key_code, char_text = ord(char), char
+            modifiers = []
+            if char != char.lower() or char in _shifted_chars:
+                modifiers.append('shift')
+            events.append(
+                (key_code, char_text, modifiers, key_code not in _special_keys))
+
+        n = int(math.ceil(len(text) / chars_per_frame))
+        ts0 = self.get_time()
+        dispatch = Window.dispatch
+        for i in range(n):
+            if duration:
+                await self.async_sleep(
+                    max(0., duration - (self.get_time() - ts0)) / (n - i))
+
+            s = slice(i * chars_per_frame, (i + 1) * chars_per_frame)
+            for key_code, char_text, modifiers, is_text in events[s]:
+                dispatch('on_key_down', key_code, 0, char_text, modifiers)
+                if is_text:
+                    dispatch('on_textinput', char_text)
+                dispatch('on_key_up', key_code, 0)
+
+            await self.wait_clock_frames(1)
+            yield 'text', text[s]
@@ -0,0 +1,405 @@
+"""Clock
+========
+
+Tools for controlling the Kivy :class:`~kivy.clock.ClockBase` created for each
+test.
+
+"""
+
+import time
+import math
+import heapq
+import importlib
+from itertools import count
+from contextlib import contextmanager
+
+__all__ = (
+    'VirtualClock', 'FrameNotifier', 'FrameRecorder', 'create_async_event',
+    'wait_async_event', 'check_frame_budget', 'kivy_effects_time')
+
+
+def create_async_event(async_lib):
+    """Creates an event object for the given async library (``"asyncio"`` or
+    ``"trio"``), that supports ``set()`` and ``await event.wait()``.
+    """
+    if async_lib == 'trio':
+        import trio
+        return trio.Event()
+    elif async_lib == 'asyncio':
+        import asyncio
+        return asyncio.Event()
+    raise ValueError(f'unknown async library {async_lib}')
+
+
+async def wait_async_event(event, async_lib, timeout=None):
+    """Waits for an event created with :func:`create_async_event` to be set.
+
+    If ``timeout`` is not None and the event is not set within ``timeout``
+    seconds (of real time), a :class:`TimeoutError` is raised.
+    """
+    if timeout is None:
+        await event.wait()
+        return
+
+    if async_lib == 'trio':
+        import trio
+        with trio.move_on_after(timeout):
+            await event.wait()
+            return
+        raise TimeoutError()
+
+    import asyncio
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError as e:
+        raise TimeoutError() from e
+
+
+class FrameNotifier:
+    """Allows waiting for a Kivy :class:`~kivy.clock.ClockBase` to reach a
+    given frame.
+
+    Waiters are woken up directly from a clock callback executed during the
+    frame in which the requested frame count is reached, rather than by
+    polling :attr:`~kivy.clock.ClockBase.frames`. The clock callback is only
+    scheduled while there are waiters.
+    """
+
+    clock = None
+
+    async_lib = 'asyncio'
+
+    _waiters = []
+
+    _event = None
+
+    def __init__(self, clock, async_lib):
+        super().__init__()
+        self.clock = clock
+        self.async_lib = async_lib
+        self._waiters = []
+        self._counter = count()
+
+    def _notify(self, *largs):
+        frames = self.clock.frames
+        waiters = self._waiters
+        while waiters and waiters[0][0] <= frames:
+            heapq.heappop(waiters)[2].set()
+
+        if not waiters:
+            self._event = None
+            return False
+
+    def release_all(self):
+        """Wakes up all the current waiters, e.g. because the app stopped and
+        the clock won't execute any more frames.
+        """
+        waiters = self._waiters
+        self._waiters = []
+        for _, _, event in waiters:
+            event.set()
+
+    async def wait_frames(self, n):
+        """Waits until ``n`` more clock frames have been executed and returns
+        the current clock frame count.
+        """
+        clock = self.clock
+        if n <= 0:
+            return clock.frames
+
+        event = create_async_event(self.async_lib)
+        heapq.heappush(
+            self._waiters, (clock.frames + n, next(self._counter), event))
+        if self._event is None:
+            self._event = clock.schedule_interval(self._notify, 0)
+
+        await event.wait()
+        return clock.frames
+
+
+_kivy_time_modules = (
+    'kivy.input.motionevent', 'kivy.input.postproc.doubletap',
+    'kivy.input.postproc.tripletap', 'kivy.effects.kinetic',
+    'kivy.effects.scroll')
+"""The Kivy modules that time touches and their motion with
+:func:`time.time`, imported as ``time``.
+"""
+
+_kivy_effect_modules = ('kivy.effects.kinetic', 'kivy.effects.scroll')
+"""The Kivy modules of the effects that time the touch motion themselves,
+rather than using the touch's time.
+"""
+
+
+@contextmanager
+def kivy_effects_time(get_time):
+    """Context manager that makes the Kivy kinetic effects (e.g. of the
+    :class:`~kivy.uix.scrollview.ScrollView`) read the time from
+    ``get_time``, rather than from :func:`time.time` (or the
+    :class:`VirtualClock`), within the context.
+    """
+    modules = [importlib.import_module(name) for name in _kivy_effect_modules]
+    times = [module.time for module in modules]
+    for module in modules:
+        module.time = get_time
+    try:
+        yield
+    finally:
+        for module, time_func in zip(modules, times):
+            module.time = time_func
+
+
+class VirtualClock:
+    """Simulated time source that drives a Kivy
+    :class:`~kivy.clock.ClockBase`.
+
+    Once :meth:`install` is called, the clock's time no longer follows the wall
+    clock. Instead, every clock frame advances the time by exactly
+    :attr:`step` seconds and :meth:`sleep` waits for the virtual time to
+    advance, rather than actually sleeping. So e.g. a ``0.2`` second sleep
+    takes ``12`` frames (with the default step), but no wall-clock time
+    beyond that of executing the frames.
+
+    The wall-clock time Kivy uses to time touches (e.g. to detect double
+    taps) and the kinetic scrolling is also replaced by :meth:`wall_time`
+    until :meth:`uninstall` is called, so touches behave the same as when
+    running in real time.
+
+    Because time only advances in whole frames, clock events scheduled with
+    :meth:`~kivy.clock.ClockBase.schedule_once` or
+    :meth:`~kivy.clock.ClockBase.schedule_interval` fire in the same order as
+    they would when running in real time.
+    """
+
+    now = 0.
+
+    step = 1 / 60.
+
+    clock = None
+
+    _wall_offset = 0.
+
+    _kivy_times = []
+
+    def __init__(self, step=1 / 60., start=None):
+        super().__init__()
+        self.step = step
+        self.now = time.perf_counter() if start is None else start
+        self._wall_offset = time.time() - self.now
+        self._kivy_times = []
+
+    def time(self):
+        """Returns the current virtual time.
+        """
+        return self.now
+
+    def wall_time(self):
+        """Returns the current virtual wall-clock time, i.e. the
+        :func:`time.time` when the clock was created plus the virtual time
+        elapsed since.
+        """
+        return self.now + self._wall_offset
+
+    def advance(self, dt):
+        """Advances the virtual time by ``dt`` seconds without waiting for any
+        frames.
+        """
+        self.now += dt
+
+    def install(self, clock):
+        """Replaces the time source of the given clock with this virtual
+        clock.
+        """
+        self.clock = clock
+        clock.time = self.time
+        clock._duration_ts0 = clock._start_tick = clock._last_tick = self.now
+
+        idle = clock.idle
+        async_idle = clock.async_idle
+
+        def virtual_idle():
+            self.now += self.step
+            return idle()
+
+        async def virtual_async_idle():
+            self.now += self.step
+            return await async_idle()
+
+        clock.idle = virtual_idle
+        clock.async_idle = virtual_async_idle
+
+        for name in _kivy_time_modules:
+            module = importlib.import_module(name)
+            self._kivy_times.append((module, module.time))
+            module.time = self.wall_time
+
+    def uninstall(self):
+        """Restores the wall-clock time used by Kivy, replaced by
+        :meth:`install`. The clock itself is not restored.
+
+        The touches remembered by Kivy's double and triple tap detection are
+        forgotten, because their virtual times may be ahead of the wall
+        clock.
+        """
+        from kivy.base import EventLoop
+        from kivy.input.postproc.doubletap import InputPostprocDoubleTap
+        from kivy.input.postproc.tripletap import InputPostprocTripleTap
+        for module, time_func in self._kivy_times:
+            module.time = time_func
+        self._kivy_times = []
+
+        for mod in EventLoop.postproc_modules:
+            if isinstance(
+                    mod, (InputPostprocDoubleTap, InputPostprocTripleTap)):
+                mod.touches.clear()
+
+    async def sleep(self, delay):
+        """Waits until the virtual time advanced by ``delay`` seconds.
+
+        If the Kivy event loop is not running, no frames will be executed, so
+        the time is advanced immediately instead.
+        """
+        from kivy.base import EventLoop
+        sleep = self.clock._async_lib.sleep
+        # account for floating point error accumulating from adding step
+        target = self.now + delay - 1e-9
+
+        await sleep(0)
+        while self.now < target and EventLoop.status == 'started':
+            await sleep(0)
+        self.now = max(self.now, target)
+
+
+class FrameRecorder:
+    """Records how long each frame of a Kivy :class:`~kivy.clock.ClockBase`
+    takes to process, i.e. the time from when the clock ticks until it's
+    idle again, excluding any time spent sleeping to limit the frame rate.
+
+    Recording starts with :meth:`start` and ends with :meth:`stop`, or it can
+    be used as a context manager. The clock is only instrumented while
+    recording. Recorders stacked on the same clock must be stopped in the
+    reverse order they were started.
+    """
+
+    clock = None
+
+    target_fps = 60.
+    """The target frame rate. Frames taking longer than ``1 / target_fps``
+    are counted as dropped by :meth:`get_stats`.
+    """
+
+    durations = []
+    """The duration, in seconds, of each of the recorded frames."""
+
+    _frame_ts = None
+
+    _idle = None
+
+    _async_idle = None
+
+    def __init__(self, clock, target_fps=60.):
+        super().__init__()
+        self.clock = clock
+        self.target_fps = target_fps
+        self.durations = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _end_frame(self):
+        if self._frame_ts is not None:
+            self.durations.append(time.perf_counter() - self._frame_ts)
+            self._frame_ts = None
+
+    def start(self):
+        """Starts recording the frames.
+        """
+        clock = self.clock
+        idle = self._idle = clock.idle
+        async_idle = self._async_idle = clock.async_idle
+
+        def recording_idle():
+            self._end_frame()
+            result = idle()
+            self._frame_ts = time.perf_counter()
+            return result
+
+        async def recording_async_idle():
+            self._end_frame()
+            result = await async_idle()
+            self._frame_ts = time.perf_counter()
+            return result
+
+        clock.idle = recording_idle
+        clock.async_idle = recording_async_idle
+
+    def stop(self):
+        """Stops recording the frames. The current frame, which has not
+        finished processing, is not recorded.
+        """
+        if self._idle is None:
+            return
+        self.clock.idle = self._idle
+        self.clock.async_idle = self._async_idle
+        self._idle = self._async_idle = self._frame_ts = None
+
+    def clear(self):
+        """Removes the frames recorded so far.
+        """
+        self.durations = []
+
+    def get_stats(self) -> dict:
+        """Returns the statistics of the recorded frames as a dict with the
+        number of ``frames``, their ``mean_ms``, ``p50_ms``, ``p95_ms``,
+        ``p99_ms``, and ``max_ms`` duration in milliseconds, and the number of
+        ``dropped`` frames (see :attr:`target_fps`).
+        """
+        durations = sorted(self.durations)
+        n = len(durations)
+        if not n:
+            return {
+                'frames': 0, 'mean_ms': 0., 'p50_ms': 0., 'p95_ms': 0.,
+                'p99_ms': 0., 'max_ms': 0., 'dropped': 0}
+
+        def percentile(p):
+            # nearest rank
+            return durations[max(int(math.ceil(p / 100 * n)) - 1, 0)] * 1000
+
+        budget = 1 / self.target_fps
+        return {
+            'frames': n,
+            'mean_ms': sum(durations) / n * 1000,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': durations[-1] * 1000,
+            'dropped': sum(1 for d in durations if d > budget),
+        }
+
+
+def check_frame_budget(
+        stats, p95_ms=None, max_ms=None, mean_ms=None, max_dropped=None):
+    """Checks the frame statistics returned by
+    :meth:`FrameRecorder.get_stats` against the budgets that are not None.
+
+    Returns None if they are all met, otherwise an error message listing
+    the exceeded budgets.
+    """
+    errors = []
+    for name, budget in (
+            ('p95_ms', p95_ms), ('max_ms', max_ms), ('mean_ms', mean_ms),
+            ('dropped', max_dropped)):
+        if budget is not None and stats[name] > budget:
+            errors.append(f'{name} {stats[name]:.4g} > {budget}')
+
+    if not errors:
+        return None
+
+    summary = ', '.join(
+        f'{key}={value:.4g}' if isinstance(value, float) else
+        f'{key}={value}' for key, value in stats.items())
+    return 'Frame budget exceeded: {} ({})'.format(', '.join(errors), summary)
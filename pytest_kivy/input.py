@@ -18,13 +18,26 @@ class AsyncUnitTestTouch(UnitTestTouch):
     def touch_down(self, *args):
         self.eventloop._dispatch_input("begin", self)
 
-    def touch_move(self, x, y):
+    def touch_move(self, x, y, time_update=None, dispatch_now=False):
+        """Moves the touch to the ``(x, y)`` window position.
+
+        If ``time_update`` is not None, it's used as the time of the move,
+        instead of the current time. If ``dispatch_now``, the move is
+        dispatched immediately, rather than queued for the next clock frame,
+        in which only the last queued move of the touch would be dispatched.
+        """
         win = self.eventloop.window
         self.move({
             "x": x / (win.width - 1.0),
             "y": y / (win.height - 1.0)
         })
-        self.eventloop._dispatch_input("update", self)
+        if time_update is not None:
+            self.time_update = time_update
+
+        if dispatch_now:
+            self.eventloop.post_dispatch_input("update", self)
+        else:
+            self.eventloop._dispatch_input("update", self)
 
     def touch_up(self, *args):
         self.eventloop._dispatch_input("end", self)
@@ -0,0 +1,309 @@
+"""Memory
+=========
+
+Helpers for tracking down why an object, e.g. a leaked app, is not released.
+
+:func:`find_referrer_chain` walks the garbage collector's referrer graph
+backwards from the object, breadth first, until it reaches a root that keeps
+it alive: a module global, a Kivy property observer, or a Kivy Clock event.
+The referrers of a level of the graph are looked up in chunks of objects per
+:func:`gc.get_referrers` call, because each call walks all the objects tracked
+by the garbage collector. The search is bounded by the depth, the number of
+objects visited, and the time it takes, which is checked between chunks, so it
+stays cheap even for apps with millions of objects.
+
+:func:`take_snapshot` and :func:`compare_snapshots` measure, using
+:mod:`tracemalloc`, how much memory was allocated and not released during a
+test, and where it was allocated.
+
+:func:`take_census` and :func:`compare_census` count the Kivy objects that are
+alive, to find the ones that accumulate from test to test.
+"""
+
+import gc
+import sys
+import time
+import types
+import tracemalloc
+from reprlib import Repr
+
+__all__ = (
+    'find_referrer_chain', 'format_referrer_chain', 'take_snapshot',
+    'compare_snapshots', 'take_census', 'compare_census')
+
+_repr = Repr()
+_repr.maxstring = 60
+_repr.maxother = 60
+
+_referrers_chunk_size = 100
+"""The number of objects whose referrers are looked up with one
+:func:`gc.get_referrers` call, which takes time proportional to it.
+"""
+
+
+def _get_root_kind(obj, module_dicts):
+    """Returns a description of the root if ``obj`` is one, otherwise None.
+    """
+    from kivy._event import EventObservers, BoundCallback
+    from kivy._clock import ClockEvent
+    if type(obj) is dict and id(obj) in module_dicts:
+        return f'module {module_dicts[id(obj)]}'
+    if isinstance(obj, (EventObservers, BoundCallback)):
+        return 'Kivy property observer'
+    if isinstance(obj, ClockEvent):
+        return f'Kivy Clock event {_repr.repr(obj.get_callback())}'
+    return None
+
+
+def find_referrer_chain(
+        obj, max_depth=10, max_objects=100_000, timeout=5.):
+    """Finds the shortest chain of referrers from a root, that keeps ``obj``
+    alive, down to ``obj``.
+
+    Returns a tuple of ``(chain, root, reason)``. ``chain`` is the list of
+    objects starting with the root and ending with ``obj``, and ``root`` the
+    description of the root. If no root was found, ``chain`` and ``root`` are
+    None, and ``reason`` describes why the search stopped.
+
+    The search stops after ``max_depth`` levels, ``max_objects`` visited
+    objects, or ``timeout`` seconds. The referrers created by the search and
+    the frames of the current call stack are ignored.
+    """
+    ts = time.perf_counter()
+    module_dicts = {
+        id(module.__dict__): name
+        for name, module in list(sys.modules.items())
+        if hasattr(module, '__dict__')}
+
+    # maps the id of the visited objects to the id of the object they refer
+    # to in the chain, and keeps the visited objects alive while searching
+    children = {id(obj): None}
+    objects = {id(obj): obj}
+    frontier = [obj]
+
+    ignored = {id(children), id(objects), id(module_dicts)}
+    frame = sys._getframe()
+    while frame is not None:
+        ignored.add(id(frame))
+        frame = frame.f_back
+    del frame
+
+    try:
+        for _ in range(max_depth):
+            next_frontier = []
+            ignored.update((id(frontier), id(next_frontier)))
+
+            for i in range(0, len(frontier), _referrers_chunk_size):
+                if time.perf_counter() - ts >= timeout:
+                    return None, None, f'timed out after {timeout} seconds'
+
+                chunk = tuple(frontier[i:i + _referrers_chunk_size])
+                chunk_ids = {id(item) for item in chunk}
+                referrers = gc.get_referrers(*chunk)
+                ignored.update((id(chunk), id(chunk_ids), id(referrers)))
+
+                for referrer in referrers:
+                    if id(referrer) in ignored or id(referrer) in objects:
+                        continue
+
+                    for referent in gc.get_referents(referrer):
+                        if id(referent) in chunk_ids:
+                            break
+                    else:
+                        continue
+
+                    children[id(referrer)] = id(referent)
+                    objects[id(referrer)] = referrer
+                    root = _get_root_kind(referrer, module_dicts)
+                    if root is not None:
+                        chain = [referrer]
+                        child = children[id(referrer)]
+                        while child is not None:
+                            chain.append(objects[child])
+                            child = children[child]
+                        return chain, root, None
+
+                    next_frontier.append(referrer)
+                    if len(objects) >= max_objects:
+                        return None, None, \
+                            f'visited the maximum of {max_objects} objects'
+                    if time.perf_counter() - ts >= timeout:
+                        return None, None, \
+                            f'timed out after {timeout} seconds'
+                del referrers, chunk
+
+            if not next_frontier:
+                return None, None, 'no more referrers'
+            frontier = next_frontier
+
+        return None, None, f'reached the maximum depth of {max_depth}'
+    finally:
+        objects.clear()
+
+
+def _describe_reference(referrer, referent):
+    """Describes how ``referrer`` refers to ``referent``.
+    """
+    if isinstance(referrer, dict):
+        for key, value in referrer.items():
+            if value is referent:
+                return f'[{_repr.repr(key)}]'
+        return 'dict key'
+
+    if isinstance(referrer, (list, tuple)):
+        for i, value in enumerate(referrer):
+            if value is referent:
+                return f'[{i}]'
+
+    if isinstance(referrer, types.FrameType):
+        for name, value in referrer.f_locals.items():
+            if value is referent:
+                code = referrer.f_code
+                return (
+                    f'local {name} of {code.co_name} '
+                    f'({code.co_filename}:{referrer.f_lineno})')
+
+    if isinstance(referrer, types.MethodType):
+        if referrer.__self__ is referent:
+            return '.__self__'
+
+    if isinstance(referrer, types.CellType):
+        return '.cell_contents'
+
+    for name, value in getattr(referrer, '__dict__', {}).items():
+        if value is referent:
+            return f'.{name}'
+
+    # e.g. the __closure__ of functions or the attributes of Cython objects
+    for name in dir(referrer):
+        try:
+            if getattr(referrer, name) is referent:
+                return f'.{name}'
+        except Exception:
+            pass
+    return f'({type(referrer).__name__} internal)'
+
+
+def format_referrer_chain(obj, chain, root, reason):
+    """Formats the result of :func:`find_referrer_chain` for ``obj`` as text.
+    """
+    if chain is None:
+        return (
+            f'Could not find the referrers keeping {_repr.repr(obj)} alive: '
+            f'{reason}')
+
+    lines = [
+        f'{_repr.repr(obj)} is kept alive by {root}, through '
+        f'{len(chain) - 1} references:']
+    lines.append(f'    {type(chain[0]).__name__} {_repr.repr(chain[0])}')
+    for referrer, referent in zip(chain[:-1], chain[1:]):
+        lines.append(
+            f'    -> {_describe_reference(referrer, referent)} '
+            f'{type(referent).__name__} {_repr.repr(referent)}')
+    return '\n'.join(lines)
+
+
+_snapshot_excluded_files = {
+    tracemalloc.__file__, '<frozen importlib._bootstrap>',
+    '<frozen importlib._bootstrap_external>', '<unknown>'}
+"""The allocations of these files, by tracemalloc and the import system, are
+ignored by :func:`compare_snapshots`.
+"""
+
+
+def take_snapshot():
+    """Collects the garbage and returns a :mod:`tracemalloc` snapshot of the
+    live memory blocks.
+
+    :func:`tracemalloc.start` must have been called.
+    """
+    gc.collect()
+    return tracemalloc.take_snapshot()
+
+
+def compare_snapshots(before, after, top=10):
+    """Compares two snapshots from :func:`take_snapshot`, and returns a dict
+    with the net ``size`` (in bytes) and ``count`` of memory blocks allocated
+    between them, and the ``top`` source lines that allocated the most.
+
+    ``top`` is a list of dicts, each with the ``site`` (``"file:line"``), and
+    the ``size`` and ``count`` of its allocations.
+    """
+    # filtering the per-line statistics is much faster than filtering the
+    # snapshot traces
+    stats = [
+        stat for stat in after.compare_to(before, 'lineno')
+        if stat.traceback[0].filename not in _snapshot_excluded_files]
+
+    sites = []
+    for stat in stats[:top]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        sites.append({
+            'site': f'{frame.filename}:{frame.lineno}',
+            'size': stat.size_diff, 'count': stat.count_diff})
+
+    return {
+        'size': sum(stat.size_diff for stat in stats),
+        'count': sum(stat.count_diff for stat in stats),
+        'top': sites,
+    }
+
+
+def take_census():
+    """Collects the garbage and counts the live Kivy objects.
+
+    Returns a dict mapping the name of each kind of object to the number
+    alive. The keys are ``"Widget:<class name>"`` for widgets,
+    ``"Instruction:<class name>"`` for canvas instruction groups (e.g. the
+    ``Canvas`` of widgets), ``"Texture"``, ``"ClockEvent"`` for the clock
+    events and triggers (of any clock), and ``"Cache:<category>"`` for the
+    objects stored in the Kivy ``Cache``.
+    """
+    from kivy.uix.widget import Widget
+    from kivy.graphics.instructions import InstructionGroup
+    from kivy.graphics.texture import Texture
+    from kivy.clock import ClockEvent
+    from kivy.cache import Cache
+
+    gc.collect()
+    census = {}
+    # the kind of each type, so each type is only checked once
+    kinds = {}
+    for obj in gc.get_objects():
+        cls = type(obj)
+        try:
+            kind = kinds[cls]
+        except KeyError:
+            if issubclass(cls, Widget):
+                kind = f'Widget:{cls.__name__}'
+            elif issubclass(cls, InstructionGroup):
+                kind = f'Instruction:{cls.__name__}'
+            elif issubclass(cls, Texture):
+                kind = 'Texture'
+            elif issubclass(cls, ClockEvent):
+                kind = 'ClockEvent'
+            else:
+                kind = None
+            kinds[cls] = kind
+
+        if kind is not None:
+            census[kind] = census.get(kind, 0) + 1
+
+    # Cache has no public API to count its objects
+    for category, objects in getattr(Cache, '_objects', {}).items():
+        census[f'Cache:{category}'] = len(objects)
+    return census
+
+
+def compare_census(before, after):
+    """Returns a dict mapping each kind of object of two censuses from
+    :func:`take_census`, whose count changed, to the change.
+    """
+    diff = {}
+    for kind in set(before) | set(after):
+        change = after.get(kind, 0) - before.get(kind, 0)
+        if change:
+            diff[kind] = change
+    return diff
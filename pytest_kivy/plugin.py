@@ -7,8 +7,14 @@ import pytest
 import weakref
 from typing import Tuple, Type, Optional, Callable
 import gc
+import json
 import logging
-from os import environ
+import re
+import tempfile
+import tracemalloc
+from itertools import count
+from os import environ, makedirs
+from os.path import join, dirname
 
 from pytest_kivy.app import AsyncUnitApp
 
@@ -17,7 +23,9 @@ __all__ = ('trio_kivy_app', 'asyncio_kivy_app', 'async_kivy_app')
 #: NOTE: Kivy cannot be imported before or while the plugin is imported or
 # configured as that leads to pytest issues.
 
-environ['KIVY_USE_DEFAULTCONFIG'] = '1'
+# the tests must not depend on the user's Kivy config. Kivy only checks
+# whether it's set
+environ.setdefault('KIVY_USE_DEFAULTCONFIG', '1')
 
 _async_lib = environ.get('KIVY_EVENTLOOP', 'asyncio')
 if _async_lib == 'asyncio':
@@ -50,6 +58,38 @@ def pytest_addoption(parser):
              'references are kept to the app preventing it from being garbage '
              'collected.',
     )
+    group.addoption(
+        "--kivy-app-release-every",
+        type=int,
+        default=1,
+        metavar="N",
+        help='With --kivy-app-release, only check every Nth test that uses '
+             'a kivy app fixture. Defaults to 1 (every test).',
+    )
+    group.addoption(
+        "--kivy-leak-report",
+        default=None,
+        metavar="DIR",
+        help='When a release check finds a leaked app, write the shortest '
+             'chain of referrers keeping it alive (from a module global, '
+             'Kivy property observer, or Clock event) to a file in DIR and '
+             'include it in the failure.',
+    )
+    group.addoption(
+        "--kivy-leak-report-depth",
+        type=int,
+        default=10,
+        help='The maximum length of the referrer chains searched by '
+             '--kivy-leak-report. Defaults to 10.',
+    )
+    group.addoption(
+        "--kivy-app-release-module",
+        action="store_true",
+        default=False,
+        help='Whether to check at the end of each test module if all of its '
+             'test apps were released and no references were kept to the '
+             'app preventing them from being garbage collected.',
+    )
     group.addoption(
         "--kivy-app-release-end",
         action="store_true",
@@ -58,17 +98,511 @@ def pytest_addoption(parser):
              'were released and no references were kept to the app preventing'
              'them from being garbage collected.',
     )
+    group.addoption(
+        "--kivy-virtual-time",
+        action="store_true",
+        default=False,
+        help='Whether to drive the Kivy Clock of the test apps using a '
+             'virtual clock, so that sleeps and clock event timeouts are '
+             'simulated instead of being waited for in real time.',
+    )
+    group.addoption(
+        "--kivy-reuse-window",
+        default=None,
+        choices=('session', 'module'),
+        help='If provided, the Kivy window is created once and reused by all '
+             'the tests of the session or module, only resetting its state '
+             'between tests. It is verified after each test that the test '
+             'did not leak state into the window.',
+    )
+    group.addoption(
+        "--kivy-worker-home",
+        default=None,
+        help='When running with pytest-xdist, the directory under which each '
+             'worker gets its own KIVY_HOME directory (and so config and log '
+             'directory). Defaults to a "pytest-kivy" directory in the system '
+             'temp directory.',
+    )
+    group.addoption(
+        "--kivy-group-params",
+        action="store_true",
+        default=False,
+        help='Whether to reorder the tests of each module (or class) so that '
+             'tests sharing the same reused window (see --kivy-reuse-window) '
+             'and kivy app fixture parameters (e.g. window width/height and '
+             'app_cls) run consecutively. When pytest-xdist is used, the '
+             'tests with the same parameters are also placed in the same '
+             'xdist_group, so they run on the same worker with "--dist '
+             'loadgroup".',
+    )
+    group.addoption(
+        "--kivy-start-timeout",
+        type=float,
+        default=None,
+        help='The maximum number of seconds to wait for an app to start, '
+             'before failing the test. Defaults to 120 seconds.',
+    )
+    group.addoption(
+        "--kivy-start-settle",
+        default=None,
+        help='What to wait for after an app started, before it is returned '
+             'to the test. Either the number of clock frames to wait (it can '
+             'be zero), or "layout" to wait until the widget tree is laid '
+             'out. Defaults to 5 frames.',
+    )
+    group.addoption(
+        "--kivy-stop-timeout",
+        type=float,
+        default=None,
+        help='The maximum number of seconds to wait for an app to stop when '
+             'the test is done, before failing the test. Defaults to 60 '
+             'seconds.',
+    )
+    group.addoption(
+        "--kivy-fast-teardown",
+        action="store_true",
+        default=False,
+        help='Whether to skip waiting for the app to stop in an orderly '
+             'manner when the test is done. The app is canceled instead, so '
+             'its on_stop event is not dispatched.',
+    )
+    group.addoption(
+        "--kivy-snapshot-update",
+        action="store_true",
+        default=False,
+        help='Whether to (re)write the snapshot baseline images with the '
+             'current renders, rather than comparing against them.',
+    )
+    group.addoption(
+        "--kivy-snapshot-dir",
+        default=None,
+        help='The directory where the snapshot baseline images are stored. '
+             'Defaults to a "snapshots" directory next to each test file.',
+    )
+    group.addoption(
+        "--kivy-snapshot-diff-dir",
+        default=None,
+        help='The directory where the actual and diff images of failed '
+             'snapshot comparisons are written. Defaults to a "failures" '
+             'directory in the snapshot directory.',
+    )
+    group.addoption(
+        "--kivy-timings",
+        default=None,
+        metavar="PATH",
+        help='If provided, the time spent by each test in each phase of the '
+             'kivy app fixture (e.g. creating the window, starting the app, '
+             'sleeping, waiting for frames, and stopping the app) is written '
+             'as JSON to PATH.',
+    )
+    group.addoption(
+        "--kivy-timings-summary",
+        type=int,
+        default=0,
+        metavar="N",
+        help='If non-zero, the N slowest tests of each phase of the kivy app '
+             'fixture are listed in the terminal summary.',
+    )
+    group.addoption(
+        "--kivy-memtrace",
+        default=None,
+        metavar="PATH",
+        help='If provided, tracemalloc is used to measure the memory that '
+             'remains allocated after each kivy app fixture is done, and '
+             'where it was allocated. Each test is written as a line of JSON '
+             'to PATH as soon as it is done. Tracing slows the tests down '
+             'significantly.',
+    )
+    group.addoption(
+        "--kivy-memtrace-threshold",
+        type=float,
+        default=512,
+        metavar="KIB",
+        help='With --kivy-memtrace, tests whose memory grew by more than KIB '
+             'kibibytes are flagged and listed in the terminal summary. '
+             'Defaults to 512.',
+    )
+    group.addoption(
+        "--kivy-memtrace-top",
+        type=int,
+        default=10,
+        metavar="N",
+        help='With --kivy-memtrace, the number of source lines that '
+             'allocated the most memory recorded for each test. Defaults to '
+             '10.',
+    )
+    group.addoption(
+        "--kivy-census",
+        action="store_true",
+        default=False,
+        help='Whether to count the live widgets (by class), canvas '
+             'instruction groups, textures, Clock events, and Cache entries '
+             'after each kivy app fixture is done, and list the ones that '
+             'accumulated over the session in the terminal summary.',
+    )
+    group.addoption(
+        "--kivy-census-top",
+        type=int,
+        default=20,
+        metavar="N",
+        help='With --kivy-census, the number of kinds of objects that '
+             'accumulated the most listed in the terminal summary. Defaults '
+             'to 20.',
+    )
 
 
-@pytest.fixture(scope='session')
-def _app_release_list():
-    apps = []
+class _KivyTimingsReporter:
+    """Collects the phase times of the kivy app fixtures from the test
+    reports, so it works with pytest-xdist, and reports them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.timings = {}
+
+    def pytest_runtest_logreport(self, report):
+        if report.when != 'teardown':
+            return
+        for name, value in report.user_properties:
+            if name == 'kivy_timings':
+                self.timings[report.nodeid] = value
+
+    def _get_totals(self):
+        totals = {}
+        for times in self.timings.values():
+            for phase, value in times.items():
+                totals[phase] = totals.get(phase, 0) + value
+        return totals
+
+    def pytest_terminal_summary(self, terminalreporter):
+        n = self.config.getoption("kivy_timings_summary")
+        if not n or not self.timings:
+            return
+
+        terminalreporter.write_sep('=', 'kivy app phase timings')
+        for phase, total in sorted(
+                self._get_totals().items(), key=lambda item: -item[1]):
+            terminalreporter.write_line(f'{phase}: {total:.3f}s total')
+            slowest = sorted(
+                ((times.get(phase, 0), nodeid)
+                 for nodeid, times in self.timings.items()),
+                reverse=True)[:n]
+            for value, nodeid in slowest:
+                terminalreporter.write_line(f'    {value:.3f}s {nodeid}')
+
+    def pytest_sessionfinish(self, session):
+        filename = self.config.getoption("kivy_timings")
+        if filename is None or _get_xdist_worker_id(self.config) is not None:
+            return
+
+        with open(filename, 'w') as fh:
+            json.dump(
+                {'totals': self._get_totals(), 'tests': self.timings}, fh,
+                indent=2, sort_keys=True)
+
+
+class _KivyMemtraceReporter:
+    """Collects the memory growth of the kivy app fixtures from the test
+    reports, so it works with pytest-xdist, and writes each of them to the
+    file as it is reported so they are not kept in memory.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.flagged = []
+        self.threshold = config.getoption("kivy_memtrace_threshold") * 1024
+        self._fh = open(
+            config.getoption("kivy_memtrace"), 'w', encoding='utf8')
+
+    def pytest_runtest_logreport(self, report):
+        if report.when != 'teardown':
+            return
+        for name, value in report.user_properties:
+            if name != 'kivy_memtrace':
+                continue
+
+            flagged = value['size'] > self.threshold
+            if flagged:
+                self.flagged.append((value['size'], report.nodeid))
+            self._fh.write(json.dumps(
+                {'test': report.nodeid, 'flagged': flagged, **value}))
+            self._fh.write('\n')
+            self._fh.flush()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.flagged:
+            return
+
+        threshold = self.threshold / 1024
+        terminalreporter.write_sep(
+            '=', f'kivy app memory growth above {threshold:g} KiB')
+        for size, nodeid in sorted(self.flagged, reverse=True):
+            terminalreporter.write_line(f'{size / 1024:10.1f} KiB {nodeid}')
+
+    def pytest_sessionfinish(self, session):
+        self._fh.close()
+
+
+class _KivyCensusReporter:
+    """Sums the changes in the number of live Kivy objects after each test,
+    from the test reports so it works with pytest-xdist, and reports the
+    objects that accumulated over the session.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.growth = {}
+        self.largest = {}
+
+    def pytest_runtest_logreport(self, report):
+        if report.when != 'teardown':
+            return
+        for name, value in report.user_properties:
+            if name != 'kivy_census':
+                continue
+
+            for kind, change in value.items():
+                self.growth[kind] = self.growth.get(kind, 0) + change
+                if change > self.largest.get(kind, (0, ))[0]:
+                    self.largest[kind] = change, report.nodeid
+
+    def pytest_terminal_summary(self, terminalreporter):
+        n = self.config.getoption("kivy_census_top")
+        grown = sorted(
+            ((total, kind) for kind, total in self.growth.items()
+             if total > 0), reverse=True)[:n]
+        if not grown:
+            return
+
+        terminalreporter.write_sep(
+            '=', 'kivy objects accumulated over the session')
+        for total, kind in grown:
+            change, nodeid = self.largest[kind]
+            terminalreporter.write_line(
+                f'{total:+8d} {kind} (most by {nodeid}: {change:+d})')
+
+
+def _timings_enabled(config) -> bool:
+    return config.getoption("kivy_timings") is not None or \
+        bool(config.getoption("kivy_timings_summary"))
+
+
+def _get_xdist_worker_id(config) -> Optional[str]:
+    workerinput = getattr(config, 'workerinput', None)
+    if workerinput is not None:
+        return workerinput['workerid']
+    return environ.get('PYTEST_XDIST_WORKER', None)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "kivy_frame_budget(p95_ms=None, max_ms=None, mean_ms=None, "
+        "max_dropped=None, target_fps=60): fail the test if the frames "
+        "executed by the kivy app during the test, after the app started, "
+        "exceed the budgets (in milliseconds)")
+
+    if _timings_enabled(config) and \
+            _get_xdist_worker_id(config) is None:
+        config.pluginmanager.register(
+            _KivyTimingsReporter(config), 'kivy_timings_reporter')
+
+    if config.getoption("kivy_memtrace") is not None:
+        # the tests could run in a xdist worker, so trace in all processes
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            config._kivy_memtrace_started = True
+        if _get_xdist_worker_id(config) is None:
+            config.pluginmanager.register(
+                _KivyMemtraceReporter(config), 'kivy_memtrace_reporter')
+
+    if config.getoption("kivy_census") and \
+            _get_xdist_worker_id(config) is None:
+        config.pluginmanager.register(
+            _KivyCensusReporter(config), 'kivy_census_reporter')
+
+    # this must happen before kivy is imported by the tests
+    worker_id = _get_xdist_worker_id(config)
+    if worker_id is None:
+        return
+
+    root = config.getoption("kivy_worker_home")
+    if root is None:
+        root = join(tempfile.gettempdir(), 'pytest-kivy')
+    home = join(root, worker_id)
+    makedirs(home, exist_ok=True)
+
+    environ['KIVY_HOME'] = home
+    # each worker gets its own window, so don't show them all
+    environ.setdefault('KCFG_GRAPHICS_WINDOW_STATE', 'hidden')
+
+
+def pytest_unconfigure(config):
+    if getattr(config, '_kivy_memtrace_started', False):
+        tracemalloc.stop()
+
+
+_fixture_names = 'async_kivy_app', 'trio_kivy_app', 'asyncio_kivy_app'
+
+
+def _get_item_app_params(item) -> Optional[dict]:
+    """Returns the parameters of the kivy app fixture used by the item, or
+    None if it doesn't use one.
+    """
+    callspec = getattr(item, 'callspec', None)
+    if callspec is not None:
+        for name in _fixture_names:
+            if name in callspec.params:
+                return callspec.params[name]
+
+    if any(name in _fixture_names for name in
+           getattr(item, 'fixturenames', ())):
+        return {}
+    return None
+
+
+def _get_item_params_key(item) -> Optional[str]:
+    opts = _get_item_app_params(item)
+    if not opts:
+        return None
+
+    cls = opts.get('cls', AsyncUnitApp)
+    kwargs = opts.get('kwargs', {})
+    app_cls = opts.get('app_cls', None)
+    return 'kivy-{}-{}x{}-{}'.format(
+        cls.__name__,
+        kwargs.get('width', AsyncUnitApp.width),
+        kwargs.get('height', AsyncUnitApp.height),
+        getattr(app_cls, '__qualname__', app_cls),
+    )
+
+
+def _get_item_window_key(item) -> Optional[str]:
+    """Returns the :attr:`~pytest_kivy.app.AsyncUnitApp.reuse_window` key
+    that the kivy app fixture of the item will use, like
+    :func:`_get_request_config`.
+    """
+    opts = _get_item_app_params(item)
+    if opts is None:
+        return None
+
+    reuse_window = opts.get('kwargs', {}).get('reuse_window', None)
+    if reuse_window is not None:
+        return reuse_window
+
+    reuse_window = item.config.getoption("kivy_reuse_window")
+    if reuse_window == 'session':
+        return 'session'
+    if reuse_window == 'module':
+        return item.module.__name__
+    return None
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption("kivy_group_params"):
+        return
+
+    has_xdist = config.pluginmanager.hasplugin('xdist')
+    keys = {}
+    for item in items:
+        key = _get_item_params_key(item)
+        if key is not None and has_xdist:
+            item.add_marker(pytest.mark.xdist_group(name=key))
+        # tests sharing a window must run consecutively for it to be reused
+        keys[item] = _get_item_window_key(item) or '', key or ''
+
+    # only reorder the tests of the same module or class, so module and class
+    # scoped fixtures are not torn down and set up again. Each group of tests
+    # with the same key stays where the first of them was
+    start = 0
+    while start < len(items):
+        parent = items[start].parent
+        end = start + 1
+        while end < len(items) and items[end].parent is parent:
+            end += 1
+
+        order = {}
+        for item in items[start:end]:
+            order.setdefault(keys[item], len(order))
+        items[start:end] = sorted(
+            items[start:end], key=lambda item: order[keys[item]])
+        start = end
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_call(item):
+    # runs after the test passed, but before the fixtures are torn down (
+    # except with trio, which also tears them down within the test call)
+    frame_budget = getattr(item, '_kivy_frame_budget', None)
+    if frame_budget is None:
+        return
+    del item._kivy_frame_budget
+
+    from pytest_kivy.clock import check_frame_budget
+    recorder, budget = frame_budget
+    stats = recorder.get_stats()
+    item.user_properties.append(('kivy_frame_stats', stats))
+
+    error = check_frame_budget(stats, **budget)
+    if error is not None:
+        pytest.fail(error, pytrace=False)
 
-    yield apps
 
-    gc.collect()
+_app_release_counter = count()
+"""Counts the tests checked with ``--kivy-app-release``, to sample every Nth.
+"""
+
+
+def _get_unreleased_apps(apps):
+    """Returns the ``(app, request)`` weakref pairs of ``apps`` whose app is
+    still alive.
+
+    The apps are first checked without collecting, because apps that are not
+    part of a reference cycle are released as soon as the test is done. The
+    garbage collector is only run for the apps still alive, escalating from
+    the youngest generation to a full collection (generation 2).
+    """
+    alive = [(app, request) for app, request in apps if app() is not None]
+    for generation in (0, 1, 2):
+        if not alive:
+            break
+        gc.collect(generation)
+        alive = [(app, request) for app, request in alive if app() is not None]
+    return alive
+
+
+def _report_leaked_app(config, app, request) -> str:
+    """Searches for the referrers keeping the leaked app alive, if enabled
+    with ``--kivy-leak-report``, and writes them to a file. Returns the text
+    to add to the failure message.
+    """
+    report_dir = config.getoption("kivy_leak_report")
+    if report_dir is None:
+        return ''
+
+    from pytest_kivy.memory import find_referrer_chain, \
+        format_referrer_chain
+    chain, root, reason = find_referrer_chain(
+        app, max_depth=config.getoption("kivy_leak_report_depth"))
+    text = format_referrer_chain(app, chain, root, reason)
+    del chain
+
+    name = getattr(getattr(request, 'node', None), 'nodeid', repr(request))
+    makedirs(report_dir, exist_ok=True)
+    filename = join(report_dir, re.sub(r'[^\w.-]+', '_', name) + '.txt')
+    with open(filename, 'w', encoding='utf8') as fh:
+        fh.write(f'{name}\n\n{text}\n')
+
+    return f'\n{text}\n(written to "{filename}")'
+
+
+def _get_leak_message(config, apps, msg):
+    """Returns the failure message if any of the ``apps`` was not released,
+    otherwise None.
+    """
     alive_apps = []
-    for i, (app, request) in enumerate(apps[:-1]):
+    reports = []
+    for app, request in _get_unreleased_apps(apps):
         app = app()
         request = request()
         if request is None:
@@ -78,61 +612,194 @@ def _app_release_list():
             alive_apps.append((app, request))
             logging.error(
                 'Memory leak: failed to release app for test ' + repr(request))
+            reports.append(_report_leaked_app(config, app, request))
 
-    assert not alive_apps, 'Memory leak: failed to release all apps'
+    if not alive_apps:
+        return None
+    return msg + ''.join(reports)
 
 
-@pytest.fixture
-def _app_release():
-    app = []
+def _assert_apps_released(config, apps, msg):
+    message = _get_leak_message(config, apps, msg)
+    assert message is None, message
 
-    yield app
 
-    gc.collect()
+def _check_apps_after_test(apps, msg):
+    """Returns the ``(app, request)`` weakref pairs of ``apps`` whose test is
+    done. The others are checked once the fixtures of their test are torn
+    down (see :func:`pytest_runtest_teardown`), and reported with ``msg`` if
+    not released.
 
-    if not app:
+    pytest keeps the arguments of a test, including its app, until the
+    test's teardown is reported. So the app of a test still being torn down,
+    e.g. when a module's fixtures are torn down, cannot be released yet.
+    """
+    done = []
+    for app, request in apps:
+        item = getattr(request(), 'node', None)
+        if getattr(item, 'funcargs', None) is None:
+            done.append((app, request))
+            continue
+
+        checks = getattr(item, '_kivy_release_checks', None)
+        if checks is None:
+            checks = item._kivy_release_checks = []
+        checks.append(((app, request), msg))
+    return done
+
+
+def _record_census(item):
+    """Takes the census of the live Kivy objects once the test's app is
+    released, and adds its change from the previous census to the test's
+    report.
+    """
+    from pytest_kivy.memory import take_census, compare_census
+    census = take_census()
+    # the first test is the baseline, as it e.g. creates the window
+    last_census = getattr(item.config, '_kivy_census', None)
+    item.config._kivy_census = census
+    if last_census is not None:
+        item.user_properties.append(
+            ('kivy_census', compare_census(last_census, census)))
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_teardown(item, nextitem):
+    # runs after the fixtures of the test were torn down
+    checks = getattr(item, '_kivy_release_checks', None)
+    census = getattr(item, '_kivy_census', False)
+    snapshot = getattr(item, '_kivy_memtrace_snapshot', None)
+    if not checks and not census and snapshot is None:
+        return
+    item._kivy_release_checks = None
+    item._kivy_census = False
+    item._kivy_memtrace_snapshot = None
+    # pytest only releases the arguments of the test once its teardown is
+    # reported, but it's done with them, so release them now
+    item.funcargs = None
+
+    if census:
+        _record_census(item)
+    if snapshot is not None:
+        from pytest_kivy.memory import take_snapshot, compare_snapshots
+        growth = compare_snapshots(
+            snapshot, take_snapshot(),
+            item.config.getoption("kivy_memtrace_top"))
+        del snapshot
+        item.user_properties.append(('kivy_memtrace', growth))
+    if not checks:
         return
 
-    app, request = app[0]
-    app = app()
-    request = request()
-    if request is None:
-        request = '<dead request>'
+    messages = []
+    for app, msg in checks:
+        message = _get_leak_message(item.config, [app], msg)
+        if message is not None:
+            messages.append(message)
+    del checks
+
+    if messages:
+        pytest.fail('\n'.join(messages), pytrace=False)
+
+
+@pytest.fixture(scope='session')
+def _app_release_list(pytestconfig):
+    apps = []
+
+    yield apps
+
+    _assert_apps_released(
+        pytestconfig, apps[:-1], 'Memory leak: failed to release all apps')
 
-    assert app is None, \
-        f'Memory leak: failed to release app for test {request!r}'
+
+@pytest.fixture(scope='module')
+def _app_release_module_list(request):
+    apps = []
+
+    yield apps
+
+    msg = f'Memory leak: failed to release all apps of module ' \
+        f'{request.module.__name__}'
+    _assert_apps_released(
+        request.config, _check_apps_after_test(apps, msg), msg)
+
+
+@pytest.fixture
+def _app_release(request):
+    app = []
+
+    yield app
+
+    msg = f'Memory leak: failed to release app for test {request.node!r}'
+    _assert_apps_released(
+        request.config, _check_apps_after_test(app, msg), msg)
 
 
 def _get_request_config(
-        request, _app_release_list, _app_release
+        request, _app_release_list, _app_release_module_list, _app_release
 ) -> Tuple[Type[AsyncUnitApp], dict, Optional[Callable], list]:
     opts = getattr(request, 'param', {})
     cls = opts.get('cls', AsyncUnitApp)
-    kwargs = opts.get('kwargs', {})
+    kwargs = dict(opts.get('kwargs', {}))
+    if request.config.getoption("kivy_virtual_time"):
+        kwargs.setdefault('virtual_time', True)
+    reuse_window = request.config.getoption("kivy_reuse_window")
+    if reuse_window == 'session':
+        kwargs.setdefault('reuse_window', 'session')
+    elif reuse_window == 'module':
+        kwargs.setdefault('reuse_window', request.module.__name__)
+
+    start_timeout = request.config.getoption("kivy_start_timeout")
+    if start_timeout is not None:
+        kwargs.setdefault('start_timeout', start_timeout)
+    start_settle = request.config.getoption("kivy_start_settle")
+    if start_settle is not None:
+        if start_settle != 'layout':
+            start_settle = int(start_settle)
+        kwargs.setdefault('start_settle_frames', start_settle)
+
+    stop_timeout = request.config.getoption("kivy_stop_timeout")
+    if stop_timeout is not None:
+        kwargs.setdefault('stop_timeout', stop_timeout)
+    if request.config.getoption("kivy_fast_teardown"):
+        kwargs.setdefault('fast_teardown', True)
+    if _timings_enabled(request.config):
+        kwargs.setdefault('record_phase_times', True)
+
+    snapshot_dir = request.config.getoption("kivy_snapshot_dir")
+    if snapshot_dir is None:
+        snapshot_dir = join(dirname(str(request.fspath)), 'snapshots')
+    kwargs.setdefault('snapshot_dir', snapshot_dir)
+    if request.config.getoption("kivy_snapshot_update"):
+        kwargs.setdefault('snapshot_update', True)
+    snapshot_diff_dir = request.config.getoption("kivy_snapshot_diff_dir")
+    if snapshot_diff_dir is not None:
+        kwargs.setdefault('snapshot_diff_dir', snapshot_diff_dir)
     app_cls = opts.get('app_cls', None)
 
     app_list = None
     if request.config.getoption("kivy_app_release"):
-        app_list = _app_release
+        every = max(request.config.getoption("kivy_app_release_every"), 1)
+        if not next(_app_release_counter) % every:
+            app_list = _app_release
+    elif request.config.getoption("kivy_app_release_module"):
+        app_list = _app_release_module_list
     elif request.config.getoption("kivy_app_release_end"):
         app_list = _app_release_list
     return cls, kwargs, app_cls, app_list
 
 
-@pytest.fixture
-async def trio_kivy_app(
-        request, nursery, _app_release_list, _app_release
-) -> AsyncUnitApp:
-    """Fixture yielding a :class:`~pytest_kivy.app.AsyncUnitApp` using
-    explicitly trio as backend for the async library.
-
-    pytest-trio and trio must be installed, and ``trio_mode = true`` must be
-    set in pytest.ini.
-    """
+async def _create_kivy_app(
+        request, _app_release_list, _app_release_module_list, _app_release,
+        **kw):
     cls, kwargs, app_cls, app_list = _get_request_config(
-        request, _app_release_list, _app_release)
+        request, _app_release_list, _app_release_module_list, _app_release)
 
-    async with cls(nursery=nursery, async_lib='trio', **kwargs) as app:
+    snapshot = None
+    if request.config.getoption("kivy_memtrace") is not None:
+        from pytest_kivy.memory import take_snapshot
+        snapshot = take_snapshot()
+
+    async with cls(**kw, **kwargs) as app:
         if app_list is not None:
             app_list.append((weakref.ref(app), weakref.ref(request)))
 
@@ -140,37 +807,72 @@ async def trio_kivy_app(
             await app(app_cls)
         app.raise_startup_exception()
 
+        recorder = None
+        marker = request.node.get_closest_marker('kivy_frame_budget')
+        if marker is not None:
+            budget = dict(marker.kwargs)
+            recorder = app.record_frames(
+                target_fps=budget.pop('target_fps', 60.),
+                include_startup=False)
+            recorder.start()
+            # it's checked by pytest_runtest_call once the test is done
+            request.node._kivy_frame_budget = recorder, budget
+
         yield app
+        if recorder is not None:
+            recorder.stop()
         await app.wait_stop_app()
 
+    if _timings_enabled(request.config):
+        request.node.user_properties.append(
+            ('kivy_timings', dict(app.phase_times)))
+
+    # don't count the app in the memory checks, it's released once the
+    # fixture is done
+    del app
+    # these are taken by pytest_runtest_teardown, once the app is released
+    if request.config.getoption("kivy_census"):
+        request.node._kivy_census = True
+    if snapshot is not None:
+        request.node._kivy_memtrace_snapshot = snapshot
+
 
 @pytest.fixture
-async def asyncio_kivy_app(
-        request, event_loop, _app_release_list, _app_release) -> AsyncUnitApp:
+async def trio_kivy_app(
+        request, nursery, _app_release_list, _app_release_module_list,
+        _app_release
+) -> AsyncUnitApp:
     """Fixture yielding a :class:`~pytest_kivy.app.AsyncUnitApp` using
-    explicitly asyncio as backend for the async library.
+    explicitly trio as backend for the async library.
 
-    pytest-asyncio must be installed.
+    pytest-trio and trio must be installed, and ``trio_mode = true`` must be
+    set in pytest.ini.
     """
-    cls, kwargs, app_cls, app_list = _get_request_config(
-        request, _app_release_list, _app_release)
+    async for app in _create_kivy_app(
+            request, _app_release_list, _app_release_module_list,
+            _app_release, nursery=nursery, async_lib='trio'):
+        yield app
 
-    async with cls(
-            event_loop=event_loop, async_lib='asyncio', **kwargs) as app:
-        if app_list is not None:
-            app_list.append((weakref.ref(app), weakref.ref(request)))
 
-        if app_cls is not None:
-            await app(app_cls)
-        app.raise_startup_exception()
+@pytest.fixture
+async def asyncio_kivy_app(
+        request, event_loop, _app_release_list, _app_release_module_list,
+        _app_release) -> AsyncUnitApp:
+    """Fixture yielding a :class:`~pytest_kivy.app.AsyncUnitApp` using
+    explicitly asyncio as backend for the async library.
 
+    pytest-asyncio must be installed.
+    """
+    async for app in _create_kivy_app(
+            request, _app_release_list, _app_release_module_list,
+            _app_release, event_loop=event_loop, async_lib='asyncio'):
         yield app
-        await app.wait_stop_app()
 
 
 @pytest.fixture
 async def async_kivy_app(
-        request, _app_release_list, _app_release, _nursery, _event_loop
+        request, _app_release_list, _app_release_module_list, _app_release,
+        _nursery, _event_loop
 ) -> AsyncUnitApp:
     """Fixture yielding a :class:`~pytest_kivy.app.AsyncUnitApp` using
     trio or asyncio as backend for the async library, depending on
@@ -180,18 +882,8 @@ async def async_kivy_app(
     ``trio_mode = true`` must be set in pytest.ini. If using asyncio,
     pytest-asyncio must be installed.
     """
-    cls, kwargs, app_cls, app_list = _get_request_config(
-        request, _app_release_list, _app_release)
-
-    async with cls(
-            nursery=_nursery, event_loop=_event_loop, async_lib=_async_lib,
-            **kwargs) as app:
-        if app_list is not None:
-            app_list.append((weakref.ref(app), weakref.ref(request)))
-
-        if app_cls is not None:
-            await app(app_cls)
-        app.raise_startup_exception()
-
+    async for app in _create_kivy_app(
+            request, _app_release_list, _app_release_module_list,
+            _app_release, nursery=_nursery, event_loop=_event_loop,
+            async_lib=_async_lib):
         yield app
-        await app.wait_stop_app()
@@ -0,0 +1,182 @@
+"""Recorder
+===========
+
+Records the input of a Kivy app, e.g. while a developer manually runs the app
+or while a test drives it with the :class:`~pytest_kivy.app.AsyncUnitApp`
+helpers, so it can later be replayed by
+:meth:`~pytest_kivy.app.AsyncUnitApp.do_replay_input`.
+
+Recordings are NDJSON streams, with one JSON object per line. The first line
+is a header with the format ``version`` and the ``window`` size. Each
+following line is an event with its time ``t`` in seconds, relative to the
+start of the recording, and its type ``e``:
+
+* ``"touch"``: a touch ``etype`` (``"begin"``, ``"update"``, or ``"end"``),
+  with the touch ``id`` and its ``sx`` and ``sy`` position, normalized to the
+  ``[0, 1]`` range of the window size.
+* ``"key_down"``: ``key``, ``scancode``, ``codepoint``, and ``modifiers``.
+* ``"key_up"``: ``key`` and ``scancode``.
+* ``"textinput"``: ``text``.
+
+E.g.::
+
+    with InputRecorder('session.ndjson'):
+        runTouchApp(root)
+
+Recordings are written and read one line at a time, so they are never fully
+loaded into memory.
+"""
+
+import json
+import time
+from itertools import count
+
+__all__ = ('InputRecorder', 'iter_recording', 'recording_version')
+
+recording_version = 1
+"""The version of the recording format."""
+
+
+class InputRecorder:
+    """Records the touch, key, and text input events dispatched by the Kivy
+    ``Window`` into a NDJSON stream.
+
+    ``output`` is either a filename or a text file-like object. If a filename,
+    the file is opened by :meth:`start` and closed by :meth:`stop`.
+    ``time_func`` is the function returning the current time in seconds,
+    e.g. :meth:`~pytest_kivy.app.AsyncUnitApp.get_time` to follow the virtual
+    time of a test app. It defaults to :func:`time.perf_counter`.
+
+    It can be used as a context manager, which calls :meth:`start` and
+    :meth:`stop`.
+    """
+
+    output = None
+
+    time_func = None
+
+    _fh = None
+
+    _ts0 = 0
+
+    _touch_ids = {}
+
+    _touch_counter = None
+
+    _bindings = []
+
+    def __init__(self, output, time_func=time.perf_counter):
+        super().__init__()
+        self.output = output
+        self.time_func = time_func
+        self._touch_ids = {}
+        self._touch_counter = count()
+        self._bindings = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _write(self, item):
+        self._fh.write(json.dumps(item, separators=(',', ':')))
+        self._fh.write('\n')
+
+    def _write_event(self, name, **kwargs):
+        kwargs['t'] = round(self.time_func() - self._ts0, 6)
+        kwargs['e'] = name
+        self._write(kwargs)
+
+    def _on_motion(self, window, etype, me):
+        if not me.is_touch:
+            return
+
+        touch_ids = self._touch_ids
+        uid = touch_ids.get(me.uid, None)
+        if uid is None:
+            uid = touch_ids[me.uid] = next(self._touch_counter)
+        if etype == 'end':
+            del touch_ids[me.uid]
+
+        # the position is only scaled to the window after the listeners
+        self._write_event('touch', etype=etype, id=uid, sx=me.sx, sy=me.sy)
+
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        self._write_event(
+            'key_down', key=key, scancode=scancode, codepoint=codepoint,
+            modifiers=list(modifiers or []))
+
+    def _on_key_up(self, window, key, scancode, *largs):
+        self._write_event('key_up', key=key, scancode=scancode)
+
+    def _on_textinput(self, window, text):
+        self._write_event('textinput', text=text)
+
+    def start(self):
+        """Starts recording the events.
+        """
+        from kivy.core.window import Window
+        if isinstance(self.output, str):
+            self._fh = open(self.output, 'w', encoding='utf8')
+        else:
+            self._fh = self.output
+
+        self._ts0 = self.time_func()
+        self._touch_ids = {}
+        self._touch_counter = count()
+        self._write({
+            'version': recording_version, 'window': list(Window.size)})
+
+        for name, callback in (
+                ('on_motion', self._on_motion),
+                ('on_key_down', self._on_key_down),
+                ('on_key_up', self._on_key_up),
+                ('on_textinput', self._on_textinput)):
+            uid = Window.fbind(name, callback)
+            self._bindings.append((name, callback, uid))
+
+    def stop(self):
+        """Stops recording the events and flushes (or closes, if it was
+        opened by us) the output.
+        """
+        from kivy.core.window import Window
+        for name, callback, uid in self._bindings:
+            Window.unbind_uid(name, uid)
+        self._bindings = []
+
+        if self._fh is None:
+            return
+        if isinstance(self.output, str):
+            self._fh.close()
+        else:
+            self._fh.flush()
+        self._fh = None
+
+
+def iter_recording(source):
+    """Lazily reads a recording created by :class:`InputRecorder`, and yields
+    its header followed by each event, as dicts.
+
+    ``source`` is a filename, or an iterable of lines (e.g. a text file-like
+    object).
+    """
+    if isinstance(source, str):
+        with open(source, encoding='utf8') as fh:
+            yield from iter_recording(fh)
+        return
+
+    header = None
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+
+        item = json.loads(line)
+        if header is None:
+            header = item
+            if header.get('version', None) != recording_version:
+                raise ValueError(
+                    f'Unsupported recording version {header.get("version")}')
+        yield item
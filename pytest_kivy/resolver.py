@@ -7,8 +7,11 @@ a specific widget in the widget tree.
 """
 
 from collections import deque
+from itertools import islice
 
-__all__ = ('WidgetResolver', 'ResolverNotFound')
+from pytest_kivy.selector import compile_selector, _class_names
+
+__all__ = ('WidgetResolver', 'ResolverNotFound', 'WidgetIndex')
 
 _unique_value = object
 
@@ -17,29 +20,266 @@ class ResolverNotFound(ValueError):
     pass
 
 
+class WidgetIndex:
+    """Index of all the widgets in the widget tree rooted at ``root``, keyed
+    by the value of some of their attributes, so that widgets can be looked up
+    without walking the tree.
+
+    ``keys`` are the names of the widget attributes to index. Additionally,
+    the special key ``"cls"`` indexes the widgets by their class, so they can
+    be looked up by the name of their class or any of its base classes (like
+    selectors match them), and the key ``"id"`` indexes them by the names
+    under which they are listed in the ``ids`` of their kv rule's root widget.
+
+    The index is built once and then kept up to date incrementally, by binding
+    to the ``children`` and ``ids`` properties of every widget in the tree and
+    to the indexed attributes that are Kivy properties. Changes to attributes
+    that are not Kivy properties cannot be observed, so a key is not indexed
+    (see :meth:`is_indexed`) while any widget in the tree has it as a plain
+    attribute. Attributes that are created on a widget after it was added to
+    the tree are not indexed either. Unhashable values are not indexed.
+
+    Call :meth:`close` to unbind from the widgets when done with the index.
+    """
+
+    root = None
+
+    keys = ()
+
+    _children = {}
+
+    _values = {}
+
+    _widget_values = {}
+
+    _bindings = {}
+
+    _plain_keys = {}
+
+    def __init__(self, root, keys=('text', )):
+        super(WidgetIndex, self).__init__()
+        self.root = root
+        self.keys = tuple(keys)
+        self._children = {}
+        self._values = {key: {} for key in ('cls', 'id') + self.keys}
+        self._widget_values = {}
+        self._bindings = {}
+        self._plain_keys = {key: set() for key in self.keys}
+        self._add_tree(root)
+
+    def __contains__(self, widget):
+        return id(widget) in self._children
+
+    def _add_value(self, widget, key, value, owner=None):
+        # the value is removed from the index when owner is removed
+        try:
+            widgets = self._values[key].setdefault(value, {})
+        except TypeError:
+            # unhashable
+            return
+        widgets[id(widget)] = widget
+        owner = widget if owner is None else owner
+        self._widget_values[id(owner)].append((key, value, widget))
+
+    def _remove_value(self, widget, key, value):
+        widgets = self._values[key].get(value, None)
+        if widgets is None:
+            return
+        widgets.pop(id(widget), None)
+        if not widgets:
+            del self._values[key][value]
+
+    def _update_value(self, key, widget, value):
+        values = self._widget_values[id(widget)]
+        for i, (k, old_value, w) in enumerate(values):
+            if k == key and w is widget:
+                del values[i]
+                self._remove_value(widget, key, old_value)
+                break
+        self._add_value(widget, key, value)
+
+    def _add_ids(self, widget, ids):
+        for name, child in ids.items():
+            self._add_value(
+                getattr(child, '__self__', child), 'id', name, widget)
+
+    def _update_ids(self, widget, ids):
+        values = self._widget_values[id(widget)]
+        for item in [item for item in values if item[0] == 'id']:
+            values.remove(item)
+            self._remove_value(item[2], 'id', item[1])
+        self._add_ids(widget, ids)
+
+    def _update_children(self, widget, children):
+        old_children = self._children[id(widget)]
+        new_ids = {id(child) for child in children}
+        old_ids = {id(child) for child in old_children}
+
+        for child in old_children:
+            if id(child) not in new_ids:
+                self._remove_tree(child)
+        self._children[id(widget)] = list(children)
+        for child in children:
+            if id(child) not in old_ids:
+                self._add_tree(child)
+
+    def _add_tree(self, widget):
+        fifo = deque([widget])
+        while fifo:
+            widget = fifo.popleft()
+            # widget is already in the index (e.g. re-added before removal)
+            if id(widget) in self._children:
+                continue
+
+            children = self._children[id(widget)] = list(widget.children)
+            self._widget_values[id(widget)] = []
+            bindings = self._bindings[id(widget)] = [
+                ('children', widget.fbind('children', self._update_children))]
+
+            self._add_value(widget, 'cls', widget.__class__)
+            for key in self.keys:
+                value = getattr(widget, key, _unique_value)
+                if value is _unique_value:
+                    continue
+
+                self._add_value(widget, key, value)
+                if widget.property(key, quiet=True) is not None:
+                    bindings.append(
+                        (key, widget.fbind(key, self._update_value, key)))
+                else:
+                    self._plain_keys[key].add(id(widget))
+
+            self._add_ids(widget, getattr(widget, 'ids', {}))
+            if widget.property('ids', quiet=True) is not None:
+                bindings.append(
+                    ('ids', widget.fbind('ids', self._update_ids)))
+
+            fifo.extend(children)
+
+    def _remove_tree(self, widget):
+        fifo = deque([widget])
+        while fifo:
+            widget = fifo.popleft()
+            children = self._children.pop(id(widget), None)
+            if children is None:
+                continue
+
+            for key, uid in self._bindings.pop(id(widget)):
+                widget.unbind_uid(key, uid)
+            for key, value, w in self._widget_values.pop(id(widget)):
+                self._remove_value(w, key, value)
+            for widgets in self._plain_keys.values():
+                widgets.discard(id(widget))
+
+            fifo.extend(children)
+
+    def close(self):
+        """Unbinds from all the widgets and clears the index.
+        """
+        self._remove_tree(self.root)
+        for values in self._values.values():
+            values.clear()
+
+    def is_indexed(self, key, value) -> bool:
+        """Whether :meth:`lookup` can be used for the given key and value.
+
+        It's False for keys that are a plain attribute, rather than a Kivy
+        property, of any widget in the tree.
+        """
+        if key not in self._values or self._plain_keys.get(key):
+            return False
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def lookup(self, key, value) -> list:
+        """Returns the list of widgets in the tree whose ``key`` is
+        ``value``, in no particular order.
+
+        ``key`` must be one of :attr:`keys`, or ``"cls"`` or ``"id"``. For
+        ``"cls"``, ``value`` is the name of the class or a base class.
+        """
+        if key == 'cls':
+            return [
+                w for cls, widgets in self._values['cls'].items()
+                if value in _class_names(cls) for w in widgets.values()]
+
+        widgets = self._values[key].get(value, {})
+        if key == 'id':
+            # the ids can refer to widgets outside the tree
+            return [w for w in widgets.values() if id(w) in self._children]
+        return list(widgets.values())
+
+
+def _get_tree_path(widget, ancestors):
+    """Returns the index ``i`` of the first widget in ``ancestors`` that is
+    ``widget`` or one of its parents, and the path of child indices from that
+    ancestor to ``widget``. Returns None if there's no such ancestor.
+
+    ``ancestors`` maps the ``id`` of each ancestor to its index ``i``.
+    Sorting the widgets by ``(i, len(path), path)`` sorts them in the order
+    they'd be visited by a breadth first search starting from each ancestor
+    in turn.
+    """
+    path = []
+    while id(widget) not in ancestors:
+        parent = widget.parent
+        if parent is None or parent is widget:
+            return None
+        path.append(parent.children.index(widget))
+        widget = parent
+
+    path.reverse()
+    return ancestors[id(widget)], len(path), path
+
+
 class WidgetResolver:
     """It assumes that the widget tree strictly forms a DAG.
+
+    Besides keyword filters and functions, :meth:`down`, :meth:`up`, and
+    :meth:`family_up` accept selector strings (see :mod:`pytest_kivy.selector`)
+    as positional filters. For :meth:`down`, the selector is scoped to the
+    base widget and the tree is walked using the compiled selector, skipping
+    subtrees in which it cannot match.
+
+    If a :class:`WidgetIndex` is given as ``index``, :meth:`down` and
+    :meth:`family_up` use it to find candidates matching the keyword filters
+    of the indexed keys, or the class name or ``#id`` of a selector, instead
+    of walking the whole tree. Keys the index
+    cannot keep up to date (see :meth:`WidgetIndex.is_indexed`) fall back to
+    walking the tree. So the resolved widget is the same one that would be
+    found without the index, except for attributes created on a widget after
+    it was added to the indexed tree.
     """
 
     base_widget = None
 
     matched_widget = None
 
+    index = None
+
     _kwargs_filter = {}
 
     _funcs_filter = []
 
-    def __init__(self, base_widget, **kwargs):
+    _selectors = []
+
+    def __init__(self, base_widget, index=None, **kwargs):
         self.base_widget = base_widget
+        self.index = index
         self._kwargs_filter = {}
         self._funcs_filter = []
+        self._selectors = []
         super(WidgetResolver, self).__init__(**kwargs)
 
     def __call__(self):
         if self.matched_widget is not None:
             return self.matched_widget
 
-        if not self._kwargs_filter and not self._funcs_filter:
+        if not self._kwargs_filter and not self._funcs_filter and \
+                not self._selectors:
             return self.base_widget
         return None
 
@@ -48,66 +288,152 @@ class WidgetResolver:
         return self
 
     def match_funcs(self, funcs_filter=()):
-        self._funcs_filter.extend(funcs_filter)
+        for func in funcs_filter:
+            if isinstance(func, str):
+                self._selectors.append(compile_selector(func))
+            else:
+                self._funcs_filter.append(func)
         return self
 
-    def check_widget(self, widget):
-        if not all(func(widget) for func in self._funcs_filter):
-            return False
+    def check_widget(self, widget, scope=None):
+        """Returns whether the widget matches all the filters. ``scope`` is
+        the scope of the selectors (see
+        :meth:`~pytest_kivy.selector.CompiledSelector.matches`).
+        """
+        return self._check_widget(widget, scope, self._selectors)
 
+    def _check_widget(self, widget, scope, selectors):
         for attr, val in self._kwargs_filter.items():
             if getattr(widget, attr, _unique_value) != val:
                 return False
 
+        if not all(func(widget) for func in self._funcs_filter):
+            return False
+
+        for selector in selectors:
+            if not selector.matches(widget, scope):
+                return False
+
         return True
 
+    def _format_filters(self):
+        return '<{}, {}, {}>'.format(
+            self._kwargs_filter, self._funcs_filter, self._selectors)
+
     def not_found(self, op):
         raise ResolverNotFound(
-            'Cannot find widget matching <{}, {}> starting from base '
+            'Cannot find widget matching {} starting from base '
             'widget "{}" doing "{}" traversal'.format(
-                self._kwargs_filter, self._funcs_filter, self.base_widget, op))
+                self._format_filters(), self.base_widget, op))
+
+    def _iter_indexed(
+            self, ancestors, scope=None, max_levels=None, max_depth=None):
+        """Uses the index to get the widgets matching the filters, in the
+        order they'd be visited by a breadth first search starting from each
+        of ``ancestors`` in turn.
+
+        Returns an iterator of the widgets, or None if the index cannot be
+        used for the filters.
+        """
+        index = self.index
+        if index is None or ancestors[-1] not in index:
+            return None
+
+        # the special keys are not attributes, so only selectors use them
+        keys = [
+            (key, value) for key, value in self._kwargs_filter.items()
+            if key in index.keys]
+        for selector in self._selectors:
+            if selector.cls is not None:
+                keys.append(('cls', selector.cls))
+            keys.extend(('id', name) for name in selector.ids)
+
+        candidates = None
+        for key, value in keys:
+            if index.is_indexed(key, value):
+                widgets = index.lookup(key, value)
+                if candidates is None or len(widgets) < len(candidates):
+                    candidates = widgets
+        if candidates is None:
+            return None
+
+        ancestors = {id(w): i for i, w in enumerate(ancestors)}
+        paths = []
+        for widget in candidates:
+            path = _get_tree_path(widget, ancestors)
+            if path is None or \
+                    max_levels is not None and path[0] > max_levels or \
+                    max_depth is not None and path[1] > max_depth:
+                continue
+            paths.append((path, widget))
+        paths.sort(key=lambda item: item[0])
+
+        return (
+            widget for _, widget in paths if self.check_widget(widget, scope))
+
+    def _iter_down(self, max_depth=None):
+        base_widget = self.base_widget
+        widgets = self._iter_indexed(
+            [base_widget], base_widget, max_depth=max_depth)
+        if widgets is not None:
+            yield from widgets
+            return
+
+        if self._selectors:
+            selector, *selectors = self._selectors
+            for widget in selector.iter_down(base_widget, max_depth):
+                if self._check_widget(widget, base_widget, selectors):
+                    yield widget
+            return
 
-    def down(self, *__funcs_filter, **kwargs_filter):
-        self.match(**kwargs_filter)
-        self.match_funcs(__funcs_filter)
         check = self.check_widget
+        level = [base_widget]
+        depth = 0
+        while level and (max_depth is None or depth <= max_depth):
+            next_level = []
+            for widget in level:
+                if check(widget):
+                    yield widget
+                next_level.extend(widget.children)
 
-        fifo = deque([self.base_widget])
-        while fifo:
-            widget = fifo.popleft()
-            if check(widget):
-                return WidgetResolver(base_widget=widget)
-
-            fifo.extend(widget.children)
-
-        self.not_found('down')
+            level = next_level
+            depth += 1
 
-    def up(self, *__funcs_filter, **kwargs_filter):
-        self.match(**kwargs_filter)
-        self.match_funcs(__funcs_filter)
+    def _iter_up(self, max_levels=None):
         check = self.check_widget
 
         parent = self.base_widget
-        while parent is not None:
+        level = 0
+        while parent is not None and (
+                max_levels is None or level <= max_levels):
             if check(parent):
-                return WidgetResolver(base_widget=parent)
+                yield parent
 
             new_parent = parent.parent
             # Window is its own parent oO
             if new_parent is parent:
                 break
             parent = new_parent
+            level += 1
 
-        self.not_found('up')
-
-    def family_up(self, *__funcs_filter, **kwargs_filter):
-        self.match(**kwargs_filter)
-        self.match_funcs(__funcs_filter)
+    def _iter_family_up(self, max_levels=None):
         check = self.check_widget
 
-        base_widget = self.base_widget
+        ancestors = [self.base_widget]
+        while max_levels is None or len(ancestors) <= max_levels:
+            parent = ancestors[-1].parent
+            # Window is its own parent oO
+            if parent is None or parent is ancestors[-1]:
+                break
+            ancestors.append(parent)
+
+        widgets = self._iter_indexed(ancestors, max_levels=max_levels)
+        if widgets is not None:
+            yield from widgets
+            return
+
         already_checked_base = None
-        while base_widget is not None:
+        for base_widget in ancestors:
             fifo = deque([base_widget])
             while fifo:
                 widget = fifo.popleft()
@@ -116,15 +442,171 @@ class WidgetResolver:
                     continue
 
                 if check(widget):
-                    return WidgetResolver(base_widget=widget)
+                    yield widget
 
                 fifo.extend(widget.children)
 
             already_checked_base = base_widget
-            new_base_widget = base_widget.parent
-            # Window is its own parent oO
-            if new_base_widget is base_widget:
-                break
-            base_widget = new_base_widget
+
+    def _iter_resolvers(self, widgets, limit):
+        for widget in islice(widgets, limit):
+            yield WidgetResolver(base_widget=widget, index=self.index)
+
+    def down(self, *__funcs_filter, **kwargs_filter):
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+
+        for widget in self._iter_down():
+            return WidgetResolver(base_widget=widget, index=self.index)
+
+        self.not_found('down')
+
+    def down_all(
+            self, *__funcs_filter, max_depth=None, limit=None,
+            **kwargs_filter):
+        """Like :meth:`down`, but returns a generator that lazily yields a
+        :class:`WidgetResolver` for each matching widget, in breadth first
+        order, as the tree is traversed.
+
+        ``max_depth``, if not None, is the maximum depth below the base widget
+        to search (``0`` only checks the base widget). ``limit``, if not None,
+        is the maximum number of matches to yield.
+        """
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+        return self._iter_resolvers(self._iter_down(max_depth), limit)
+
+    def up(self, *__funcs_filter, **kwargs_filter):
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+
+        for widget in self._iter_up():
+            return WidgetResolver(base_widget=widget, index=self.index)
+
+        self.not_found('up')
+
+    def up_all(
+            self, *__funcs_filter, max_levels=None, limit=None,
+            **kwargs_filter):
+        """Like :meth:`up`, but returns a generator that lazily yields a
+        :class:`WidgetResolver` for each matching parent, starting with the
+        base widget.
+
+        ``max_levels``, if not None, is the maximum number of parents to go up
+        (``0`` only checks the base widget). ``limit``, if not None, is the
+        maximum number of matches to yield.
+        """
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+        return self._iter_resolvers(self._iter_up(max_levels), limit)
+
+    def family_up(self, *__funcs_filter, **kwargs_filter):
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+
+        for widget in self._iter_family_up():
+            return WidgetResolver(base_widget=widget, index=self.index)
 
         self.not_found('family_up')
+
+    def family_up_all(
+            self, *__funcs_filter, max_levels=None, limit=None,
+            **kwargs_filter):
+        """Like :meth:`family_up`, but returns a generator that lazily yields
+        a :class:`WidgetResolver` for each matching widget, in the order they
+        are visited.
+
+        ``max_levels``, if not None, is the maximum number of parents to go up
+        (``0`` only searches the subtree of the base widget). ``limit``, if
+        not None, is the maximum number of matches to yield.
+        """
+        self.match(**kwargs_filter)
+        self.match_funcs(__funcs_filter)
+        return self._iter_resolvers(self._iter_family_up(max_levels), limit)
+
+    def _make_query(self, query):
+        resolver = WidgetResolver(
+            base_widget=self.base_widget, index=self.index)
+        items = query if isinstance(query, (list, tuple)) else [query]
+        for item in items:
+            if isinstance(item, dict):
+                resolver.match(**item)
+            else:
+                resolver.match_funcs([item])
+        return resolver
+
+    def down_many(self, queries, max_depth=None) -> dict:
+        """Resolves many widgets below the base widget in a single breadth
+        first pass over the tree, rather than doing a :meth:`down` traversal
+        for each widget.
+
+        ``queries`` is a mapping from a name to a query, where a query is a
+        selector string, a filter function, a dict of keyword filters, or a
+        list or tuple combining those. E.g.::
+
+            widgets = resolver.down_many({
+                'ok': "Button[text='OK']",
+                'name': {'hint_text': 'Name'},
+                'slider': [lambda w: w.max == 10, 'Slider'],
+            })
+
+        The filters added to this resolver with :meth:`match` are not used.
+        Returns a dict mapping each name to a :class:`WidgetResolver` of the
+        first widget matching the query, in the same order as :meth:`down`
+        would find it. ``max_depth``, if not None, is the maximum depth below
+        the base widget to search. If any of the queries didn't match, a
+        single :class:`ResolverNotFound` listing all of them is raised.
+
+        If this resolver has an ``index``, the queries it can be used for (see
+        :meth:`down`) are resolved with the index, and only the others are
+        resolved in the shared pass over the tree.
+        """
+        base_widget = self.base_widget
+        resolvers = {
+            name: self._make_query(query) for name, query in queries.items()}
+        results = {}
+
+        pending = {}
+        for name, resolver in resolvers.items():
+            widgets = resolver._iter_indexed(
+                [base_widget], base_widget, max_depth=max_depth)
+            if widgets is None:
+                pending[name] = resolver
+                continue
+
+            widget = next(widgets, None)
+            if widget is not None:
+                results[name] = WidgetResolver(
+                    base_widget=widget, index=self.index)
+
+        level = [base_widget]
+        depth = 0
+        while pending and level and (max_depth is None or depth <= max_depth):
+            next_level = []
+            for widget in level:
+                matched = [
+                    name for name, resolver in pending.items()
+                    if resolver.check_widget(widget, base_widget)]
+                for name in matched:
+                    del pending[name]
+                    results[name] = WidgetResolver(
+                        base_widget=widget, index=self.index)
+                if not pending:
+                    break
+
+                next_level.extend(widget.children)
+
+            level = next_level
+            depth += 1
+
+        missing = [name for name in queries if name not in results]
+        if missing:
+            raise ResolverNotFound(
+                'Cannot find widgets starting from base widget "{}" doing '
+                '"down_many" traversal: {}'.format(
+                    base_widget, ', '.join(
+                        '{} matching {}'.format(
+                            name, resolvers[name]._format_filters())
+                        for name in missing)))
+
+        return {name: results[name] for name in queries}
@@ -0,0 +1,388 @@
+"""Selector
+===========
+
+A compact selector syntax for locating widgets with a
+:class:`~pytest_kivy.resolver.WidgetResolver`, e.g.::
+
+    resolver.down("BoxLayout > Button[text='OK']:visible")
+
+A selector is a list of compound selectors separated by combinators. A
+compound selector is made of, in order:
+
+* An optional class name, e.g. ``Button``, that matches widgets whose class or
+  any of its base classes has that name. ``*`` matches any widget.
+* Any number of ``#name``, that matches widgets listed under ``name`` in the
+  ``ids`` of one of their parents (i.e. the kv ``id``).
+* Any number of ``[attr=value]`` or ``[attr!=value]``, that matches widgets
+  whose attribute ``attr`` is (or is not) equal to ``value``. ``value`` is a
+  Python literal (e.g. ``'OK'``, ``12``, or ``True``), or an unquoted string.
+* Any number of pseudo-classes: ``:visible``, that matches widgets with a
+  non-zero size whose opacity and that of all their parents is non-zero,
+  ``:disabled``, and ``:enabled``.
+
+Combinators are either whitespace, meaning the right compound selector must
+match a descendant of the widget matched by the left compound, or ``>``,
+meaning it must match a direct child. A selector may start with ``>``,
+meaning the first compound selector must match a direct child of the widget
+the search starts from.
+
+Selectors are compiled once by :func:`compile_selector` and cached by their
+string.
+"""
+
+import re
+import ast
+import weakref
+from collections import deque
+from functools import lru_cache
+
+__all__ = ('compile_selector', 'CompiledSelector', 'SelectorSyntaxError')
+
+_unique_value = object
+
+_token_pat = re.compile(r'''
+    (?P<child>\s*>\s*)
+  | (?P<descendant>\s+)
+  | (?P<cls>\*|[A-Za-z_]\w*)
+  | \#(?P<id>[A-Za-z_]\w*)
+  | \[\s*(?P<attr>[A-Za-z_]\w*)\s*(?P<op>!?=)\s*
+    (?P<value>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[^\]\s]+)\s*\]
+  | :(?P<pseudo>[A-Za-z_][\w-]*)
+''', re.VERBOSE)
+
+_token_kinds = 'child', 'descendant', 'cls', 'id', 'attr', 'pseudo'
+
+# relative cost of each type of check, cheapest first
+_cost_cls = 0
+_cost_attr = 1
+_cost_pseudo = 2
+_cost_id = 3
+_cost_visible = 4
+
+
+class SelectorSyntaxError(ValueError):
+    pass
+
+
+_class_names_cache = weakref.WeakKeyDictionary()
+"""Maps widget classes to the names of their classes and base classes. It
+doesn't keep the classes alive, e.g. the ones defined by a test.
+"""
+
+
+def _class_names(cls):
+    try:
+        return _class_names_cache[cls]
+    except KeyError:
+        names = _class_names_cache[cls] = frozenset(
+            c.__name__ for c in cls.__mro__)
+        return names
+
+
+def _get_id_name(widget, name):
+    parent = widget
+    while parent is not None:
+        ids = getattr(parent, 'ids', None)
+        if ids:
+            match = ids.get(name, None)
+            if match is not None and \
+                    getattr(match, '__self__', match) is widget:
+                return True
+
+        new_parent = parent.parent
+        # Window is its own parent oO
+        if new_parent is parent:
+            break
+        parent = new_parent
+    return False
+
+
+def _is_visible(widget):
+    if widget.width <= 0 or widget.height <= 0:
+        return False
+
+    while widget is not None:
+        if getattr(widget, 'opacity', 1) <= 0:
+            return False
+
+        parent = widget.parent
+        if parent is widget:
+            break
+        widget = parent
+    return True
+
+
+def _parse_value(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+class _Compound:
+    """A compiled compound selector.
+    """
+
+    __slots__ = ('checks', 'cls', 'ids', 'visible', 'child')
+
+    def __init__(self, child):
+        # whether it must be a direct child of the previous compound
+        self.child = child
+        self.checks = []
+        self.cls = None
+        self.ids = []
+        self.visible = False
+
+    def add_check(self, cost, func):
+        self.checks.append((cost, func))
+
+    def finalize(self):
+        self.checks.sort(key=lambda item: item[0])
+        self.checks = tuple(func for _, func in self.checks)
+
+    def match(self, widget):
+        for check in self.checks:
+            if not check(widget):
+                return False
+        return True
+
+
+class CompiledSelector:
+    """A selector compiled by :func:`compile_selector`.
+    """
+
+    selector = ''
+
+    anchored = False
+    """Whether the selector starts with ``>``."""
+
+    _compounds = ()
+
+    _needs_visible = ()
+
+    def __init__(self, selector, compounds, anchored):
+        super().__init__()
+        self.selector = selector
+        self._compounds = compounds
+        self.anchored = anchored
+
+        # for each compound, whether it or any following compound must be
+        # visible. Such compounds cannot match in the subtree of an invisible
+        # widget
+        needs_visible = []
+        visible = False
+        for compound in reversed(compounds):
+            visible = visible or compound.visible
+            needs_visible.append(visible)
+        self._needs_visible = tuple(reversed(needs_visible))
+
+    def __repr__(self):
+        return f'<Selector "{self.selector}">'
+
+    @property
+    def cls(self):
+        """The name of the class (or base class) that the matched widget must
+        have, or None.
+        """
+        return self._compounds[-1].cls
+
+    @property
+    def ids(self):
+        """The ``#id`` names that the matched widget must have.
+        """
+        return self._compounds[-1].ids
+
+    def matches(self, widget, scope=None) -> bool:
+        """Returns whether the widget matches the selector.
+
+        If ``scope`` is not None, the widgets matched by the compound
+        selectors must be ``scope`` or its descendants, and for an anchored
+        selector the first compound must match a direct child of ``scope``.
+        If ``scope`` is None, they can be any of the widget's parents and the
+        selector may not be anchored.
+        """
+        if scope is None and self.anchored:
+            raise ValueError(
+                f'Anchored selector "{self.selector}" requires a scope')
+        compounds = self._compounds
+        if not compounds[-1].match(widget):
+            return False
+        return self._match_parents(widget, len(compounds) - 1, scope)
+
+    def _match_parents(self, widget, i, scope):
+        # compound i matched widget, check that the compounds before it match
+        # its parents
+        compounds = self._compounds
+        if i == 0:
+            if scope is None:
+                return True
+            if self.anchored:
+                return widget.parent is scope and widget is not scope
+            return True
+
+        child = compounds[i].child
+        compound = compounds[i - 1]
+        while widget is not scope:
+            parent = widget.parent
+            # Window is its own parent oO
+            if parent is None or parent is widget:
+                return False
+            widget = parent
+
+            if compound.match(widget) and \
+                    self._match_parents(widget, i - 1, scope):
+                return True
+            if child:
+                return False
+        return False
+
+    def iter_down(self, base_widget, max_depth=None):
+        """Yields the widgets in the tree rooted at ``base_widget`` that match
+        the selector (scoped to ``base_widget``), in breadth first order.
+
+        Subtrees in which the selector cannot match, e.g. because a child
+        combinator didn't match or because a ``:visible`` widget is required
+        in an invisible subtree, are not visited.
+        """
+        compounds = self._compounds
+        needs_visible = self._needs_visible
+        last = len(compounds) - 1
+
+        # each item is the widget, the indices of the compounds that could
+        # match the widget, and its depth
+        if self.anchored:
+            fifo = deque(
+                (child, (0, ), 1) for child in base_widget.children)
+        else:
+            fifo = deque([(base_widget, (0, ), 0)])
+
+        while fifo:
+            widget, states, depth = fifo.popleft()
+            invisible = getattr(widget, 'opacity', 1) <= 0
+
+            matched = False
+            next_states = []
+            for i in states:
+                if invisible and needs_visible[i]:
+                    continue
+
+                compound = compounds[i]
+                if not compound.child and i not in next_states:
+                    # it can still match a descendant
+                    next_states.append(i)
+
+                if compound.match(widget):
+                    if i == last:
+                        matched = True
+                    elif i + 1 not in next_states:
+                        next_states.append(i + 1)
+
+            if matched:
+                yield widget
+
+            if next_states and (max_depth is None or depth < max_depth):
+                next_states = tuple(next_states)
+                fifo.extend(
+                    (child, next_states, depth + 1)
+                    for child in widget.children)
+
+
+@lru_cache(maxsize=512)
+def compile_selector(selector: str) -> CompiledSelector:
+    """Compiles the selector string into a :class:`CompiledSelector`.
+
+    The results are cached by the selector string. Within each compound
+    selector, the checks are ordered from the cheapest (class name) to the
+    most expensive (``#id`` and ``:visible``, which look at the parents).
+    """
+    text = selector.strip()
+    if not text:
+        raise SelectorSyntaxError('Empty selector')
+
+    compounds = []
+    anchored = False
+    compound = None
+    # whether the next compound must be a direct child
+    child = False
+    has_cls = False
+
+    pos = 0
+    while pos < len(text):
+        m = _token_pat.match(text, pos)
+        if m is None:
+            raise SelectorSyntaxError(
+                f'Invalid selector "{selector}" at position {pos}')
+        pos = m.end()
+        kind = next(
+            name for name in _token_kinds if m.group(name) is not None)
+
+        if kind in ('child', 'descendant'):
+            if compound is None:
+                if not compounds and kind == 'child' and not anchored:
+                    anchored = True
+                    child = True
+                    continue
+                raise SelectorSyntaxError(
+                    f'Invalid combinator in selector "{selector}"')
+
+            compound.finalize()
+            compounds.append(compound)
+            compound = None
+            child = kind == 'child'
+            continue
+
+        if compound is None:
+            compound = _Compound(child)
+            has_cls = False
+
+        if kind == 'cls':
+            if has_cls or compound.checks:
+                raise SelectorSyntaxError(
+                    f'Class name must start the compound in "{selector}"')
+            has_cls = True
+            name = m.group('cls')
+            if name != '*':
+                compound.cls = name
+                compound.add_check(
+                    _cost_cls,
+                    lambda w, name=name: name in _class_names(w.__class__))
+        elif kind == 'id':
+            name = m.group('id')
+            compound.ids.append(name)
+            compound.add_check(
+                _cost_id, lambda w, name=name: _get_id_name(w, name))
+        elif kind == 'attr':
+            attr = m.group('attr')
+            value = _parse_value(m.group('value'))
+            if m.group('op') == '=':
+                compound.add_check(
+                    _cost_attr,
+                    lambda w, attr=attr, value=value:
+                    getattr(w, attr, _unique_value) == value)
+            else:
+                compound.add_check(
+                    _cost_attr,
+                    lambda w, attr=attr, value=value:
+                    getattr(w, attr, _unique_value) != value)
+        else:
+            pseudo = m.group('pseudo')
+            if pseudo == 'visible':
+                compound.visible = True
+                compound.add_check(_cost_visible, _is_visible)
+            elif pseudo == 'disabled':
+                compound.add_check(
+                    _cost_pseudo, lambda w: getattr(w, 'disabled', False))
+            elif pseudo == 'enabled':
+                compound.add_check(
+                    _cost_pseudo, lambda w: not getattr(w, 'disabled', False))
+            else:
+                raise SelectorSyntaxError(
+                    f'Unknown pseudo-class ":{pseudo}" in "{selector}"')
+
+    if compound is None:
+        raise SelectorSyntaxError(
+            f'Selector "{selector}" ends with a combinator')
+    compound.finalize()
+    compounds.append(compound)
+
+    return CompiledSelector(selector, tuple(compounds), anchored)
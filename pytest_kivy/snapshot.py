@@ -0,0 +1,265 @@
+"""Snapshot
+===========
+
+Golden-image comparison of rendered widgets, used by
+:meth:`~pytest_kivy.app.AsyncUnitApp.assert_snapshot`.
+
+Images are NumPy ``uint8`` arrays of shape ``(height, width, 4)`` (RGBA), with
+the rows starting from the bottom of the widget, like
+:meth:`~pytest_kivy.app.AsyncUnitApp.get_widget_pixels`. They are stored as
+PNG files, top row first, so they can be viewed with any image viewer.
+
+Baselines are decoded once and cached in memory for the rest of the session,
+unless the file changed on disk. NumPy must be installed to use snapshots.
+"""
+
+import os
+import zlib
+import struct
+from os.path import join, dirname, basename, splitext
+
+__all__ = (
+    'read_png', 'write_png', 'load_baseline', 'compare_images',
+    'make_diff_image', 'check_snapshot')
+
+_png_signature = b'\x89PNG\r\n\x1a\n'
+
+# PNG color type to the number of channels
+_png_channels = {0: 1, 2: 3, 4: 2, 6: 4}
+
+_baselines = {}
+"""Maps the filename of the baselines to their modification time and decoded
+image.
+"""
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack(
+        '>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def write_png(filename, image, compress_level=6):
+    """Writes the ``(height, width, 4)`` RGBA image to a PNG file.
+    """
+    import numpy as np
+    height, width, _ = image.shape
+
+    rows = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    # no filtering for each row
+    rows[:, 0] = 0
+    rows[:, 1:] = image[::-1].reshape((height, width * 4))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    with open(filename, 'wb') as fh:
+        fh.write(_png_signature)
+        fh.write(_png_chunk(b'IHDR', header))
+        fh.write(_png_chunk(
+            b'IDAT', zlib.compress(rows.tobytes(), compress_level)))
+        fh.write(_png_chunk(b'IEND', b''))
+
+
+def _unfilter_rows(rows, bpp):
+    import numpy as np
+    height, stride = rows.shape[0], rows.shape[1] - 1
+    filters = rows[:, 0]
+    data = rows[:, 1:]
+    if not filters.any():
+        return data
+
+    out = np.empty((height, stride), dtype=np.uint8)
+    prev = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        kind = filters[y]
+        line = data[y]
+        if kind == 0:
+            cur = line
+        elif kind == 1:
+            cur = np.cumsum(
+                line.reshape((-1, bpp)), axis=0, dtype=np.uint8).ravel()
+        elif kind == 2:
+            cur = line + prev
+        elif kind in (3, 4):
+            line = line.tolist()
+            up = prev.tolist()
+            cur = [0] * stride
+            for i in range(stride):
+                left = cur[i - bpp] if i >= bpp else 0
+                if kind == 3:
+                    pred = (left + up[i]) // 2
+                else:
+                    up_left = up[i - bpp] if i >= bpp else 0
+                    p = left + up[i] - up_left
+                    pa, pb, pc = abs(p - left), abs(p - up[i]), abs(
+                        p - up_left)
+                    if pa <= pb and pa <= pc:
+                        pred = left
+                    elif pb <= pc:
+                        pred = up[i]
+                    else:
+                        pred = up_left
+                cur[i] = (line[i] + pred) & 0xff
+            cur = np.array(cur, dtype=np.uint8)
+        else:
+            raise ValueError(f'Unknown PNG filter type {kind}')
+
+        out[y] = cur
+        prev = out[y]
+    return out
+
+
+def read_png(filename):
+    """Reads a 8-bit, non-interlaced, PNG file and returns it as a
+    ``(height, width, 4)`` RGBA image.
+    """
+    import numpy as np
+    with open(filename, 'rb') as fh:
+        data = fh.read()
+    if not data.startswith(_png_signature):
+        raise ValueError(f'"{filename}" is not a PNG file')
+
+    header = None
+    idat = []
+    pos = len(_png_signature)
+    while pos < len(data):
+        size, = struct.unpack_from('>I', data, pos)
+        tag = data[pos + 4:pos + 8]
+        chunk = data[pos + 8:pos + 8 + size]
+        pos += size + 12
+
+        if tag == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif tag == b'IDAT':
+            idat.append(chunk)
+        elif tag == b'IEND':
+            break
+
+    if header is None:
+        raise ValueError(f'"{filename}" does not have a PNG header')
+    width, height, depth, color, _, _, interlace = header
+    if depth != 8 or interlace or color not in _png_channels:
+        raise ValueError(
+            f'"{filename}" is not a non-interlaced, 8-bit, gray or RGB(A) '
+            f'PNG file')
+
+    channels = _png_channels[color]
+    rows = np.frombuffer(
+        zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(
+        (height, width * channels + 1))
+    pixels = _unfilter_rows(rows, channels).reshape(
+        (height, width, channels))
+
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    if channels <= 2:
+        image[:, :, :3] = pixels[:, :, :1]
+    else:
+        image[:, :, :3] = pixels[:, :, :3]
+    if channels in (2, 4):
+        image[:, :, 3] = pixels[:, :, -1]
+    else:
+        image[:, :, 3] = 255
+    return image[::-1]
+
+
+def load_baseline(filename):
+    """Returns the read-only image stored in the PNG file, decoding it only
+    if it wasn't decoded before during the session, or if it changed since.
+    """
+    mtime = os.stat(filename).st_mtime_ns
+    cached = _baselines.get(filename, None)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    image = read_png(filename)
+    image.flags.writeable = False
+    _baselines[filename] = mtime, image
+    return image
+
+
+def compare_images(image, baseline, tolerance=0, masks=()):
+    """Compares two images of the same shape and returns a ``(height,
+    width)`` boolean array indicating the pixels that don't match.
+
+    A pixel matches if the absolute difference of each of its channels is at
+    most ``tolerance``. ``tolerance`` is either a single value for all the
+    channels, or a RGBA 4-tuple of values for each channel.
+
+    ``masks`` is a list of ``(x, y, width, height)`` rectangles, in widget
+    coordinates, whose pixels are ignored.
+    """
+    import numpy as np
+    diff = np.abs(image.astype(np.int16) - baseline.astype(np.int16))
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.int16), (4, ))
+    mismatched = (diff > tolerance).any(axis=2)
+
+    for x, y, w, h in masks:
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        # clamp both ends, a mask that starts off the image covers less of it
+        x0, x1 = max(x, 0), max(x + w, 0)
+        y0, y1 = max(y, 0), max(y + h, 0)
+        mismatched[y0:y1, x0:x1] = False
+    return mismatched
+
+
+def make_diff_image(image, baseline, mismatched):
+    """Returns an image that shows the dimmed baseline with the mismatched
+    pixels (as returned by :func:`compare_images`) in red.
+    """
+    import numpy as np
+    diff = np.empty(baseline.shape, dtype=np.uint8)
+    diff[:, :, :3] = baseline[:, :, :3] // 4
+    diff[:, :, 3] = 255
+    diff[mismatched] = 255, 0, 0, 255
+    return diff
+
+
+def check_snapshot(
+        image, filename, update=False, tolerance=0, masks=(),
+        max_mismatch=0, diff_dir=None):
+    """Compares the image to the baseline stored in ``filename``.
+
+    Returns None if it matches, otherwise an error message describing the
+    mismatch. If ``update``, the baseline is (re)written with the image
+    instead.
+
+    It matches if at most ``max_mismatch`` pixels mismatch (see
+    :func:`compare_images` for ``tolerance`` and ``masks``). On a mismatch,
+    the image and a diff image are written to ``diff_dir`` (defaulting to a
+    ``failures`` directory next to the baseline) as ``<name>-actual.png``
+    and ``<name>-diff.png``.
+    """
+    if update:
+        os.makedirs(dirname(filename) or '.', exist_ok=True)
+        write_png(filename, image)
+        _baselines.pop(filename, None)
+        return None
+
+    if not os.path.exists(filename):
+        return (
+            f'Snapshot baseline "{filename}" does not exist. Run with '
+            f'--kivy-snapshot-update to create it')
+
+    baseline = load_baseline(filename)
+    if baseline.shape != image.shape:
+        return (
+            f'Snapshot size {image.shape[1]}x{image.shape[0]} does not match '
+            f'baseline "{filename}" size '
+            f'{baseline.shape[1]}x{baseline.shape[0]}')
+
+    mismatched = compare_images(image, baseline, tolerance, masks)
+    count = int(mismatched.sum())
+    if count <= max_mismatch:
+        return None
+
+    if diff_dir is None:
+        diff_dir = join(dirname(filename), 'failures')
+    os.makedirs(diff_dir, exist_ok=True)
+    name = splitext(basename(filename))[0]
+    actual_filename = join(diff_dir, f'{name}-actual.png')
+    diff_filename = join(diff_dir, f'{name}-diff.png')
+    write_png(actual_filename, image)
+    write_png(diff_filename, make_diff_image(image, baseline, mismatched))
+
+    return (
+        f'{count} pixels (out of {mismatched.size}) do not match snapshot '
+        f'baseline "{filename}". See "{actual_filename}" and '
+        f'"{diff_filename}"')
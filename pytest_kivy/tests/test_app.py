@@ -111,6 +111,268 @@ async def test_drag_scroll_view_pixels(async_kivy_app):
     assert not b
     assert a == 255
 
+    pixels = async_kivy_app.get_widget_pixels(root)
+    assert pixels.shape == (int(root.height), int(root.width), 4)
+    assert tuple(pixels[100, 100, i] for i in range(4)) == (0, 255, 0, 255)
+    assert len(async_kivy_app._fbo_pool) == 1
+
+    from kivy.core.window import Window
+    (r, g, b, a), = async_kivy_app.get_widget_pos_pixel(Window, [(100, 100)])
+    assert (r, g, b, a) == (0, 255, 0, 255)
+    assert Window.canvas in Window.render_context.children
+
+
+async def test_widget_pixels_array(async_kivy_app):
+    np = pytest.importorskip('numpy')
+
+    def create_app():
+        from kivy.app import App
+        from kivy.lang import Builder
+        from textwrap import dedent
+
+        kv = """
+        Widget:
+            canvas:
+                Color:
+                    rgba: 1, 0, 0, 1
+                Rectangle:
+                    pos: 0, 0
+                    size: self.width / 2, self.height
+                Color:
+                    rgba: 0, 0, 1, 1
+                Rectangle:
+                    pos: self.width / 2, 0
+                    size: self.width / 2, self.height
+        """
+
+        class TestApp(App):
+            def build(self):
+                return Builder.load_string(dedent(kv))
+
+        return TestApp()
+
+    await async_kivy_app(create_app)
+    root = async_kivy_app.app.root
+    w, h = int(root.width), int(root.height)
+
+    pixels = async_kivy_app.get_widget_pixels(root, as_array=True)
+    assert pixels.shape == (h, w, 4)
+    assert (pixels[:, :w // 2] == [255, 0, 0, 255]).all()
+    assert (pixels[:, w // 2:] == [0, 0, 255, 255]).all()
+
+    xs, ys = np.meshgrid(np.arange(w), np.arange(h))
+    positions = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    values = async_kivy_app.get_widget_pos_pixel(
+        root, positions, as_array=True)
+    assert values.shape == (w * h, 4)
+    assert (values == pixels.reshape((-1, 4))).all()
+
+    assert async_kivy_app.get_widget_pos_pixel(
+        root, [(1, 1), (w - 1, 1)]) == [(255, 0, 0, 255), (0, 0, 255, 255)]
+    assert len(async_kivy_app._fbo_pool) == 1
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+async def test_widget_pos_pixel_bounds(async_kivy_app, monkeypatch, use_numpy):
+    import sys
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        # the fallback is used if numpy cannot be imported
+        monkeypatch.setitem(sys.modules, 'numpy', None)
+
+    def widget_app():
+        from kivy.app import App
+        from kivy.uix.widget import Widget
+
+        class TestApp(App):
+            def build(self):
+                return Widget()
+
+        return TestApp()
+
+    await async_kivy_app(widget_app)
+    root = async_kivy_app.app.root
+    w, h = int(root.width), int(root.height)
+
+    corners = [(0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1)]
+    assert len(async_kivy_app.get_widget_pos_pixel(root, corners)) == 4
+    for pos in [(-1, 0), (0, -1), (w, 0), (0, h), (w + 10, h + 10)]:
+        with pytest.raises(ValueError, match='outside'):
+            async_kivy_app.get_widget_pos_pixel(root, [(0, 0), pos])
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'width': 300, 'height': 200}}],
+    indirect=True)
+async def test_widget_region_stats(async_kivy_app):
+    pytest.importorskip('numpy')
+
+    def create_app():
+        from kivy.app import App
+        from kivy.lang import Builder
+        from textwrap import dedent
+
+        kv = """
+        BoxLayout:
+            padding: 50, 0, 0, 0
+            Widget:
+                id: child
+                canvas:
+                    Color:
+                        rgba: 1, 0, 0, 1
+                    Rectangle:
+                        pos: self.x, self.y
+                        size: self.width / 2, self.height
+        """
+
+        class TestApp(App):
+            def build(self):
+                return Builder.load_string(dedent(kv))
+
+        return TestApp()
+
+    await async_kivy_app(create_app)
+    root = async_kivy_app.app.root
+    child = root.ids.child
+
+    # left padding is empty, then red for 125 pixels, then empty
+    stats = async_kivy_app.get_region_stats(root)
+    assert stats['min'] == (0, 0, 0, 0)
+    assert stats['max'] == (255, 0, 0, 255)
+    assert stats['mean'] == pytest.approx(
+        (255 * 125 / 300, 0, 0, 255 * 125 / 300))
+
+    stats = async_kivy_app.get_region_stats(root, (50, 0, 125, 200))
+    assert stats['min'] == stats['max'] == (255, 0, 0, 255)
+
+    histogram = async_kivy_app.get_region_histogram(root, bins=4)
+    assert histogram.shape == (4, 4)
+    assert histogram[0].tolist() == [175 * 200, 0, 0, 125 * 200]
+    assert histogram[1].tolist() == [300 * 200, 0, 0, 0]
+
+    assert async_kivy_app.get_region_match_fraction(
+        root, (255, 0, 0, 255)) == pytest.approx(125 / 300)
+    assert async_kivy_app.get_region_match_fraction(
+        root, (255, 0, 0, 255), (0, 0, 100, 10)) == pytest.approx(0.5)
+    assert async_kivy_app.get_region_match_fraction(
+        root, (250, 0, 0, 255), (0, 0, 100, 10), tolerance=5) == \
+        pytest.approx(0.5)
+
+    # the child's region in window coordinates
+    assert async_kivy_app.get_region_match_fraction(
+        child, (255, 0, 0, 255), (50, 0, 125, 200),
+        window_coords=True) == 1
+
+
+async def test_wait_for_pixels(async_kivy_app):
+    def create_app():
+        from kivy.app import App
+        from kivy.lang import Builder
+        from textwrap import dedent
+
+        kv = """
+        Widget:
+            color: 1, 0, 0, 1
+            canvas:
+                Color:
+                    rgba: self.color
+                Rectangle:
+                    pos: 100, 50
+                    size: 10, 10
+        """
+
+        class TestApp(App):
+            def build(self):
+                return Builder.load_string(dedent(kv))
+
+        return TestApp()
+
+    await async_kivy_app(create_app)
+    root = async_kivy_app.app.root
+    red = 255, 0, 0, 255
+
+    values = await async_kivy_app.wait_for_pixels(
+        root, [(100, 50), (109, 59), (110, 60)],
+        lambda values: values[0] == values[1] == red)
+    assert values == [red, red, (0, 0, 0, 0)]
+    assert list(async_kivy_app._fbo_pool) == [(11, 11)]
+
+    with pytest.raises(TimeoutError):
+        await async_kivy_app.wait_for_pixels(
+            root, [(105, 55)], lambda values: values[0] != red,
+            max_frames=2)
+
+    from kivy.clock import Clock
+
+    def set_color(*largs):
+        root.color = 0, 1, 0, 1
+    Clock.schedule_once(set_color)
+    values = await async_kivy_app.wait_for_pixels(
+        root, [(105, 55)], lambda values: values[0] != red)
+    assert values == [(0, 255, 0, 255)]
+    assert list(async_kivy_app._fbo_pool) == [(11, 11), (1, 1)]
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'width': 400, 'height': 200}}],
+    indirect=True)
+async def test_region_pixels_child_pos(async_kivy_app):
+    pytest.importorskip('numpy')
+
+    def create_app():
+        from kivy.app import App
+        from kivy.lang import Builder
+        from textwrap import dedent
+
+        kv = """
+        FloatLayout:
+            Widget:
+                id: child
+                size_hint: None, None
+                pos: 200, 0
+                size: 100, 100
+                canvas:
+                    Color:
+                        rgba: 1, 0, 0, 1
+                    Rectangle:
+                        pos: self.pos
+                        size: self.width / 2, self.height
+        """
+
+        class TestApp(App):
+            def build(self):
+                return Builder.load_string(dedent(kv))
+
+        return TestApp()
+
+    await async_kivy_app(create_app)
+    await async_kivy_app.wait_clock_frames(2)
+    child = async_kivy_app.app.root.ids.child
+    red = 255, 0, 0, 255
+
+    pixels = async_kivy_app.get_region_pixels(
+        child, (200, 0, 100, 100), window_coords=True)
+    assert pixels.shape == (100, 100, 4)
+    assert tuple(pixels[:, :50].reshape((-1, 4)).min(axis=0)) == red
+    assert not pixels[:, 50:].any()
+
+    # the part of the region outside the child is clipped
+    pixels = async_kivy_app.get_region_pixels(
+        child, (150, -10, 100, 200), window_coords=True)
+    assert pixels.shape == (100, 50, 4)
+
+    stats = async_kivy_app.get_region_stats(
+        child, (200, 0, 100, 100), window_coords=True)
+    assert stats['min'] == (0, 0, 0, 0)
+    assert stats['max'] == red
+    assert stats['mean'] == pytest.approx((127.5, 0, 0, 127.5))
+
+    values = await async_kivy_app.wait_for_pixels(
+        child, [(200, 0), (249, 99), (250, 50)],
+        lambda values: values[0] == values[1] == red)
+    assert values == [red, red, (0, 0, 0, 0)]
+
 
 def create_text_app(text=''):
     from kivy.app import App
@@ -143,6 +405,46 @@ async def test_text_app(async_kivy_app):
     assert root.text == 'AAAAqqq'
 
 
+@pytest.mark.parametrize('chars_per_frame', [1, 7, None])
+async def test_type_text(async_kivy_app, chars_per_frame):
+    await async_kivy_app(create_text_app)
+    root = async_kivy_app.app.root
+    await exhaust(async_kivy_app.do_touch_down_up(widget=root))
+
+    text = 'Hello, World!\nsecond line with é'
+    chunks = []
+    async for state, value in async_kivy_app.type_text(
+            text, chars_per_frame=chars_per_frame):
+        assert state == 'text'
+        chunks.append(value)
+
+    assert root.text == text
+    assert ''.join(chunks) == text
+    assert len(chunks) == -(-len(text) // (chars_per_frame or len(text)))
+
+
+async def test_type_text_modifiers(async_kivy_app):
+    from kivy.core.window import Window
+    await async_kivy_app(create_text_app)
+    root = async_kivy_app.app.root
+    await exhaust(async_kivy_app.do_touch_down_up(widget=root))
+
+    modifiers = []
+
+    def on_key_down(window, key, scancode, codepoint, mods):
+        modifiers.append((codepoint, list(mods)))
+
+    Window.bind(on_key_down=on_key_down)
+    try:
+        await exhaust(async_kivy_app.type_text('aB1!é', chars_per_frame=None))
+    finally:
+        Window.unbind(on_key_down=on_key_down)
+
+    assert root.text == 'aB1!é'
+    assert modifiers == [
+        ('a', []), ('B', ['shift']), ('1', []), ('!', ['shift']), ('é', [])]
+
+
 async def test_replace_text_app(async_kivy_app):
     await async_kivy_app(partial(create_text_app, text='hello'))
 
@@ -212,6 +514,159 @@ async def test_touch_drag_path(async_kivy_app):
         assert isclose(y1, y2, abs_tol=1)
 
 
+@pytest.mark.parametrize(
+    'async_kivy_app', [
+        {'kwargs': {'height': 200, 'width': 200}},
+        {'kwargs': {'height': 200, 'width': 200, 'virtual_time': True}},
+    ], indirect=True)
+@pytest.mark.parametrize('moves_per_frame', [4, None])
+async def test_touch_drag_path_burst(async_kivy_app, moves_per_frame):
+    path = list(zip(range(5, 95, 5), range(20, 110, 5)))
+    pos = []
+    times = []
+
+    def path_app():
+        from kivy.app import App
+        from kivy.uix.widget import Widget
+
+        class MyWidget(Widget):
+            def on_touch_move(self, touch):
+                pos.append(tuple(map(int, touch.pos)))
+                times.append(touch.time_update)
+                return super().on_touch_move(touch)
+
+        class TestApp(App):
+            def build(self):
+                return MyWidget()
+
+        return TestApp()
+
+    await async_kivy_app(path_app)
+
+    from kivy.clock import Clock
+    frames = []
+    async for state, _ in async_kivy_app.do_touch_drag_path(
+            path, moves_per_frame=moves_per_frame):
+        frames.append((state, Clock.frames))
+
+    moves = [item for item in frames if item[0] == 'move']
+    n = len(path) - 1
+    assert len(moves) == (1 if moves_per_frame is None else -(-n // 4))
+    assert len(set(frame for _, frame in frames)) == len(frames)
+
+    # every move was dispatched, with increasing times
+    assert len(pos) == n
+    for (x1, y1), (x2, y2) in zip(pos, path[1:]):
+        assert isclose(x1, x2, abs_tol=1)
+        assert isclose(y1, y2, abs_tol=1)
+    assert times == sorted(times)
+    assert len(set(times)) == n
+    # the moves are spread over about the duration of the drag (.2s)
+    assert times[-1] - times[0] < 1
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [
+        {'kwargs': {'height': 200, 'width': 200}},
+        {'kwargs': {'height': 200, 'width': 200, 'virtual_time': True}},
+    ], indirect=True)
+async def test_touch_drag_path_burst_fling(async_kivy_app):
+    velocities = []
+
+    def scroll_app():
+        from kivy.app import App
+        from kivy.uix.scrollview import ScrollView
+        from kivy.uix.widget import Widget
+
+        class FlingScrollView(ScrollView):
+            def on_touch_up(self, touch):
+                result = super().on_touch_up(touch)
+                velocities.append(self.effect_y.velocity)
+                return result
+
+        class TestApp(App):
+            def build(self):
+                view = FlingScrollView(
+                    do_scroll_x=False, scroll_timeout=10000)
+                view.add_widget(Widget(size_hint_y=None, height=2000))
+                return view
+
+        return TestApp()
+
+    await async_kivy_app(scroll_app)
+    root = async_kivy_app.app.root
+    path = [(100, 20 + 16 * i) for i in range(11)]
+
+    for moves_per_frame in (1, None):
+        root.scroll_y = 1
+        await async_kivy_app.wait_clock_frames(2)
+        await exhaust(async_kivy_app.do_touch_drag_path(
+            path, duration=.5, moves_per_frame=moves_per_frame))
+
+    # the effect sees the moves spread over the drag in both cases, so the
+    # fling velocity is about 160 / .5 pixels per second
+    single, burst = velocities
+    assert single > 0
+    assert isclose(single, burst, rel_tol=.3)
+
+
+def scatter_app():
+    from kivy.app import App
+    from kivy.uix.floatlayout import FloatLayout
+    from kivy.uix.scatter import Scatter
+
+    class TestApp(App):
+        def build(self):
+            root = FloatLayout()
+            root.add_widget(Scatter(
+                size_hint=(None, None), size=(200, 200), pos=(60, 20)))
+            return root
+
+    return TestApp()
+
+
+@pytest.mark.parametrize('moves_per_frame', [1, 5])
+async def test_multi_touch_pinch_rotate(async_kivy_app, moves_per_frame):
+    await async_kivy_app(scatter_app)
+    scatter = async_kivy_app.app.root.children[0]
+
+    states = []
+    async for state, positions in async_kivy_app.do_pinch(
+            widget=scatter, distance=100, end_distance=150, drag_n=10,
+            moves_per_frame=moves_per_frame):
+        states.append(state)
+        assert len(positions) == 2
+    assert states[0] == 'down' and states[-1] == 'up'
+    # all the touches moved in lockstep, one step (or burst) per frame
+    assert len(states) == 10 // moves_per_frame + 2
+    assert isclose(scatter.scale, 1.5, abs_tol=.01)
+    assert isclose(scatter.rotation, 0, abs_tol=.1)
+
+    await exhaust(async_kivy_app.do_rotate(
+        widget=scatter, angle=0, end_angle=30,
+        moves_per_frame=moves_per_frame))
+    assert isclose(scatter.scale, 1.5, abs_tol=.01)
+    assert isclose(scatter.rotation, 30, abs_tol=.1)
+
+
+async def test_multi_touch_swipe(async_kivy_app):
+    await async_kivy_app(scatter_app)
+    scatter = async_kivy_app.app.root.children[0]
+    x, y = scatter.pos
+
+    states = []
+    async for state, positions in async_kivy_app.do_multi_swipe(
+            widget=scatter, dx=30, dy=-10, n_fingers=3, drag_n=5):
+        states.append(state)
+        assert len(positions) == 3
+    assert states == ['down'] + ['move'] * 5 + ['up']
+
+    # three fingers moving together translate the scatter
+    assert isclose(scatter.x, x + 30, abs_tol=1)
+    assert isclose(scatter.y, y - 10, abs_tol=1)
+    assert isclose(scatter.scale, 1, abs_tol=.01)
+
+
 @pytest.mark.parametrize(
     'async_kivy_app', [{'kwargs': {'height': 200, 'width': 200}}],
     indirect=True)
@@ -242,3 +697,172 @@ async def test_touch_drag_follow(async_kivy_app):
         await async_kivy_app.wait_clock_frames(1)
 
     assert (int(x), int(y)) == (int(follow.center_x), int(follow.center_y))
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'virtual_time': True}}], indirect=True)
+async def test_virtual_time(async_kivy_app):
+    import time
+    from kivy.clock import Clock
+
+    def button_app():
+        from kivy.app import App
+        from kivy.uix.togglebutton import ToggleButton
+
+        class TestApp(App):
+            def build(self):
+                return ToggleButton(text='Hello, World!')
+
+        return TestApp()
+
+    await async_kivy_app(button_app)
+
+    fired = []
+    for delay in (3, 1, 2):
+        Clock.schedule_once(lambda dt, delay=delay: fired.append(delay), delay)
+
+    ts = time.perf_counter()
+    t0 = async_kivy_app.get_time()
+    await async_kivy_app.async_sleep(5)
+
+    assert async_kivy_app.get_time() - t0 >= 4.999
+    assert time.perf_counter() - ts < 5
+    assert fired == [1, 2, 3]
+
+    root = async_kivy_app.app.root
+    await exhaust(async_kivy_app.do_touch_down_up(widget=root, duration=10))
+    assert root.state == 'down'
+    assert time.perf_counter() - ts < 10
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'virtual_time': True}}, {}],
+    indirect=True)
+async def test_virtual_time_double_tap(async_kivy_app):
+    import time
+
+    def tap_app():
+        from kivy.app import App
+        from kivy.uix.widget import Widget
+
+        class TapWidget(Widget):
+            def on_touch_down(self, touch):
+                taps.append(touch.is_double_tap)
+
+        class TestApp(App):
+            def build(self):
+                return TapWidget()
+
+        return TestApp()
+
+    taps = []
+    await async_kivy_app(tap_app)
+    # away from the taps of other tests, which Kivy remembers
+    pos = 7, 233
+
+    await exhaust(async_kivy_app.do_touch_down_up(pos=pos, duration=.01))
+    await exhaust(async_kivy_app.do_touch_down_up(pos=pos, duration=.01))
+    assert taps == [False, True]
+
+    # Kivy times the touches with the same (virtual) time as the gestures
+    ts = time.time()
+    await async_kivy_app.async_sleep(1.)
+    await exhaust(async_kivy_app.do_touch_down_up(pos=pos, duration=.01))
+    assert taps == [False, True, False]
+    assert async_kivy_app.get_wall_time() - ts >= 1.
+
+
+async def test_virtual_time_enter_error(monkeypatch):
+    import kivy.effects.kinetic
+    import kivy.input.motionevent
+    from pytest_kivy.app import AsyncUnitApp
+    times = kivy.effects.kinetic.time, kivy.input.motionevent.time
+
+    def get_window_state(self):
+        raise StartupException
+
+    # fails at the end of __aenter__, with a new window
+    monkeypatch.setattr(AsyncUnitApp, 'get_window_state', get_window_state)
+    app = AsyncUnitApp(virtual_time=True, reuse_window='enter_error')
+    with pytest.raises(StartupException):
+        await app.__aenter__()
+    app._context.pop()
+    AsyncUnitApp._reused_window_key = None
+
+    # the virtual clock didn't leak into the following tests
+    assert app._virtual_clock is None
+    assert (kivy.effects.kinetic.time, kivy.input.motionevent.time) == times
+
+
+async def test_wait_clock_frames(async_kivy_app):
+    from kivy.clock import Clock
+    await async_kivy_app(create_text_app)
+
+    frames = Clock.frames
+    assert await async_kivy_app.wait_clock_frames(3) >= frames + 3
+    assert Clock.frames >= frames + 3
+
+    frames = Clock.frames
+    assert await async_kivy_app.wait_clock_frames(0) == frames
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'record_phase_times': True}}],
+    indirect=True)
+async def test_phase_times(async_kivy_app):
+    await async_kivy_app(create_text_app)
+    await async_kivy_app.async_sleep(.05)
+    await async_kivy_app.wait_clock_frames(2)
+
+    times = async_kivy_app.phase_times
+    assert set(times) == {'enter', 'start', 'sleep', 'frames'}
+    if not async_kivy_app.virtual_time:
+        # a virtual sleep only takes as long as executing the frames
+        assert times['sleep'] >= .04
+    assert all(value >= 0 for value in times.values())
+    assert not async_kivy_app._phase_stack
+
+
+async def test_phase_times_disabled(async_kivy_app):
+    await async_kivy_app(create_text_app)
+    await async_kivy_app.wait_clock_frames(2)
+
+    assert not async_kivy_app.record_phase_times
+    assert not async_kivy_app.phase_times
+    assert not async_kivy_app._phase_stack
+
+
+async def test_frame_budget(async_kivy_app):
+    await async_kivy_app(create_text_app)
+
+    with async_kivy_app.record_frames() as recorder:
+        await async_kivy_app.wait_clock_frames(10)
+        await exhaust(async_kivy_app.type_text('hello', chars_per_frame=2))
+    n = len(recorder.durations)
+    await async_kivy_app.wait_clock_frames(2)
+    assert len(recorder.durations) == n
+
+    stats = recorder.get_stats()
+    assert stats['frames'] == n >= 12
+    assert 0 < stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'] <= \
+        stats['max_ms']
+    assert stats['mean_ms'] <= stats['max_ms']
+
+    with async_kivy_app.frame_budget(max_ms=10000, p95_ms=10000):
+        await async_kivy_app.wait_clock_frames(5)
+
+    with pytest.raises(AssertionError, match='max_ms'):
+        with async_kivy_app.frame_budget(max_ms=0, target_fps=1e9):
+            await async_kivy_app.wait_clock_frames(5)
+
+
+@pytest.mark.kivy_frame_budget(p95_ms=10000, max_ms=10000)
+async def test_frame_budget_marker(async_kivy_app, request):
+    await async_kivy_app(create_text_app)
+    recorder, budget = request.node._kivy_frame_budget
+    # the frames until the app started are not included
+    assert not recorder.durations
+    assert budget == {'p95_ms': 10000, 'max_ms': 10000}
+
+    await async_kivy_app.wait_clock_frames(5)
+    assert len(recorder.durations) >= 4
@@ -0,0 +1,162 @@
+import sys
+import types
+from functools import partial
+
+import pytest
+
+
+class Leaked:
+    pass
+
+
+@pytest.fixture
+def leak_module():
+    module = types.ModuleType('leak_module')
+    sys.modules['leak_module'] = module
+    yield module
+    del sys.modules['leak_module']
+
+
+def test_referrer_chain_module(leak_module):
+    from pytest_kivy.memory import find_referrer_chain, format_referrer_chain
+    obj = Leaked()
+    leak_module.holder = {'items': [None, obj]}
+
+    chain, root, reason = find_referrer_chain(obj)
+    assert root == 'module leak_module'
+    assert reason is None
+    assert chain[0] is vars(leak_module)
+    assert chain[1] is leak_module.holder
+    assert chain[-1] is obj
+
+    text = format_referrer_chain(obj, chain, root, reason)
+    assert "['holder']" in text
+    assert "['items']" in text
+    assert '[1]' in text
+
+
+def test_referrer_chain_clock():
+    from kivy.clock import Clock
+    from pytest_kivy.memory import find_referrer_chain
+
+    def callback(obj, *largs):
+        pass
+
+    obj = Leaked()
+    event = Clock.schedule_once(partial(callback, obj), 10)
+    try:
+        chain, root, reason = find_referrer_chain(obj)
+        assert root.startswith('Kivy Clock event')
+        assert chain[0] is event
+        assert chain[-1] is obj
+    finally:
+        event.cancel()
+
+
+def test_referrer_chain_bounded(leak_module):
+    from pytest_kivy.memory import find_referrer_chain, format_referrer_chain
+    obj = Leaked()
+    leak_module.holder = [[[obj]]]
+
+    chain, root, reason = find_referrer_chain(obj, max_depth=2)
+    assert chain is None and root is None
+    assert 'depth' in reason
+    assert 'depth' in format_referrer_chain(obj, chain, root, reason)
+
+    chain, root, reason = find_referrer_chain(obj, max_objects=2)
+    assert chain is None
+    assert 'objects' in reason
+
+    # only referenced by the frames of the stack, which are ignored
+    chain, root, reason = find_referrer_chain(Leaked())
+    assert chain is None
+    assert reason == 'no more referrers'
+
+
+def test_referrer_chain_timeout():
+    import time
+    from pytest_kivy.memory import find_referrer_chain
+    obj = Leaked()
+    # a wide level of referrers takes seconds to search in full
+    holders = [[[obj]] for _ in range(20_000)]
+
+    ts = time.perf_counter()
+    chain, root, reason = find_referrer_chain(obj, timeout=.25)
+    assert time.perf_counter() - ts < .5
+    assert chain is None
+    assert 'timed out' in reason
+    del holders
+
+
+def test_compare_snapshots():
+    import tracemalloc
+    from pytest_kivy.memory import take_snapshot, compare_snapshots
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = take_snapshot()
+        items = [bytearray(1000) for _ in range(100)]
+        after = take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    growth = compare_snapshots(before, after, top=3)
+    assert growth['size'] >= 100 * 1000
+    assert len(growth['top']) <= 3
+    site = growth['top'][0]
+    assert site['site'].startswith(__file__)
+    assert site['size'] >= 100 * 1000
+    assert site['count'] >= 100
+    del items
+
+
+def test_census(monkeypatch):
+    from kivy.uix.label import Label
+    from kivy.clock import Clock, ClockBase
+    from kivy.cache import Cache
+    from pytest_kivy.memory import take_census, compare_census
+
+    def callback(*largs):
+        pass
+
+    # the first label imports the text provider, and the traceback of any
+    # failed optional import keeps it alive
+    Label(text='census')
+
+    before = take_census()
+    labels = [Label(text='census') for _ in range(3)]
+    diff = compare_census(before, take_census())
+    assert diff['Widget:Label'] == 3
+    assert diff['Instruction:Canvas'] >= 3
+    assert all(diff.values())
+
+    before = take_census()
+    event = Clock.schedule_once(callback, 10)
+    diff = compare_census(before, take_census())
+    event.cancel()
+    del event
+    assert diff == {'ClockEvent': 1}
+
+    del labels
+    assert compare_census(before, take_census())['Widget:Label'] == -3
+
+    # the events of any clock are counted, while they are alive
+    clock = ClockBase()
+    before = take_census()
+    event = clock.schedule_once(callback, 10)
+    assert compare_census(before, take_census()) == {'ClockEvent': 1}
+    event.cancel()
+    del event, clock
+    assert not compare_census(before, take_census())
+
+    # register the category in copies, so it's removed after the test
+    monkeypatch.setattr(Cache, '_categories', dict(Cache._categories))
+    monkeypatch.setattr(Cache, '_objects', dict(Cache._objects))
+    Cache.register('census_test')
+    Cache.append('census_test', 'key', object())
+    assert take_census()['Cache:census_test'] == 1
+    monkeypatch.delattr(Cache, '_objects')
+    assert not any(key.startswith('Cache:') for key in take_census())
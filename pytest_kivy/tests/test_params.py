@@ -57,3 +57,81 @@ async def test_app_cls(async_kivy_app):
     assert isinstance(async_kivy_app, CustomAsyncUnitApp)
     await async_kivy_app(button_app)
     await assert_app_working(async_kivy_app)
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'reuse_window': 'test_reuse'}}],
+    indirect=True)
+@pytest.mark.parametrize('repeat', [0, 1])
+async def test_app_reuse_window(async_kivy_app, repeat):
+    from kivy.core.window import Window
+    async_kivy_app.verify_window_state()
+
+    def leaked(*largs):
+        pass
+
+    Window.fbind('on_key_down', leaked)
+    with pytest.raises(AssertionError):
+        async_kivy_app.verify_window_state()
+    Window.funbind('on_key_down', leaked)
+    async_kivy_app.verify_window_state()
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [
+        {'kwargs': {'start_settle_frames': 0}},
+        {'kwargs': {'start_settle_frames': 'layout'}},
+        {'kwargs': {'start_timeout': None}},
+    ], indirect=True)
+async def test_app_start_settle(async_kivy_app):
+    await async_kivy_app(button_app)
+    assert async_kivy_app.app_has_started
+    await assert_app_working(async_kivy_app)
+
+
+@pytest.mark.parametrize(
+    'async_kivy_app', [
+        {'kwargs': {'fast_teardown': True}},
+        {'kwargs': {'stop_timeout': None}},
+    ], indirect=True)
+async def test_app_stop(async_kivy_app):
+    stops = []
+
+    def stop_counted_app():
+        app = button_app()
+        app.fbind('on_stop', lambda *largs: stops.append(largs))
+        return app
+
+    await async_kivy_app(stop_counted_app)
+    await assert_app_working(async_kivy_app)
+
+    await async_kivy_app.wait_stop_app()
+    if async_kivy_app.fast_teardown:
+        # the app was cancelled instead of waiting for it to stop
+        assert async_kivy_app._app_cancelled
+        assert not stops
+    else:
+        # stop was woken by the on_stop event
+        assert not async_kivy_app._app_cancelled
+        assert len(stops) == 1
+        assert async_kivy_app._stopped_event.is_set()
+
+
+async def test_get_unreleased_apps():
+    import weakref
+    from pytest_kivy.plugin import _get_unreleased_apps
+
+    class App:
+        pass
+
+    released = App()
+    cyclic = App()
+    cyclic.app = cyclic
+    alive = App()
+
+    apps = [
+        (weakref.ref(app), weakref.ref(app))
+        for app in (released, cyclic, alive)]
+    del released, cyclic
+    unreleased = _get_unreleased_apps(apps)
+    assert [app() for app, _ in unreleased] == [alive]
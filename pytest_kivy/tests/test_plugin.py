@@ -0,0 +1,553 @@
+import os
+import json
+from os.path import dirname, abspath, join, exists
+from textwrap import dedent
+from xml.etree import ElementTree
+
+import pytest
+
+pytest_plugins = 'pytester'
+
+_root = dirname(dirname(dirname(abspath(__file__))))
+
+
+@pytest.fixture
+def run_pytest(pytester, request, monkeypatch):
+    """Runs pytest in a subprocess, with the same kivy plugin and async
+    library settings as this session.
+    """
+    paths = [_root]
+    if os.environ.get('PYTHONPATH'):
+        paths.append(os.environ['PYTHONPATH'])
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(paths))
+
+    config = request.config
+    args = []
+    if not config.pluginmanager.has_plugin('kivy'):
+        args += ['-p', 'pytest_kivy.plugin']
+    for name in ('asyncio_mode', 'trio_mode'):
+        try:
+            value = config.getini(name)
+        except ValueError:
+            continue
+        args += ['-o', f'{name}={value}']
+
+    def run(*largs):
+        return pytester.runpytest_subprocess(*args, *largs)
+    return run
+
+
+_group_module = '''
+import pytest
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+reuse = pytest.mark.parametrize(
+    'async_kivy_app', [{{'kwargs': {{'reuse_window': 'shared'}}}}],
+    indirect=True)
+
+
+@reuse
+async def test_{0}_reused_1(async_kivy_app):
+    pass
+
+
+async def test_{0}_new(async_kivy_app):
+    pass
+
+
+async def test_{0}_no_app():
+    pass
+
+
+@reuse
+async def test_{0}_reused_2(async_kivy_app):
+    pass
+
+
+class TestGroup{0}:
+
+    async def test_new(self, async_kivy_app):
+        pass
+
+    @reuse
+    async def test_reused(self, async_kivy_app):
+        pass
+'''
+
+
+def test_group_params(run_pytest, pytester):
+    pytester.makepyfile(
+        test_a=_group_module.format('a'), test_b=_group_module.format('b'))
+
+    result = run_pytest('--kivy-group-params', '--collect-only', '-q')
+    names = [
+        line.split('[')[0] for line in result.stdout.lines if '::' in line]
+    # tests are only reordered within their module or class, and each group
+    # stays where its first test was
+    assert names == [
+        f'test_{name}.py::{test}' for name in 'ab' for test in (
+            f'test_{name}_reused_1', f'test_{name}_reused_2',
+            f'test_{name}_new', f'test_{name}_no_app',
+            f'TestGroup{name}::test_new', f'TestGroup{name}::test_reused')
+    ]
+
+    result = run_pytest('--kivy-group-params')
+    result.assert_outcomes(passed=12)
+
+
+def test_worker_kivy_home(run_pytest, pytester, tmp_path):
+    pytest.importorskip('xdist')
+    homes = tmp_path / 'homes'
+    pytester.makepyfile(test_home=dedent('''
+        import os
+        import pytest
+
+
+        @pytest.mark.parametrize('i', range(4))
+        def test_home(i):
+            import kivy
+            worker = os.environ['PYTEST_XDIST_WORKER']
+            assert os.environ['KIVY_HOME'] == os.path.join({!r}, worker)
+            with open(os.path.join(os.environ['KIVY_HOME'], 'seen'), 'a'):
+                pass
+        '''.format(str(homes))))
+
+    result = run_pytest(
+        '-p', 'xdist', '-n', '2', '--kivy-worker-home', str(homes))
+    result.assert_outcomes(passed=4)
+    for worker in ('gw0', 'gw1'):
+        assert exists(join(str(homes), worker, 'config.ini'))
+        assert exists(join(str(homes), worker, 'seen'))
+
+
+@pytest.mark.parametrize('state', [None, 'visible'])
+def test_worker_window_state(run_pytest, pytester, tmp_path, monkeypatch,
+                             state):
+    # the plugin only checks the variable to know it's in a xdist worker
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw3')
+    if state is None:
+        monkeypatch.delenv('KCFG_GRAPHICS_WINDOW_STATE', raising=False)
+    else:
+        monkeypatch.setenv('KCFG_GRAPHICS_WINDOW_STATE', state)
+    pytester.makepyfile(test_state=dedent('''
+        def test_state():
+            from kivy.config import Config
+            assert Config.get('graphics', 'window_state') == {!r}
+        '''.format(state or 'hidden')))
+
+    result = run_pytest('--kivy-worker-home', str(tmp_path / 'homes'))
+    result.assert_outcomes(passed=1)
+
+
+_timings_module = '''
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class TestApp(App):
+        def build(self):
+            return Widget()
+
+    return TestApp()
+
+
+async def test_timings(async_kivy_app):
+    await async_kivy_app(create_app)
+    await async_kivy_app.wait_clock_frames(2)
+    assert async_kivy_app.record_phase_times
+'''
+
+
+def test_timings(run_pytest, pytester, tmp_path):
+    pytester.makepyfile(test_timings=_timings_module)
+    filename = tmp_path / 'timings.json'
+
+    result = run_pytest(
+        '--kivy-timings', str(filename), '--kivy-timings-summary', '1')
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(['*kivy app phase timings*'])
+
+    with open(filename) as fh:
+        timings = json.load(fh)
+    times, = timings['tests'].values()
+    assert {'enter', 'start', 'frames', 'stop', 'exit'} <= set(times)
+
+
+_frame_budget_module = '''
+import time
+import pytest
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class TestApp(App):
+        def build(self):
+            return Widget()
+
+    return TestApp()
+
+
+async def run_slow_frame(app):
+    from kivy.clock import Clock
+    await app(create_app)
+    Clock.schedule_once(lambda dt: time.sleep(.1))
+    await app.wait_clock_frames(3)
+
+
+@pytest.mark.kivy_frame_budget(max_ms=50)
+async def test_over_budget(async_kivy_app):
+    await run_slow_frame(async_kivy_app)
+
+
+@pytest.mark.kivy_frame_budget(max_ms=10000, max_dropped=10)
+async def test_within_budget(async_kivy_app):
+    await run_slow_frame(async_kivy_app)
+'''
+
+
+def test_frame_budget_marker(run_pytest, pytester):
+    pytester.makepyfile(test_frame_budget=_frame_budget_module)
+
+    result = run_pytest()
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines([
+        '*_ test_over_budget _*',
+        'Frame budget exceeded: max_ms * > 50 (frames=*, dropped=*)'])
+
+
+_release_module = '''
+# a failed import of an optional input provider, when the window is first
+# imported, keeps the frames of the importing test alive
+import kivy.core.window  # noqa: F401
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+leaked = []
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class TestApp(App):
+        def build(self):
+            return Widget()
+
+    return TestApp()
+
+
+async def test_a(async_kivy_app):
+    await async_kivy_app(create_app)
+
+
+async def test_b(async_kivy_app):
+    await async_kivy_app(create_app)
+    {leak}
+
+
+async def test_c(async_kivy_app):
+    await async_kivy_app(create_app)
+'''
+
+
+@pytest.mark.parametrize('args', [
+    ['--kivy-app-release-module'],
+    ['--kivy-app-release'],
+    ['--kivy-app-release', '--kivy-app-release-every', '2'],
+    ['--kivy-app-release-end'],
+])
+def test_app_release(run_pytest, pytester, args):
+    pytester.makepyfile(test_release=_release_module.format(leak='pass'))
+    result = run_pytest(*args)
+    result.assert_outcomes(passed=3)
+
+
+@pytest.mark.parametrize('args,errors', [
+    (['--kivy-app-release-module'], 1),
+    (['--kivy-app-release'], 1),
+    # only the first and third tests are checked
+    (['--kivy-app-release', '--kivy-app-release-every', '2'], 0),
+    (['--kivy-app-release-end'], 1),
+])
+def test_app_release_leak(run_pytest, pytester, args, errors):
+    pytester.makepyfile(test_release=_release_module.format(
+        leak='leaked.append(async_kivy_app)'))
+    junit = pytester.path / 'junit.xml'
+    result = run_pytest(*args, f'--junitxml={junit}')
+    result.assert_outcomes(passed=3, errors=errors)
+    if errors:
+        result.stdout.fnmatch_lines(['*Memory leak: failed to release*'])
+
+    # the leak fails the test's own teardown, it's not reported separately
+    suite = ElementTree.parse(str(junit)).find('testsuite')
+    assert suite.get('tests') == '3'
+    assert suite.get('errors') == str(errors)
+
+
+_census_module = '''
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+leaked = []
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class TestApp(App):
+        def build(self):
+            return Widget()
+
+    return TestApp()
+
+
+def test_import_input():
+    # Kivy logs the input providers it can't load with their traceback, which
+    # keeps the app that first imports them alive along with the log record
+    import kivy.input  # noqa: F401
+
+
+async def test_baseline(async_kivy_app):
+    await async_kivy_app(create_app)
+
+
+async def test_leak(async_kivy_app):
+    from kivy.uix.widget import Widget
+    from kivy.clock import Clock
+    await async_kivy_app(create_app)
+    leaked.extend(Widget() for _ in range(3))
+    # an event of the test's clock that outlives the test
+    leaked.append(Clock.schedule_once(lambda dt: None, 1000))
+'''
+
+
+def test_census(run_pytest, pytester):
+    pytester.makepyfile(test_census=_census_module)
+
+    result = run_pytest('--kivy-census')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines([
+        '*kivy objects accumulated over the session*',
+        '*+3 Widget:Widget (most by test_census.py::test_leak: +3)*',
+    ])
+    # the events are counted across the clocks of the tests
+    result.stdout.fnmatch_lines(
+        ['*+1 ClockEvent (most by test_census.py::test_leak: +1)*'])
+
+
+_census_trees_module = '''
+from functools import partial
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+
+def create_app(n):
+    from kivy.app import App
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.button import Button
+
+    class TestApp(App):
+        def build(self):
+            root = BoxLayout()
+            for _ in range(n):
+                root.add_widget(Button())
+            return root
+
+    return TestApp()
+
+
+def test_import_input():
+    # Kivy logs the input providers it can't load with their traceback, which
+    # keeps the app that first imports them alive along with the log record
+    import kivy.input  # noqa: F401
+
+
+async def test_baseline(async_kivy_app):
+    await async_kivy_app(partial(create_app, 1))
+
+
+async def test_many(async_kivy_app):
+    await async_kivy_app(partial(create_app, 20))
+
+
+async def test_few(async_kivy_app):
+    await async_kivy_app(partial(create_app, 1))
+'''
+
+
+def test_census_released_app(run_pytest, pytester):
+    # the widgets of each test are released before its census is taken, so
+    # they are not counted against the next test
+    from xml.etree import ElementTree
+    pytester.makepyfile(test_census_trees=_census_trees_module)
+
+    result = run_pytest('--kivy-census', '--junitxml=report.xml')
+    result.assert_outcomes(passed=4)
+
+    root = ElementTree.parse(str(pytester.path / 'report.xml')).getroot()
+    deltas = {}
+    for case in root.iter('testcase'):
+        for prop in case.iter('property'):
+            if prop.get('name') == 'kivy_census':
+                deltas[case.get('name')] = prop.get('value')
+    # the first test is the baseline
+    assert deltas == {'test_few': '{}', 'test_many': '{}'}
+
+
+_memtrace_module = '''
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class TestApp(App):
+        def build(self):
+            return Widget()
+
+    return TestApp()
+
+
+def test_import_input():
+    # Kivy logs the input providers it can't load with their traceback, which
+    # keeps the app that first imports them alive along with the log record
+    import kivy.input  # noqa: F401
+
+
+async def test_baseline(async_kivy_app):
+    await async_kivy_app(create_app)
+
+
+async def test_no_leak(async_kivy_app):
+    await async_kivy_app(create_app)
+
+
+async def test_no_leak_again(async_kivy_app):
+    await async_kivy_app(create_app)
+'''
+
+
+def test_memtrace_released_app(run_pytest, pytester, tmp_path):
+    # the app of each test is released before the memory is measured, so an
+    # app that doesn't leak doesn't grow
+    import json
+    pytester.makepyfile(test_memtrace=_memtrace_module)
+    filename = tmp_path / 'memtrace.jsonl'
+
+    result = run_pytest(
+        f'--kivy-memtrace={filename}', '--kivy-memtrace-threshold=16')
+    result.assert_outcomes(passed=4)
+
+    with open(filename, encoding='utf8') as fh:
+        growths = [json.loads(line) for line in fh]
+    # the first test is the baseline, as it e.g. creates the window
+    assert [growth['test'] for growth in growths[1:]] == [
+        'test_memtrace.py::test_no_leak',
+        'test_memtrace.py::test_no_leak_again']
+    for growth in growths[1:]:
+        assert not growth['flagged']
+        # only the app class created by the test remains
+        assert not [
+            top for top in growth['top'] if '/kivy/' in top['site']]
+
+
+_reuse_module = '''
+import pytest
+from pytest_kivy.app import AsyncUnitApp
+from pytest_kivy.tests import get_pytest_async_mark
+
+pytestmark = get_pytest_async_mark()
+
+creations = []
+
+
+@pytest.fixture
+def window_creations(monkeypatch):
+    # must be requested before the app fixture, to see the window created
+    from kivy.core.window import Window
+    create_window = Window.create_window
+
+    def counted_create_window(*largs):
+        creations.append(largs)
+        return create_window(*largs)
+
+    monkeypatch.setattr(Window, 'create_window', counted_create_window)
+    return creations
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.uix.button import Button
+
+    class TestApp(App):
+        def build(self):
+            return Button()
+
+    return TestApp()
+
+
+reuse = pytest.mark.parametrize(
+    'async_kivy_app', [{'kwargs': {'reuse_window': 'shared'}}],
+    indirect=True)
+
+
+async def check_window(async_kivy_app, n_creations):
+    from kivy.core.window import Window
+    # the window was reset to its state from when it was created
+    assert async_kivy_app.get_window_state() == \\
+        AsyncUnitApp._reused_window_state
+    assert tuple(Window.size) == (
+        async_kivy_app.width, async_kivy_app.height)
+    assert not Window.children
+    assert len(creations) == n_creations
+
+    await async_kivy_app(create_app)
+    assert async_kivy_app.app.root in Window.children
+    # the next test should get its size back
+    Window.size = 200, 100
+
+
+@reuse
+async def test_first(window_creations, async_kivy_app):
+    await check_window(async_kivy_app, 1)
+
+
+@reuse
+async def test_reused(window_creations, async_kivy_app):
+    await check_window(async_kivy_app, 1)
+
+
+async def test_new(window_creations, async_kivy_app):
+    assert len(creations) == 2
+
+
+@reuse
+async def test_recreated(window_creations, async_kivy_app):
+    await check_window(async_kivy_app, 3)
+'''
+
+
+def test_reuse_window(run_pytest, pytester):
+    pytester.makepyfile(test_reuse=_reuse_module)
+    # a test without the key in between creates a new window again
+    result = run_pytest()
+    result.assert_outcomes(passed=4)
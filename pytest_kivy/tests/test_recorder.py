@@ -0,0 +1,228 @@
+import pytest
+import io
+import json
+from functools import partial
+
+from pytest_kivy.tests import get_pytest_async_mark
+from pytest_kivy.tools import exhaust
+
+pytestmark = get_pytest_async_mark()
+
+
+def create_app(events):
+    from kivy.app import App
+    from kivy.uix.widget import Widget
+
+    class MyWidget(Widget):
+        def on_touch_down(self, touch):
+            events.append(('down', round(touch.x, 3), round(touch.y, 3)))
+            return super().on_touch_down(touch)
+
+        def on_touch_move(self, touch):
+            events.append(('move', round(touch.x, 3), round(touch.y, 3)))
+            return super().on_touch_move(touch)
+
+        def on_touch_up(self, touch):
+            events.append(('up', round(touch.x, 3), round(touch.y, 3)))
+            return super().on_touch_up(touch)
+
+    class TestApp(App):
+        def build(self):
+            from kivy.core.window import Window
+            Window.fbind('on_key_down', self.on_key_down)
+            Window.fbind('on_key_up', self.on_key_up)
+            Window.fbind('on_textinput', self.on_textinput)
+            return MyWidget()
+
+        def on_stop(self):
+            from kivy.core.window import Window
+            Window.funbind('on_key_down', self.on_key_down)
+            Window.funbind('on_key_up', self.on_key_up)
+            Window.funbind('on_textinput', self.on_textinput)
+
+        def on_key_down(self, window, key, scancode, codepoint, modifiers):
+            events.append(('key_down', key, codepoint, list(modifiers)))
+
+        def on_key_up(self, window, key, *largs):
+            events.append(('key_up', key))
+
+        def on_textinput(self, window, text):
+            events.append(('textinput', text))
+
+    return TestApp()
+
+
+async def record_session(app, output):
+    from pytest_kivy.recorder import InputRecorder
+
+    with InputRecorder(output, time_func=app.get_time):
+        await exhaust(app.do_touch_drag(pos=(20, 30), dx=100, dy=50))
+        await exhaust(app.do_keyboard_key('a'))
+        await exhaust(app.do_pinch(pos=(100, 100), drag_n=3))
+
+
+async def test_record_replay(async_kivy_app):
+    events = []
+    await async_kivy_app(partial(create_app, events))
+
+    output = io.StringIO()
+    await record_session(async_kivy_app, output)
+    recorded = events[:]
+    del events[:]
+
+    lines = output.getvalue().splitlines()
+    assert json.loads(lines[0])['window'] == [320, 240]
+    items = [json.loads(line) for line in lines[1:]]
+    assert [item['t'] for item in items] == sorted(
+        item['t'] for item in items)
+    # two touches for the pinch
+    assert {item['id'] for item in items if item['e'] == 'touch'} == \
+        {0, 1, 2}
+
+    n = 0
+    async for state, group in async_kivy_app.do_replay_input(
+            io.StringIO(output.getvalue()), speed=None):
+        assert state == 'events'
+        n += len(group)
+    assert n == len(items)
+    assert events == recorded
+
+
+@pytest.mark.parametrize('close_early', [False, True])
+async def test_replay_ends_touches(async_kivy_app, close_early):
+    from kivy.base import EventLoop
+    events = []
+    await async_kivy_app(partial(create_app, events))
+
+    output = io.StringIO()
+    await record_session(async_kivy_app, output)
+    del events[:]
+
+    # truncate the recording in the middle of the first drag
+    lines = output.getvalue().splitlines()
+    end = next(
+        i for i, line in enumerate(lines)
+        if json.loads(line).get('etype') == 'end')
+    source = io.StringIO('\n'.join(lines[:end]))
+
+    # the touches of other tests may remain
+    active = list(EventLoop.me_list)
+    replay = async_kivy_app.do_replay_input(source, speed=None)
+    if close_early:
+        await replay.__anext__()
+        await replay.__anext__()
+        await replay.aclose()
+    else:
+        await exhaust(replay)
+
+    assert events[0][0] == 'down'
+    assert events[-1][0] == 'up'
+    assert [kind for kind, *_ in events].count('up') == 1
+    assert EventLoop.me_list == active
+
+
+async def test_replay_file(async_kivy_app, tmp_path):
+    from kivy.core.window import Window
+    events = []
+    await async_kivy_app(partial(create_app, events))
+
+    filename = str(tmp_path / 'session.ndjson')
+    await record_session(async_kivy_app, filename)
+    recorded = events[:]
+    del events[:]
+
+    ts = async_kivy_app.get_time()
+    await exhaust(async_kivy_app.do_replay_input(filename, speed=2))
+    assert events == recorded
+    assert async_kivy_app.get_time() - ts > 0
+
+    # a recording of the wrong version is rejected
+    with open(filename, 'w') as fh:
+        fh.write('{"version": 0, "window": [320, 240]}\n')
+    with pytest.raises(ValueError):
+        await exhaust(async_kivy_app.do_replay_input(filename))
+
+    assert not Window.get_property_observers('on_motion') or all(
+        'InputRecorder' not in repr(observer)
+        for observer in Window.get_property_observers('on_motion'))
+
+
+async def test_replay_touch_times(async_kivy_app):
+    from pytest_kivy.recorder import InputRecorder
+    times = []
+
+    def add_time(touch):
+        times.append((touch.time_update, async_kivy_app.get_wall_time()))
+
+    def timed_app():
+        from kivy.app import App
+        from kivy.uix.widget import Widget
+
+        class TimedWidget(Widget):
+            def on_touch_down(self, touch):
+                add_time(touch)
+
+            def on_touch_move(self, touch):
+                add_time(touch)
+
+            def on_touch_up(self, touch):
+                add_time(touch)
+
+        class TestApp(App):
+            def build(self):
+                return TimedWidget()
+
+        return TestApp()
+
+    await async_kivy_app(timed_app)
+
+    output = io.StringIO()
+    with InputRecorder(output, time_func=async_kivy_app.get_time):
+        await exhaust(async_kivy_app.do_touch_drag(
+            pos=(20, 30), dx=100, dy=50, duration=.5))
+    del times[:]
+
+    # replayed faster than recorded, the touches don't run ahead of the clock
+    await exhaust(async_kivy_app.do_replay_input(
+        io.StringIO(output.getvalue()), speed=None))
+    assert len(times) >= 3
+    assert [ts for ts, _ in times] == sorted(ts for ts, _ in times)
+    assert all(ts <= now for ts, now in times)
+
+
+async def test_replay_double_tap(async_kivy_app):
+    from pytest_kivy.recorder import InputRecorder
+    taps = []
+
+    def tap_app():
+        from kivy.app import App
+        from kivy.uix.widget import Widget
+
+        class TapWidget(Widget):
+            def on_touch_down(self, touch):
+                taps.append((touch.is_double_tap, touch.is_triple_tap))
+
+        class TestApp(App):
+            def build(self):
+                return TapWidget()
+
+        return TestApp()
+
+    await async_kivy_app(tap_app)
+    # away from the taps of other tests, which Kivy remembers
+    pos = 13, 227
+
+    output = io.StringIO()
+    with InputRecorder(output, time_func=async_kivy_app.get_time):
+        for _ in range(3):
+            await exhaust(
+                async_kivy_app.do_touch_down_up(pos=pos, duration=.01))
+    recorded = taps[:]
+    del taps[:]
+    assert recorded == [(False, False), (True, False), (False, True)]
+
+    # so the replayed taps are not taps of the recorded ones
+    await async_kivy_app.async_sleep(1.)
+    await exhaust(async_kivy_app.do_replay_input(
+        io.StringIO(output.getvalue()), speed=None))
+    assert taps == recorded
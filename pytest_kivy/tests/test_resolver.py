@@ -136,3 +136,278 @@ async def test_resolve_down_func_and_name(async_kivy_app):
     matched = async_kivy_app.resolve_widget().down(
         lambda w: w.__class__.__name__ == 'Button', text='hello')()
     assert matched is ids['button'].__self__
+
+
+async def test_resolve_index(async_kivy_app):
+    await async_kivy_app(create_kv_app)
+    ids = async_kivy_app.app.root.ids
+    names = ['a1', 'a11', 'widget', 'a2', 'a21']
+    index = async_kivy_app.get_widget_index(keys=('text', 'name'))
+    assert async_kivy_app.get_widget_index() is index
+
+    for name in names:
+        matched = async_kivy_app.resolve_widget(use_index=True).down(
+            name=name)()
+        assert matched is ids[name].__self__
+
+    for base_name in names:
+        bottom = async_kivy_app.resolve_widget().down(name=base_name)()
+        for find_name in names:
+            matched = async_kivy_app.resolve_widget(
+                bottom, use_index=True).family_up(name=find_name)()
+            assert matched is ids[find_name].__self__
+
+    matched = async_kivy_app.resolve_widget(use_index=True).down(
+        lambda w: w.__class__.__name__ == 'Button', text='hello')()
+    assert matched is ids['button'].__self__
+
+    assert index.lookup('id', 'button') == [ids['button'].__self__]
+    assert index.lookup('cls', 'Button') == [ids['button'].__self__]
+    # a Button is also a Label
+    assert set(index.lookup('cls', 'Label')) == {
+        ids['label'].__self__, ids['button'].__self__}
+
+    # changes to the tree and properties are tracked
+    button = ids['button'].__self__
+    button.text = 'changed'
+    assert index.lookup('text', 'changed') == [button]
+    matched = async_kivy_app.resolve_widget(use_index=True).down(
+        text='hello')()
+    assert matched is ids['label'].__self__
+
+    button.parent.remove_widget(button)
+    assert not index.lookup('text', 'changed')
+    with pytest.raises(ResolverNotFound):
+        async_kivy_app.resolve_widget(use_index=True).down(text='changed')
+
+    ids['a11'].add_widget(button)
+    matched = async_kivy_app.resolve_widget(use_index=True).down(
+        text='changed')()
+    assert matched is button
+
+
+async def test_resolve_index_selector_class(async_kivy_app, monkeypatch):
+    from pytest_kivy.resolver import WidgetIndex
+    await async_kivy_app(create_kv_app)
+    ids = async_kivy_app.app.root.ids
+    async_kivy_app.get_widget_index()
+
+    lookups = []
+    lookup = WidgetIndex.lookup
+
+    def record_lookup(self, key, value):
+        lookups.append((key, value))
+        return lookup(self, key, value)
+    monkeypatch.setattr(WidgetIndex, 'lookup', record_lookup)
+
+    def down(selector):
+        return async_kivy_app.resolve_widget(use_index=True).down(
+            selector)()
+
+    assert down('Button') is ids['button'].__self__
+    assert lookups == [('cls', 'Button')]
+    # the candidates of the base class are still filtered in order
+    assert down('#a2 > Label') is ids['button'].__self__
+    assert down("Label[text='hello']:enabled") is ids['button'].__self__
+    assert ('cls', 'Label') in lookups
+
+
+async def test_resolve_index_untracked(async_kivy_app):
+    from kivy.uix.widget import Widget
+    await async_kivy_app(create_kv_app)
+    root = async_kivy_app.app.root
+    ids = root.ids
+    index = async_kivy_app.get_widget_index(keys=('text', 'name', 'tag'))
+
+    def down(**kwargs):
+        return async_kivy_app.resolve_widget(use_index=True).down(
+            **kwargs)()
+
+    # plain attributes can change without notice, so the tree is walked
+    widget = Widget()
+    widget.tag = 'old'
+    ids['a22'].add_widget(widget)
+    assert index.lookup('tag', 'old') == [widget]
+    assert not index.is_indexed('tag', 'new')
+    widget.tag = 'new'
+    assert down(tag='new') is widget
+    # until no widget has it as a plain attribute
+    ids['a22'].remove_widget(widget)
+    assert index.is_indexed('tag', 'new')
+
+    # the ids are tracked
+    label = ids['label'].__self__
+    root.ids = {'renamed': label}
+    assert index.lookup('id', 'renamed') == [label]
+    assert not index.lookup('id', 'label')
+
+    # attributes created after the widget was added are not seen
+    ids['a21'].tag = 'late'
+    with pytest.raises(ResolverNotFound):
+        down(tag='late')
+    matched = async_kivy_app.resolve_widget().down(tag='late')()
+    assert matched is ids['a21'].__self__
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+async def test_resolve_selector(async_kivy_app, use_index):
+    await async_kivy_app(create_kv_app)
+    ids = async_kivy_app.app.root.ids
+
+    def down(selector):
+        return async_kivy_app.resolve_widget(use_index=use_index).down(
+            selector)()
+
+    assert down("Button[text='hello']") is ids['button'].__self__
+    # a Button is also a Label
+    assert down("Label[text='hello']") is ids['button'].__self__
+    assert down("Widget[name='widget']") is ids['widget'].__self__
+    assert down("#a12 > Widget") is ids['widget'].__self__
+    assert down("#a1 Widget[name='widget']") is ids['widget'].__self__
+    # children are in reverse order of addition
+    assert down("#a2 > BoxLayout") is ids['a22'].__self__
+    assert down("#a2 > BoxLayout:visible") is ids['a22'].__self__
+    assert down("#a21") is ids['a21'].__self__
+    assert down("BoxLayout > #a2 > Button:enabled") is ids['button'].__self__
+
+    with pytest.raises(ResolverNotFound):
+        down("#a1 > Widget[name='widget']")
+    with pytest.raises(ResolverNotFound):
+        down("#a1 Button")
+    with pytest.raises(ResolverNotFound):
+        down("Button:disabled")
+
+    ids['a2'].opacity = 0
+    with pytest.raises(ResolverNotFound):
+        down("#a2 > BoxLayout:visible")
+
+    root = async_kivy_app.app.root
+    matched = async_kivy_app.resolve_widget(root).down(
+        "> BoxLayout > BoxLayout", name='a21')()
+    assert matched is ids['a21'].__self__
+    with pytest.raises(ResolverNotFound):
+        async_kivy_app.resolve_widget(root).down("> Button")
+
+    bottom = ids['widget'].__self__
+    matched = async_kivy_app.resolve_widget(bottom).up("BoxLayout #a1")()
+    assert matched is ids['a1'].__self__
+    matched = async_kivy_app.resolve_widget(bottom).family_up(
+        "#a2 Button")()
+    assert matched is ids['button'].__self__
+
+
+async def test_selector_class_released():
+    import gc
+    import weakref
+    from pytest_kivy.selector import compile_selector
+
+    # Kivy itself keeps the classes of widgets and event dispatchers alive
+    class BaseNode:
+        pass
+
+    class TestNode(BaseNode):
+        pass
+
+    node = TestNode()
+    assert compile_selector('BaseNode').matches(node)
+    assert compile_selector('TestNode').matches(node)
+
+    ref = weakref.ref(TestNode)
+    del node, TestNode
+    gc.collect()
+    assert ref() is None
+
+
+async def test_compile_selector():
+    from pytest_kivy.selector import compile_selector, SelectorSyntaxError
+    assert compile_selector("A > B") is compile_selector("A > B")
+    assert compile_selector("> A B[x=1]:visible").anchored
+
+    for selector in ('', 'A >', 'A B > > C', 'A:unknown', 'A[x]', '#a B#'):
+        with pytest.raises(SelectorSyntaxError):
+            compile_selector(selector)
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+async def test_resolve_all(async_kivy_app, use_index):
+    await async_kivy_app(create_kv_app)
+    ids = async_kivy_app.app.root.ids
+    root = async_kivy_app.app.root
+
+    def resolve(widget=None):
+        return async_kivy_app.resolve_widget(widget, use_index=use_index)
+
+    matched = [r() for r in resolve().down_all(text='hello')]
+    assert matched == [ids['button'].__self__, ids['label'].__self__]
+    matched = [r() for r in resolve().down_all(text='hello', limit=1)]
+    assert matched == [ids['button'].__self__]
+
+    names = [r().name for r in resolve(root).down_all("BoxLayout[name!='']")]
+    assert names == ['a2', 'a1', 'a21', 'a11']
+    names = [
+        r().name for r in resolve(root).down_all(
+            "BoxLayout[name!='']", max_depth=1)]
+    assert names == ['a2', 'a1']
+    assert not list(resolve(root).down_all(text='hello', max_depth=1))
+    assert not list(resolve().down_all(text='something'))
+
+    bottom = ids['widget'].__self__
+    matched = [r() for r in resolve(bottom).up_all('BoxLayout')]
+    assert matched == [ids['a12'].__self__, ids['a1'].__self__, root]
+    matched = [
+        r() for r in resolve(bottom).up_all('BoxLayout', max_levels=1)]
+    assert matched == [ids['a12'].__self__]
+
+    matched = [r() for r in resolve(bottom).family_up_all(text='hello')]
+    assert matched == [ids['button'].__self__, ids['label'].__self__]
+    assert not list(
+        resolve(bottom).family_up_all(text='hello', max_levels=2))
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+async def test_resolve_down_many(async_kivy_app, monkeypatch, use_index):
+    from kivy.core.window import Window
+    from pytest_kivy.resolver import WidgetResolver
+    await async_kivy_app(create_kv_app)
+    ids = async_kivy_app.app.root.ids
+    if use_index:
+        async_kivy_app.get_widget_index(keys=('text', ))
+
+    walked = []
+    check_widget = WidgetResolver.check_widget
+
+    def record_check(self, widget, scope=None):
+        if widget is Window:
+            walked.append(self._kwargs_filter)
+        return check_widget(self, widget, scope)
+    monkeypatch.setattr(WidgetResolver, 'check_widget', record_check)
+
+    widgets = async_kivy_app.resolve_widget(use_index=use_index).down_many({
+        'label': [
+            {'text': 'hello'}, 'Label',
+            lambda w: w.__class__.__name__ == 'Label'],
+        'a21': {'name': 'a21'},
+        'button': "Button[text='hello']",
+        'any_label': 'Label',
+    })
+    assert list(widgets) == ['label', 'a21', 'button', 'any_label']
+    assert widgets['label']() is ids['label'].__self__
+    assert widgets['a21']() is ids['a21'].__self__
+    assert widgets['button']() is ids['button'].__self__
+    # with the index, only the query of an unindexed key walks the tree
+    if use_index:
+        assert walked == [{'name': 'a21'}]
+    else:
+        assert len(walked) == 4
+    assert widgets['any_label']() is \
+        async_kivy_app.resolve_widget().down('Label')()
+
+    with pytest.raises(ResolverNotFound) as exc_info:
+        async_kivy_app.resolve_widget(use_index=use_index).down_many({
+            'a21': {'name': 'a21'},
+            'missing': {'name': 'missing'},
+            'deep': {'name': 'a21'},
+        }, max_depth=1)
+    message = str(exc_info.value)
+    assert 'missing' in message and 'deep' in message
+    assert "'a21'" in message
@@ -0,0 +1,162 @@
+import pytest
+import zlib
+import struct
+from os.path import exists, join
+
+from pytest_kivy.tests import get_pytest_async_mark
+
+np = pytest.importorskip('numpy')
+
+
+def _paeth(left, up, up_left):
+    p = left + up - up_left
+    pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+    if pa <= pb and pa <= pc:
+        return left
+    if pb <= pc:
+        return up
+    return up_left
+
+
+def write_filtered_png(filename, pixels, kinds):
+    from pytest_kivy.snapshot import _png_chunk, _png_signature
+    height, width, channels = pixels.shape
+    color = {3: 2, 4: 6}[channels]
+
+    data = b''
+    prev = [0] * (width * channels)
+    for row, kind in zip(pixels.tolist(), kinds):
+        line = [value for pixel in row for value in pixel]
+        filtered = []
+        for i, value in enumerate(line):
+            left = line[i - channels] if i >= channels else 0
+            up_left = prev[i - channels] if i >= channels else 0
+            pred = [
+                0, left, prev[i], (left + prev[i]) // 2,
+                _paeth(left, prev[i], up_left)][kind]
+            filtered.append((value - pred) & 0xff)
+        data += bytes([kind] + filtered)
+        prev = line
+
+    header = struct.pack('>IIBBBBB', width, height, 8, color, 0, 0, 0)
+    with open(filename, 'wb') as fh:
+        fh.write(_png_signature)
+        fh.write(_png_chunk(b'IHDR', header))
+        fh.write(_png_chunk(b'IDAT', zlib.compress(data)))
+        fh.write(_png_chunk(b'IEND', b''))
+
+
+def test_png_round_trip(tmp_path):
+    from pytest_kivy.snapshot import write_png, read_png, load_baseline
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(7, 5, 4), dtype=np.uint8)
+
+    filename = str(tmp_path / 'image.png')
+    write_png(filename, image)
+    assert (read_png(filename) == image).all()
+
+    baseline = load_baseline(filename)
+    assert (baseline == image).all()
+    assert load_baseline(filename) is baseline
+
+
+@pytest.mark.parametrize('channels', [3, 4])
+def test_png_read_filters(tmp_path, channels):
+    from pytest_kivy.snapshot import read_png
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, size=(10, 6, channels), dtype=np.uint8)
+
+    filename = str(tmp_path / 'image.png')
+    write_filtered_png(filename, pixels, [0, 1, 2, 3, 4] * 2)
+    image = read_png(filename)
+
+    # files are stored top row first
+    pixels = pixels[::-1]
+    assert (image[:, :, :channels] == pixels).all()
+    if channels == 3:
+        assert (image[:, :, 3] == 255).all()
+
+
+def test_compare_images():
+    from pytest_kivy.snapshot import compare_images
+    baseline = np.zeros((4, 6, 4), dtype=np.uint8)
+    image = baseline.copy()
+    image[1, 2] = 10, 0, 0, 0
+    image[3, 5] = 0, 0, 0, 30
+
+    assert compare_images(image, baseline).sum() == 2
+    assert compare_images(image, baseline, tolerance=10).sum() == 1
+    assert not compare_images(image, baseline, tolerance=(10, 0, 0, 30)).any()
+    assert compare_images(image, baseline, masks=[(2, 1, 1, 1)]).sum() == 1
+    assert not compare_images(
+        image, baseline, masks=[(0, 0, 6, 2), (5, 3, 5, 5)]).any()
+
+
+def test_compare_images_off_image_mask():
+    from pytest_kivy.snapshot import compare_images
+    baseline = np.zeros((4, 6, 4), dtype=np.uint8)
+    image = baseline + 10
+
+    # only the part of the mask that is in the image is ignored
+    mismatched = compare_images(image, baseline, masks=[(-2, -1, 3, 2)])
+    assert not mismatched[0, 0]
+    assert mismatched.sum() == 4 * 6 - 1
+    # masks that end before the image don't ignore anything
+    assert compare_images(
+        image, baseline, masks=[(-5, 0, 3, 4), (0, -5, 6, 3)]).all()
+
+
+def create_app():
+    from kivy.app import App
+    from kivy.lang import Builder
+    from textwrap import dedent
+
+    kv = """
+    Widget:
+        color: 1, 0, 0, 1
+        canvas:
+            Color:
+                rgba: self.color
+            Rectangle:
+                pos: 0, 0
+                size: self.width / 2, self.height / 2
+    """
+
+    class TestApp(App):
+        def build(self):
+            return Builder.load_string(dedent(kv))
+
+    return TestApp()
+
+
+@get_pytest_async_mark()
+async def test_snapshot(async_kivy_app, tmp_path):
+    await async_kivy_app(create_app)
+    root = async_kivy_app.app.root
+    w, h = int(root.width), int(root.height)
+    async_kivy_app.snapshot_dir = str(tmp_path)
+
+    with pytest.raises(AssertionError, match='does not exist'):
+        async_kivy_app.assert_snapshot('root', root)
+
+    async_kivy_app.snapshot_update = True
+    async_kivy_app.assert_snapshot('root', root)
+    async_kivy_app.assert_snapshot('window')
+    async_kivy_app.snapshot_update = False
+    assert exists(join(str(tmp_path), 'root.png'))
+
+    async_kivy_app.assert_snapshot('root', root)
+    async_kivy_app.assert_snapshot('window')
+
+    root.color = 1, 0.02, 0, 1
+    await async_kivy_app.wait_clock_frames(2)
+
+    with pytest.raises(AssertionError, match='do not match'):
+        async_kivy_app.assert_snapshot('root', root)
+    assert exists(join(str(tmp_path), 'failures', 'root-actual.png'))
+    assert exists(join(str(tmp_path), 'failures', 'root-diff.png'))
+
+    async_kivy_app.assert_snapshot('root', root, tolerance=(0, 5, 0, 0))
+    async_kivy_app.assert_snapshot('root', root, masks=[(0, 0, w, h)])
+    async_kivy_app.assert_snapshot(
+        'root', root, max_mismatch=(w // 2) * (h // 2))